@@ -0,0 +1,130 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from recipes.counters import COUNTERS
+from users.models import User
+
+# Счётчики меняются F()-запросами; у закэшированного пользователя они
+# отложены, чтобы user.save() не записал устаревшие значения.
+DEFERRED_FIELDS = tuple(
+    field for source, target, link, field in COUNTERS if target is User)
+# Бэкенды без общего для воркеров хранилища.
+PROCESS_CACHES = (LocMemCache, DummyCache)
+
+
+class TokenUserCache:
+    """
+    Пользователь по ключу токена: LRU с TTL внутри процесса перед
+    необязательным общим кэшем Django. Записи хранятся сериализованными,
+    каждый запрос получает собственную копию пользователя.
+
+    Сброс (выход, смена пароля) сразу виден в своём процессе и в общем
+    кэше, а в других процессах - не позже LOCAL_TIMEOUT секунд, когда
+    истекает их запись в LRU. Кэш внутри процесса (LocMemCache) общим
+    не считается: сброс до него из других воркеров не доходит, и токен
+    жил бы там весь TIMEOUT.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        alias = settings.AUTH_TOKEN_CACHE['ALIAS']
+        if not alias:
+            return None
+        backend = caches[alias]
+        if isinstance(backend, PROCESS_CACHES):
+            return None
+        return backend
+
+    @staticmethod
+    def _cache_key(key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f'auth:token:{digest}'
+
+    def get(self, key):
+        cache_key = self._cache_key(key)
+        with self._lock:
+            entry = self._local.get(cache_key)
+            if entry is not None:
+                data, expires = entry
+                if expires > time.monotonic():
+                    self._local.move_to_end(cache_key)
+                    return pickle.loads(data)
+                del self._local[cache_key]
+        if self.backend is None:
+            return None
+        data = self.backend.get(cache_key)
+        if data is None:
+            return None
+        self._local_store(cache_key, data)
+        return pickle.loads(data)
+
+    def set(self, key, user):
+        cache_key = self._cache_key(key)
+        data = pickle.dumps(user, pickle.HIGHEST_PROTOCOL)
+        self._local_store(cache_key, data)
+        if self.backend is not None:
+            self.backend.set(
+                cache_key, data, settings.AUTH_TOKEN_CACHE['TIMEOUT'])
+
+    def _local_store(self, cache_key, data):
+        expires = time.monotonic() + settings.AUTH_TOKEN_CACHE[
+            'LOCAL_TIMEOUT']
+        with self._lock:
+            self._local[cache_key] = (data, expires)
+            self._local.move_to_end(cache_key)
+            while len(self._local) > settings.AUTH_TOKEN_CACHE['LOCAL_SIZE']:
+                self._local.popitem(last=False)
+
+    def invalidate(self, keys):
+        cache_keys = [self._cache_key(key) for key in keys]
+        with self._lock:
+            for cache_key in cache_keys:
+                self._local.pop(cache_key, None)
+        if self.backend is not None and cache_keys:
+            self.backend.delete_many(cache_keys)
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к базе при тёплом кэше. Кэш
+    сбрасывается при удалении токена (выход, удаление пользователя)
+    и при сохранении пользователя (смена пароля, блокировка).
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_user_cache.get(key)
+        if user is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').defer(
+                    *(f'user__{field}' for field in DEFERRED_FIELDS)).get(
+                    key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            if user.is_active:
+                token_user_cache.set(key, user)
+        else:
+            token = self.get_model()(key=key, user=user)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return user, token
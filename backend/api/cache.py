@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient, Tag
+
+
+class ReferenceCache:
+    """
+    Кэш справочных данных: LRU внутри процесса перед кэшем Django.
+    Записи привязаны к версии, которая хранится в кэше Django и
+    увеличивается при любом изменении справочника, поэтому устаревшие
+    значения не читаются ни одним процессом с общим кэшем.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.version_key = f'reference:{namespace}:version'
+        self._local = OrderedDict()
+        self._local_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[settings.REFERENCE_CACHE['ALIAS']]
+
+    def version(self):
+        version = self.backend.get(self.version_key)
+        if version is None:
+            self.backend.add(
+                self.version_key, int(time.time() * 1000), None)
+            version = self.backend.get(self.version_key)
+        return version
+
+    def bump(self):
+        try:
+            self.backend.incr(self.version_key)
+        except ValueError:
+            self.backend.set(
+                self.version_key, int(time.time() * 1000), None)
+
+    def _local_lookup(self, version, keys):
+        with self._lock:
+            if self._local_version != version:
+                self._local.clear()
+                self._local_version = version
+            found = {}
+            for key in keys:
+                if key in self._local:
+                    self._local.move_to_end(key)
+                    found[key] = self._local[key]
+            return found
+
+    def _local_store(self, version, values):
+        with self._lock:
+            if self._local_version != version:
+                return
+            self._local.update(values)
+            while len(self._local) > settings.REFERENCE_CACHE['LOCAL_SIZE']:
+                self._local.popitem(last=False)
+
+    def _cache_key(self, key):
+        # В ключах бывает пользовательский ввод (строка поиска), а
+        # memcached не принимает пробелы и ключи длиннее 250 байт.
+        digest = hashlib.md5(str(key).encode()).hexdigest()
+        return f'reference:{self.namespace}:{digest}'
+
+    def get(self, key, compute):
+        return self.get_many([key], lambda keys: {key: compute()})[key]
+
+    def get_many(self, keys, compute):
+        """
+        Значения по ключам; отсутствующие во всех уровнях кэша
+        вычисляются одним вызовом compute(ключи) -> {ключ: значение}.
+        """
+        version = self.version()
+        found = self._local_lookup(version, keys)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+        stored = self.backend.get_many(
+            [self._cache_key(key) for key in missing], version=version)
+        fetched = {
+            key: stored[self._cache_key(key)] for key in missing
+            if self._cache_key(key) in stored}
+        missing = [key for key in missing if key not in fetched]
+        if missing:
+            computed = compute(missing)
+            self.backend.set_many(
+                {self._cache_key(key): value
+                 for key, value in computed.items()},
+                settings.REFERENCE_CACHE['TIMEOUT'], version=version)
+            fetched.update(computed)
+        self._local_store(version, fetched)
+        found.update(fetched)
+        return found
+
+
+tag_cache = ReferenceCache('tags')
+ingredient_cache = ReferenceCache('ingredients')
+# Только версия: меняется при любом изменении содержимого рецептов,
+# включая удаление, и входит в ETag списков.
+recipe_cache = ReferenceCache('recipes')
+
+
+def render_json(data):
+    return JSONRenderer().render(data)
+
+
+def get_tags():
+    """Все теги по id."""
+    return tag_cache.get(
+        'all', lambda: {tag.id: tag for tag in Tag.objects.all()})
+
+
+def get_tag_choices():
+    return [(tag.slug, tag.name) for tag in get_tags().values()]
+
+
+def get_ingredients(ids):
+    """Ингредиенты по id; отсутствующих в базе id нет в результате."""
+    def compute(keys):
+        ingredients = Ingredient.objects.in_bulk(keys)
+        return {pk: ingredients.get(pk, False) for pk in keys}
+    found = ingredient_cache.get_many(list(ids), compute)
+    return {pk: ingredient for pk, ingredient in found.items() if ingredient}
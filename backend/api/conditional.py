@@ -0,0 +1,69 @@
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, IntegerField, Max, Value
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from recipes.models import Favorites, ShoppingCart
+from users.models import Subscription
+
+
+def viewer_state(user):
+    """
+    Отпечаток избранного, корзины и подписок пользователя одним
+    запросом: число записей и последний id в каждой таблице.
+    """
+    if not user.is_authenticated:
+        return ()
+    querysets = [
+        model.objects.filter(user=user).values('user').annotate(
+            kind=Value(kind, output_field=IntegerField()),
+            count=Count('id'),
+            last=Max('id')).order_by().values_list('kind', 'count', 'last')
+        for kind, model in enumerate((Favorites, ShoppingCart, Subscription))]
+    return sorted(querysets[0].union(*querysets[1:], all=True))
+
+
+def make_etag(*parts):
+    fingerprint = ':'.join(map(str, parts))
+    return '"{}"'.format(hashlib.md5(fingerprint.encode()).hexdigest())
+
+
+def conditional(request, get_response, etag, last_modified=None):
+    """
+    304 при совпадении ETag или Last-Modified (timestamp),
+    иначе ответ get_response() с этими заголовками.
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = get_response()
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Ответ 304 по ETag (и Last-Modified для анонимных запросов)
+    до выполнения сериализации.
+    """
+
+    viewer_dependent = False
+
+    def conditional_response(self, get_response, *validators,
+                             last_modified=None):
+        request = self.request
+        user = request.user
+        if self.viewer_dependent:
+            validators += (user.id, viewer_state(user))
+        etag = make_etag(
+            request.get_full_path(), request.accepted_media_type, *validators)
+        if user.is_authenticated or last_modified is None:
+            timestamp = None
+        else:
+            timestamp = timegm(last_modified.utctimetuple())
+        return conditional(request, get_response, etag, timestamp)
@@ -1,26 +1,46 @@
+from django.conf import settings
 from django_filters import rest_framework as filter
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe, Tag
+from api.cache import get_tag_choices
+from api.search import search_ingredients, search_recipes
+from recipes.models import Recipe
 
 
-class IngredientFilter(SearchFilter):
+class IngredientFilter(BaseFilterBackend):
+    """Автодополнение ингредиентов: сначала по началу названия."""
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or getattr(view, 'action', None) != 'list':
+            return queryset
+        return search_ingredients(
+            queryset, query, settings.INGREDIENT_SEARCH_LIMIT)
+
 
 class RecipeFilter(filter.FilterSet):
-    tags = filter.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
-        label='Tags',
-        to_field_name='slug')
+    tags = filter.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
+        label='Tags')
     is_favorited = filter.BooleanFilter(method='get_favorite')
     is_in_shopping_cart = filter.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filter.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'search']
+
+    def get_tags(self, queryset, name, value):
+        """Подзапрос вместо JOIN + DISTINCT: порядок берётся из индекса."""
+        if not value:
+            return queryset
+        return queryset.filter(id__in=Recipe.tags.through.objects.filter(
+            tag__slug__in=value).values('recipe_id'))
 
     def get_favorite(self, queryset, name, value):
         if value:
@@ -31,3 +51,7 @@ class RecipeFilter(filter.FilterSet):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        """Полнотекстовый поиск; результаты по убыванию релевантности."""
+        return search_recipes(queryset, value)
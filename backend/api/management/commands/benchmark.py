@@ -0,0 +1,363 @@
+import json
+import platform
+import secrets
+import sys
+import tracemalloc
+from base64 import b64encode
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+from math import ceil
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+HOST = '127.0.0.1'
+NEW_USER = {
+    'email': 'benchmark-new@example.com',
+    'username': 'benchmark-new',
+    'first_name': 'Замер',
+    'last_name': 'Замеров',
+    'password': 'Benchmark-password-1',
+}
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(0, ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), '#E26C2D').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+class RollbackError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure latency, queries per request and peak memory of every '
+            'API endpoint and write the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user', help='Email пользователя для запросов.')
+        parser.add_argument(
+            '--admin',
+            help='Email администратора для правки и удаления рецептов.')
+        parser.add_argument(
+            '--only', nargs='*', default=(),
+            help='Имена сценариев, по умолчанию все.')
+        parser.add_argument(
+            '--output', help='Файл для JSON, по умолчанию stdout.')
+        parser.add_argument(
+            '--baseline', help='JSON прошлого запуска для сравнения.')
+        parser.add_argument(
+            '--max-regression', type=float, default=20,
+            help='Допустимый рост p95 в процентах относительно baseline.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        user = self.get_user(options['user'])
+        meta = self.get_meta()
+        # Файлы сценариев (изображения новых рецептов) пишутся во
+        # временный каталог: откат транзакции их не удаляет.
+        with TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                results = self.run_scenarios(user)
+        report = {'meta': meta, 'results': results}
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                file.write(content)
+        else:
+            self.stdout.write(content)
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    def run_scenarios(self, user):
+        with self.login_user() as (login, password):
+            scenarios = self.get_scenarios(user, login, password)
+            unknown = set(self.options['only']) - {
+                name for name, *_ in scenarios}
+            if unknown:
+                raise CommandError(
+                    f'Нет сценариев: {", ".join(sorted(unknown))}')
+            users = {'user': user, 'login': login}
+            tokens = {}
+            results = {}
+            for name, method, url, data, role in scenarios:
+                if self.options['only'] and name not in self.options['only']:
+                    continue
+                client = APIClient(HTTP_HOST=HOST)
+                if role is not None:
+                    if role not in tokens:
+                        tokens[role], _ = Token.objects.get_or_create(
+                            user=users.get(role)
+                            or self.get_admin(self.options['admin']))
+                    client.credentials(
+                        HTTP_AUTHORIZATION=f'Token {tokens[role].key}')
+                results[name] = self.measure(client, method, url, data)
+                self.stderr.write(
+                    f'{name}: p95 {results[name]["p95_ms"]} мс, '
+                    f'{results[name]["queries"]} запросов')
+        return results
+
+    @staticmethod
+    def get_by_email(email):
+        try:
+            return User.objects.get(email=email)
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {email}.')
+
+    def get_user(self, email):
+        if email:
+            return self.get_by_email(email)
+        user = User.objects.filter(
+            follower__isnull=False, favorites__isnull=False,
+            shopping_cart__isnull=False, Recipe__isnull=False).first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователя с рецептами, подписками, избранным и '
+                'корзиной: запустите generate_dataset или укажите --user.')
+        return user
+
+    @staticmethod
+    @contextmanager
+    def login_user():
+        """
+        Временный пользователь с известным паролем для сценариев входа,
+        выхода и смены пароля; удаляется после замеров.
+        """
+        username = f'benchmark-{secrets.token_hex(4)}'
+        password = secrets.token_urlsafe()
+        user = User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password=password, first_name='Замер', last_name='Замеров')
+        try:
+            yield user, password
+        finally:
+            user.delete()
+
+    def get_admin(self, email):
+        """Правка и удаление чужих рецептов разрешены только персоналу."""
+        if email:
+            return self.get_by_email(email)
+        admin = User.objects.filter(is_staff=True, is_active=True).first()
+        if admin is None:
+            raise CommandError(
+                'Нет администратора для сценариев правки и удаления: '
+                'запустите createsuperuser или укажите --admin.')
+        return admin
+
+    @staticmethod
+    def get_scenarios(user, login, password):
+        """
+        (имя, метод, url, тело, роль): роль None - анонимный запрос,
+        user - пользователь из --user, login - временный пользователь
+        из login_user, admin - администратор.
+        """
+        recipes = list(Recipe.objects.exclude(favorites__user=user).exclude(
+            shopping_cart__user=user).order_by('-pub_date', '-id').values_list(
+            'id', flat=True)[:20])
+        recipe = Recipe.objects.filter(pk__in=recipes[:1]).first()
+        own = Recipe.objects.filter(author=user).first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        author = User.objects.exclude(pk=user.pk).exclude(
+            author__user=user).filter(Recipe__isnull=False).first()
+        followed = User.objects.filter(author__user=user).first()
+        favorite = Recipe.objects.filter(favorites__user=user).first()
+        in_cart = Recipe.objects.filter(shopping_cart__user=user).first()
+        missing = [name for name, obj in [
+            ('рецепт не из избранного и корзины', recipe),
+            ('свой рецепт', own),
+            ('тег', tag),
+            ('ингредиент', ingredient),
+            ('автор с рецептами без подписки', author),
+            ('подписка', followed),
+            ('рецепт в избранном', favorite),
+            ('рецепт в корзине', in_cart),
+        ] if obj is None]
+        if missing:
+            raise CommandError(
+                f'Для пользователя {user.email} нет данных: '
+                f'{", ".join(missing)}. Запустите generate_dataset или '
+                'укажите другого --user.')
+        recipe_data = {
+            'ingredients': [{'id': ingredient.id, 'amount': 10}],
+            'tags': [tag.id],
+            'image': image_data(),
+            'name': 'Рецепт для замера',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+        return [
+            ('users_list', 'get', '/api/users/', None, 'user'),
+            ('users_me', 'get', '/api/users/me/', None, 'user'),
+            ('users_detail', 'get', f'/api/users/{author.id}/', None, 'user'),
+            ('subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', None, 'user'),
+            ('subscribe', 'post', f'/api/users/{author.id}/subscribe/',
+             None, 'user'),
+            ('unsubscribe', 'delete', f'/api/users/{followed.id}/subscribe/',
+             None, 'user'),
+            ('users_create', 'post', '/api/users/', NEW_USER, None),
+            ('token_login', 'post', '/api/auth/token/login/',
+             {'email': login.email, 'password': password}, None),
+            ('token_logout', 'post', '/api/auth/token/logout/', None,
+             'login'),
+            ('set_password', 'post', '/api/users/set_password/',
+             {'current_password': password,
+              'new_password': NEW_USER['password']}, 'login'),
+            ('tags_list', 'get', '/api/tags/', None, None),
+            ('tags_detail', 'get', f'/api/tags/{tag.id}/', None, None),
+            ('ingredients_list', 'get', '/api/ingredients/', None, None),
+            ('ingredients_search', 'get',
+             f'/api/ingredients/?name={ingredient.name[:3]}', None, None),
+            ('ingredients_detail', 'get',
+             f'/api/ingredients/{ingredient.id}/', None, None),
+            ('recipes_list_anonymous', 'get', '/api/recipes/', None, None),
+            ('recipes_list', 'get', '/api/recipes/', None, 'user'),
+            ('recipes_list_cursor', 'get', '/api/recipes/?cursor=',
+             None, 'user'),
+            ('recipes_list_tag', 'get', f'/api/recipes/?tags={tag.slug}',
+             None, 'user'),
+            ('recipes_list_author', 'get',
+             f'/api/recipes/?author={author.id}', None, 'user'),
+            ('recipes_list_favorited', 'get',
+             '/api/recipes/?is_favorited=1', None, 'user'),
+            ('recipes_list_cart', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', None, 'user'),
+            ('recipes_feed', 'get', '/api/recipes/feed/', None, 'user'),
+            ('recipes_detail_anonymous', 'get',
+             f'/api/recipes/{recipe.id}/', None, None),
+            ('recipes_detail', 'get', f'/api/recipes/{recipe.id}/',
+             None, 'user'),
+            ('recipes_similar', 'get', f'/api/recipes/{recipe.id}/similar/',
+             None, None),
+            ('recipes_create', 'post', '/api/recipes/', recipe_data, 'user'),
+            ('recipes_update', 'patch', f'/api/recipes/{own.id}/',
+             {'cooking_time': 15}, 'admin'),
+            ('recipes_delete', 'delete', f'/api/recipes/{own.id}/',
+             None, 'admin'),
+            ('favorite', 'post', f'/api/recipes/{recipe.id}/favorite/',
+             None, 'user'),
+            ('favorite_delete', 'delete',
+             f'/api/recipes/{favorite.id}/favorite/', None, 'user'),
+            ('shopping_cart', 'post',
+             f'/api/recipes/{recipe.id}/shopping_cart/', None, 'user'),
+            ('shopping_cart_delete', 'delete',
+             f'/api/recipes/{in_cart.id}/shopping_cart/', None, 'user'),
+            ('favorite_bulk', 'post', '/api/recipes/favorite/bulk/',
+             {'ids': recipes}, 'user'),
+            ('shopping_cart_bulk', 'post',
+             '/api/recipes/shopping_cart/bulk/', {'ids': recipes}, 'user'),
+            ('download_shopping_cart', 'get',
+             '/api/recipes/download_shopping_cart/', None, 'user'),
+        ]
+
+    def request(self, client, method, url, data):
+        """
+        Запрос, изменения которого откатываются: каждый повтор видит
+        одни и те же данные.
+        """
+        try:
+            with transaction.atomic():
+                if data is None:
+                    response = getattr(client, method)(url)
+                else:
+                    response = getattr(client, method)(
+                        url, data, format='json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                raise RollbackError
+        except RollbackError:
+            return response
+
+    def measure(self, client, method, url, data):
+        # Время ответов с ошибкой (403, 404) ничего не говорит о сценарии.
+        response = self.request(client, method, url, data)
+        if not 200 <= response.status_code < 300:
+            raise CommandError(
+                f'{method.upper()} {url}: статус {response.status_code}')
+        for _ in range(self.options['warmup']):
+            self.request(client, method, url, data)
+        timings = []
+        for _ in range(self.options['iterations']):
+            start = perf_counter()
+            response = self.request(client, method, url, data)
+            timings.append((perf_counter() - start) * 1000)
+        # При DEBUG журнал запросов ограничен и может быть заполнен.
+        reset_queries()
+        with CaptureQueriesContext(connection) as context:
+            self.request(client, method, url, data)
+        # Отдельный прогон: tracemalloc замедляет запросы.
+        tracemalloc.start()
+        self.request(client, method, url, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'method': method.upper(),
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'queries': len(context.captured_queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def get_meta(self):
+        return {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'database': connection.vendor,
+            'iterations': self.options['iterations'],
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'tags': Tag.objects.count(),
+            },
+        }
+
+    def compare(self, results, path):
+        """Ошибка при росте p95 или числа запросов относительно baseline."""
+        with open(path, encoding='UTF-8') as file:
+            baseline = json.load(file)['results']
+        limit = 1 + self.options['max_regression'] / 100
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f'{name}: запросов {before["queries"]} -> '
+                    f'{result["queries"]}')
+            if result['p95_ms'] > before['p95_ms'] * limit:
+                regressions.append(
+                    f'{name}: p95 {before["p95_ms"]} -> '
+                    f'{result["p95_ms"]} мс')
+        if regressions:
+            raise CommandError('\n'.join(regressions))
+        self.stderr.write(self.style.SUCCESS('Регрессий нет.'))
@@ -0,0 +1,62 @@
+from time import perf_counter
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.management.commands.benchmark import HOST, percentile
+from api.renderers import FastJSONRenderer
+from api.serializers import FastRecipeSerializer, RecipeSerializer
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Compare per-recipe serialization and rendering cost of '
+            'RecipeSerializer and FastRecipeSerializer and check that '
+            'both produce identical JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=100, help='Рецептов на странице.')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--user', help='Email пользователя, по умолчанию аноним.')
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/api/recipes/', HTTP_HOST=HOST)
+        request.user = (
+            User.objects.get(email=options['user']) if options['user']
+            else AnonymousUser())
+        page = list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+            'id', flat=True)[:options['limit']])
+        if not page:
+            raise CommandError(
+                'Нет рецептов: запустите generate_dataset.')
+        paths = {
+            'drf': (
+                lambda: Recipe.objects.with_related(),
+                RecipeSerializer, JSONRenderer()),
+            'fast': (
+                lambda: Recipe.objects.select_related('author'),
+                FastRecipeSerializer, FastJSONRenderer()),
+        }
+        contents = {}
+        for name, (queryset, serializer_class, renderer) in paths.items():
+            timings = []
+            for _ in range(options['iterations']):
+                start = perf_counter()
+                recipes = queryset().with_user_flags(request.user).filter(
+                    id__in=page).order_by('-pub_date', '-id')
+                data = serializer_class(
+                    recipes, many=True, context={'request': request}).data
+                contents[name] = renderer.render(data)
+                timings.append((perf_counter() - start) * 1e6 / len(page))
+            self.stdout.write(
+                f'{name}: p50 {percentile(timings, 50):.1f} мкс, '
+                f'p95 {percentile(timings, 95):.1f} мкс на рецепт')
+        if contents['drf'] != contents['fast']:
+            raise CommandError('Ответы различаются.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ответы совпадают побайтно ({len(contents["fast"])} байт).'))
@@ -0,0 +1,141 @@
+import re
+
+from django.apps import apps
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.management.commands.benchmark import HOST
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+SQLITE_TABLE = re.compile(r'^(SCAN|SEARCH) (?:TABLE )?(\w+)(.*)$')
+SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+COUNT_ALIAS = '"__count"'
+
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN for the SQL of every API read endpoint and fail '
+            'on full scans or sorts over large tables.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='С какого числа строк таблица считается большой.')
+        parser.add_argument(
+            '--user', help='Email пользователя для запросов.')
+
+    def handle(self, *args, **options):
+        self.min_rows = options['min_rows']
+        self.sizes = {
+            model._meta.db_table: model.objects.count()
+            for model in apps.get_models()}
+        user = self.get_user(options['user'])
+        client = APIClient(HTTP_HOST=HOST)
+        client.force_authenticate(user)
+        problems = []
+        for url in self.get_urls(user):
+            # Первый запрос прогревает кэши, проверяется второй.
+            for _ in range(2):
+                with CaptureQueriesContext(connection) as context:
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+            if response.status_code >= 400:
+                raise CommandError(f'{url}: статус {response.status_code}')
+            for query in context.captured_queries:
+                sql = query['sql']
+                # COUNT(*) постраничного вывода по номеру страницы
+                # неизбежен; большие таблицы листаются по ключу.
+                if (not sql.lstrip().upper().startswith('SELECT')
+                        or COUNT_ALIAS in sql):
+                    continue
+                for problem in self.explain(sql):
+                    problems.append(f'{url}: {problem}\n    {sql}')
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке.'))
+
+    @staticmethod
+    def get_user(email):
+        if email:
+            return User.objects.get(email=email)
+        user = User.objects.filter(
+            follower__isnull=False, shopping_cart__isnull=False).first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователя с подписками и корзиной, '
+                'укажите --user или заполните базу.')
+        return user
+
+    @staticmethod
+    def get_urls(user):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        urls = [
+            '/api/recipes/',
+            '/api/recipes/?page=2',
+            '/api/recipes/?cursor=',
+            f'/api/recipes/?cursor=&author={user.id}',
+            '/api/recipes/?cursor=&is_favorited=1',
+            '/api/recipes/?cursor=&is_in_shopping_cart=1',
+            '/api/recipes/feed/',
+            '/api/users/subscriptions/?recipes_limit=3',
+            '/api/recipes/download_shopping_cart/',
+            '/api/tags/',
+        ]
+        if recipe:
+            urls += [
+                f'/api/recipes/{recipe.id}/',
+                f'/api/recipes/{recipe.id}/similar/',
+            ]
+        if tag:
+            urls += [
+                f'/api/recipes/?tags={tag.slug}',
+                f'/api/recipes/?cursor=&tags={tag.slug}',
+            ]
+        if ingredient:
+            urls.append(f'/api/ingredients/?name={ingredient.name[:3]}')
+        return urls
+
+    def is_large(self, table):
+        return self.sizes.get(table, 0) >= self.min_rows
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                return list(self.check_postgresql(cursor.fetchone()[0][0][
+                    'Plan']))
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return list(self.check_sqlite(
+                row[-1] for row in cursor.fetchall()))
+
+    def check_postgresql(self, plan):
+        table = plan.get('Relation Name')
+        if plan['Node Type'] == 'Seq Scan' and self.is_large(table):
+            yield f'Seq Scan по {table}'
+        if (plan['Node Type'] == 'Sort'
+                and plan['Plan Rows'] >= self.min_rows):
+            yield f'Sort по {plan["Plan Rows"]} строкам'
+        for child in plan.get('Plans', []):
+            yield from self.check_postgresql(child)
+
+    def check_sqlite(self, details):
+        details = list(details)
+        driver = None
+        for detail in details:
+            match = SQLITE_TABLE.match(detail)
+            if not match:
+                continue
+            action, table, rest = match.groups()
+            if driver is None:
+                driver = (action, table)
+            if (action == 'SCAN' and self.is_large(table)
+                    and ' INDEX ' not in f'{rest} '):
+                yield f'полный просмотр {table}'
+        if (SQLITE_SORT in details and driver
+                and driver[0] == 'SCAN' and self.is_large(driver[1])):
+            yield 'сортировка во временном B-дереве'
@@ -0,0 +1,29 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.similarity import SimilarityIndex, index_available
+
+
+class Command(BaseCommand):
+    help = ('Build the similar-recipes index from the database and save '
+            'a snapshot that workers load at startup.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=settings.SIMILARITY['SNAPSHOT_PATH'],
+            help='Файл снимка, по умолчанию SIMILARITY["SNAPSHOT_PATH"].')
+
+    def handle(self, *args, **options):
+        if not index_available():
+            raise CommandError('Для индекса нужны NumPy и SciPy.')
+        if not options['output']:
+            raise CommandError('Не задан путь к снимку.')
+        start = perf_counter()
+        index = SimilarityIndex()
+        index.build()
+        count = index.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс сохранён в {options["output"]}: {count} рецептов '
+            f'за {perf_counter() - start:.1f} с.'))
@@ -1,6 +1,272 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.search import SEARCH_RANK
+
+from recipes.feed import FeedEntries
+
+
+def count_rows(queryset):
+    """
+    COUNT(*) без аннотаций-отметок: на число строк они не влияют, а с
+    ними Django считает через подзапрос с GROUP BY по каждой строке.
+    """
+    queryset = queryset.order_by()
+    query = queryset.query
+    if not any(annotation.contains_aggregate
+               for annotation in query.annotations.values()):
+        # Условия фильтров хранят выражения, а не ссылки на аннотации.
+        query.annotations.clear()
+        query.set_annotation_mask(None)
+    return queryset.count()
+
+
+class RowCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return count_rows(self.object_list)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+    django_paginator_class = RowCountPaginator
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор админки: для больших выборок число объектов берётся из
+    плана запроса PostgreSQL вместо COUNT(*).
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.exact_count_limit:
+            return super().count
+        return estimate
+
+
+class KeysetPagination(LimitPageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы или, если в запросе есть
+    параметр cursor, по ключу (seek) без COUNT и OFFSET.
+    Параметр count: exact — точное число объектов, estimate — оценка
+    по плану запроса, по умолчанию не считается. Выборки, к порядку
+    которых ключ не подходит (keyset_applicable), идут по номеру страницы.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-id',)
+    # Только по ключу, даже без параметра cursor в запросе.
+    cursor_only = False
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.keyset_applicable(queryset) and (
+            self.cursor_only
+            or self.cursor_query_param in request.query_params)
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, self.reverse = self.decode_cursor(
+            self.get_model(queryset),
+            request.query_params.get(self.cursor_query_param, ''))
+        self.count = self.get_count(queryset, request)
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self.invert(field) for field in ordering]
+        results = self.fetch(
+            queryset, ordering, position, self.page_size + 1)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.results = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next or not self.results:
+            return None
+        return self.build_link(self.results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        if not self.has_previous or not self.results:
+            return None
+        return self.build_link(self.results[0], reverse=True)
+
+    @staticmethod
+    def keyset_applicable(queryset):
+        return True
+
+    @staticmethod
+    def get_model(queryset):
+        return queryset.model
+
+    def fetch(self, queryset, ordering, position, limit):
+        """Первые limit объектов строго после позиции."""
+        if position is not None:
+            queryset = queryset.filter(self.seek(ordering, position))
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return count_rows(queryset)
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    @staticmethod
+    def field_name(field):
+        return field.lstrip('-')
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def seek(self, ordering, position):
+        """Условие «строго после позиции» для составного ключа."""
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = self.field_name(field)
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {
+                self.field_name(previous): value for previous, value
+                in zip(ordering[:index], position[:index])}
+            conditions.append(
+                Q(**equal, **{f'{name}__{lookup}': position[index]}))
+        return reduce(or_, conditions)
+
+    def build_link(self, obj, reverse):
+        position = [
+            getattr(obj, self.field_name(field)) for field in self.ordering]
+        cursor = b64encode(json.dumps({
+            'p': [str(value) for value in position],
+            'r': reverse,
+        }).encode()).decode()
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, model, cursor):
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(b64decode(cursor.encode()).decode())
+            values = data['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(self.field_name(field)).to_python(
+                    value)
+                for field, value in zip(self.ordering, values)]
+            return position, bool(data.get('r'))
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class RecipePagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+
+    @staticmethod
+    def keyset_applicable(queryset):
+        """Результаты поиска упорядочены по релевантности, а не по ключу."""
+        return SEARCH_RANK not in queryset.query.annotations
+
+
+class FeedPagination(RecipePagination):
+    """
+    Лента подписок: только по ключу, без подсчёта. Вместо queryset
+    принимает список источников с одной моделью (recipes.feed), страница
+    собирается слиянием их первых страниц. Записи ленты (FeedEntries)
+    выбираются в порядке их индекса, затем загружаются рецепты.
+    """
+    cursor_only = True
+
+    @staticmethod
+    def keyset_applicable(sources):
+        return True
+
+    @staticmethod
+    def get_model(sources):
+        return sources[0].model
+
+    def get_count(self, sources, request):
+        return None
+
+    def fetch(self, sources, ordering, position, limit):
+        results = {}
+        for source in sources:
+            if isinstance(source, FeedEntries):
+                found = self.fetch_entries(source, ordering, position, limit)
+            else:
+                found = super().fetch(source, ordering, position, limit)
+            for obj in found:
+                results.setdefault(obj.pk, obj)
+        # Направление сортировки у всех полей ordering одинаковое.
+        return sorted(
+            results.values(),
+            key=lambda obj: [
+                getattr(obj, self.field_name(field)) for field in ordering],
+            reverse=ordering[0].startswith('-'))[:limit]
+
+    def fetch_entries(self, source, ordering, position, limit):
+        """Порядок и курсор по полям записей ленты, а не рецептов."""
+        ordering = [
+            field.replace(
+                self.field_name(field), source.fields[self.field_name(field)])
+            for field in ordering]
+        return source.recipes(
+            super().fetch(source.entries, ordering, position, limit))
+
+
+class SubscriptionsPagination(KeysetPagination):
+    ordering = ('username', 'id')
@@ -0,0 +1,117 @@
+from django.db import connections, router
+from django.db.models import Exists, OuterRef
+
+from recipes import feed
+from recipes.counters import change_counters, find_counter
+from recipes.models import Favorites, Recipe, ShoppingCart, ShoppingListItem
+from users.models import Subscription, User
+
+
+class UserRelation:
+    """
+    Идемпотентные связи пользователя с объектами (избранное, корзина,
+    подписки). Вставка одним bulk_create(ignore_conflicts=True), удаление
+    одним DELETE, после чего changed() обновляет производные данные на
+    всю пачку: счётчики (recipes.counters), список покупок для корзины и
+    ленты для подписок. Обычные save() и delete() этих моделей вызывают
+    тот же changed() из сигналов (api/signals.py).
+    Вызывать внутри транзакции.
+    """
+
+    def __init__(self, model, field, target):
+        self.model = model
+        self.field = field
+        self.target = target
+        self.counter = find_counter(model)
+
+    def fetch(self, user, ids):
+        """
+        {id: объект} существующих объектов с признаком linked. Строка
+        пользователя блокируется, чтобы параллельные запросы того же
+        пользователя не разошлись в оценке уже существующих связей.
+        """
+        list(User.objects.select_for_update().filter(
+            pk=user.pk).values_list('pk'))
+        objects = self.target.objects.filter(pk__in=ids).annotate(
+            linked=Exists(self.model.objects.filter(
+                user=user, **{self.field: OuterRef('pk')})))
+        return {obj.pk: obj for obj in objects}
+
+    def add(self, user, objects):
+        """Создаёт недостающие связи, возвращает id добавленных объектов."""
+        ids = [obj.pk for obj in objects if not obj.linked]
+        self.model.objects.bulk_create(
+            [self.model(user=user, **{f'{self.field}_id': pk})
+             for pk in ids],
+            ignore_conflicts=True)
+        self.changed(user.pk, ids, 1)
+        return ids
+
+    def remove(self, user, objects):
+        """Удаляет имеющиеся связи, возвращает id затронутых объектов."""
+        ids = [obj.pk for obj in objects if obj.linked]
+        if ids:
+            self.delete(user, ids)
+        self.changed(user.pk, ids, -1)
+        return ids
+
+    def delete(self, user, ids):
+        """
+        DELETE по уникальному индексу (пользователь, объект): queryset
+        delete() отправил бы post_delete по строке, и каждая поменяла бы
+        счётчик отдельным UPDATE.
+        """
+        meta = self.model._meta
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(meta.db_table)} WHERE '
+                f'{quote(meta.get_field("user").column)} = %s AND '
+                f'{quote(meta.get_field(self.field).column)} IN '
+                f'({", ".join(["%s"] * len(ids))})',
+                (user.pk, *ids))
+
+    def link_id(self, obj):
+        """id объекта, с которым связь obj связывает пользователя."""
+        return getattr(obj, f'{self.field}_id')
+
+    def changed(self, user_id, ids, delta):
+        """Производные данные для связей user_id с ids (delta = ±1)."""
+        if self.counter is None or not ids:
+            return
+        target, _, field = self.counter
+        change_counters(target, ids, field, delta)
+
+
+class ShoppingCartRelation(UserRelation):
+    """Корзина дополнительно ведёт сводный список покупок."""
+
+    def changed(self, user_id, ids, delta):
+        super().changed(user_id, ids, delta)
+        if not ids:
+            return
+        if delta > 0:
+            ShoppingListItem.objects.add_recipes(user_id, ids)
+        else:
+            ShoppingListItem.objects.remove_recipes(user_id, ids)
+
+
+class SubscriptionRelation(UserRelation):
+    """Подписки дополнительно меняют ленту пользователя."""
+
+    def changed(self, user_id, ids, delta):
+        super().changed(user_id, ids, delta)
+        if not ids:
+            return
+        if delta > 0:
+            feed.follow(user_id, ids)
+        else:
+            feed.unfollow(user_id, ids)
+
+
+favorites = UserRelation(Favorites, 'recipe', Recipe)
+shopping_cart = ShoppingCartRelation(ShoppingCart, 'recipe', Recipe)
+subscriptions = SubscriptionRelation(Subscription, 'author', User)
+
+RELATIONS = (favorites, shopping_cart, subscriptions)
@@ -0,0 +1,199 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.http import parse_http_date_safe, urlencode
+from rest_framework.response import Response
+
+from api.cache import get_tags, ingredient_cache
+from api.conditional import conditional
+
+
+class ResponseCache:
+    """
+    Общий кэш ответов с инвалидацией по меткам. Запись хранит версии
+    своих меток (рецепты, авторы, теги, фильтры списка); изменение
+    объекта увеличивает версии его меток, и записи со старыми версиями
+    больше не читаются. Работает с любым бэкендом кэша Django.
+
+    Метки ответа известны только после его вычисления, поэтому перед
+    вычислением запоминается поколение (snapshot): его увеличивает каждая
+    инвалидация, и ответ, во время вычисления которого было изменение,
+    не сохраняется под новыми версиями меток.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    @property
+    def backend(self):
+        return caches[settings.RESPONSE_CACHE['ALIAS']]
+
+    def _tag_key(self, tag):
+        return f'response:{self.namespace}:tag:{tag}'
+
+    def _generation_key(self):
+        return f'response:{self.namespace}:generation'
+
+    def _entry_key(self, key):
+        digest = hashlib.md5(key.encode()).hexdigest()
+        return f'response:{self.namespace}:entry:{digest}'
+
+    def get(self, key):
+        entry = self.backend.get(self._entry_key(key))
+        if entry is None:
+            return None
+        versions = self.backend.get_many(
+            [self._tag_key(tag) for tag in entry['tags']])
+        for tag, version in entry['tags'].items():
+            if versions.get(self._tag_key(tag)) != version:
+                return None
+        return entry
+
+    def snapshot(self):
+        """Поколение меток перед вычислением ответа для set."""
+        key = self._generation_key()
+        self.backend.add(key, int(time.time() * 1000), None)
+        return self.backend.get(key)
+
+    def set(self, key, tags, snapshot, **entry):
+        """
+        Сохраняет ответ, если после snapshot не было инвалидаций.
+        Версии меток читаются до проверки поколения: при неизменном
+        поколении они не новее данных, из которых вычислен ответ.
+        """
+        keys = {tag: self._tag_key(tag) for tag in tags}
+        versions = self.backend.get_many(list(keys.values()))
+        missing = [key for key in keys.values() if key not in versions]
+        if missing:
+            initial = int(time.time() * 1000)
+            for tag_key in missing:
+                self.backend.add(tag_key, initial, None)
+            versions.update(self.backend.get_many(missing))
+        if (snapshot is None
+                or self.backend.get(self._generation_key()) != snapshot):
+            return False
+        entry['tags'] = {tag: versions.get(key) for tag, key in keys.items()}
+        self.backend.set(
+            self._entry_key(key), entry, settings.RESPONSE_CACHE['TIMEOUT'])
+        return True
+
+    def invalidate(self, tags):
+        """
+        Увеличивает поколение, затем версии меток. Метки без версии
+        пропускаются: записи с такой меткой и так считаются устаревшими.
+        """
+        tags = set(tags)
+        if not tags:
+            return
+        try:
+            self.backend.incr(self._generation_key())
+        except ValueError:
+            # Без поколения ни один snapshot с ним не совпадёт.
+            pass
+        for tag in tags:
+            try:
+                self.backend.incr(self._tag_key(tag))
+            except ValueError:
+                pass
+
+
+recipe_response_cache = ResponseCache('recipes')
+
+
+def recipe_tags(recipe):
+    """Метки содержимого сериализованного рецепта."""
+    return [
+        f'recipe:{recipe["id"]}',
+        f'user:{recipe["author"]["id"]}',
+        *[f'tag:{tag["id"]}' for tag in recipe['tags']],
+    ]
+
+
+def recipe_scope_tags(author_id, tag_ids):
+    """Метки списков, в которых рецепт появляется или пропадает."""
+    return [
+        'recipes',
+        f'author-recipes:{author_id}',
+        *[f'tag-recipes:{tag_id}' for tag_id in tag_ids],
+    ]
+
+
+class CachedRecipeResponseMixin:
+    """
+    Кэш ответов list/retrieve рецептов для анонимных пользователей.
+    Авторизованные запросы идут мимо кэша: в ответе их отметки.
+    """
+
+    response_cache_params = (
+        'page', 'limit', 'cursor', 'count', 'author', 'search')
+    response_cache_bypass_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def response_cache_key(self):
+        request = self.request
+        if (request.user.is_authenticated
+                or request.accepted_renderer.format != 'json'):
+            return None
+        params = request.query_params
+        if any(name in params for name in self.response_cache_bypass_params):
+            return None
+        query = [
+            (name, params[name]) for name in self.response_cache_params
+            if name in params]
+        query += [('tags', slug) for slug in sorted(set(
+            params.getlist('tags')))]
+        return ':'.join(map(str, (
+            self.action, self.kwargs.get('pk', ''), request.get_host(),
+            request.accepted_media_type, ingredient_cache.version(),
+            urlencode(sorted(query)))))
+
+    def response_cache_tags(self, data):
+        if self.action == 'retrieve':
+            return recipe_tags(data)
+        params = self.request.query_params
+        tags = [
+            tag for recipe in data['results'] for tag in recipe_tags(recipe)]
+        slugs = set(params.getlist('tags'))
+        if 'author' in params:
+            tags.append(f'author-recipes:{params["author"]}')
+        if slugs:
+            tags += [
+                f'tag-recipes:{tag.id}' for tag in get_tags().values()
+                if tag.slug in slugs]
+        if 'author' not in params and not slugs:
+            tags.append('recipes')
+        if params.get('search'):
+            tags.append('recipe-search')
+        return tags
+
+    def cached_response(self, get_response):
+        key = self.response_cache_key()
+        if key is None:
+            return get_response()
+        entry = recipe_response_cache.get(key)
+        if entry is None:
+            snapshot = recipe_response_cache.snapshot()
+            response = get_response()
+            if (not isinstance(response, Response)
+                    or response.status_code != 200):
+                return response
+            request = self.request
+            entry = {
+                'content': request.accepted_renderer.render(
+                    response.data, request.accepted_media_type,
+                    self.get_renderer_context()),
+                'content_type': request.accepted_media_type,
+                'etag': response['ETag'],
+                'last_modified': parse_http_date_safe(
+                    response.get('Last-Modified', '')),
+            }
+            recipe_response_cache.set(
+                key, self.response_cache_tags(response.data), snapshot,
+                **entry)
+        return conditional(
+            self.request,
+            lambda: HttpResponse(
+                entry['content'], content_type=entry['content_type']),
+            entry['etag'], entry['last_modified'])
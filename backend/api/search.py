@@ -0,0 +1,174 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from functools import reduce
+from itertools import accumulate
+from operator import and_
+
+from django.db import connections
+from django.db.models import (Case, FloatField, IntegerField, Q, Value,
+                              When)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from api.cache import ingredient_cache
+from recipes.models import Ingredient
+from recipes.search import (FTS_TABLE, SEARCH_CONFIG, SEARCH_VECTOR,
+                            fts_available)
+
+SEARCH_TERM = re.compile(r'"([^"]*)"?|(\S+)')
+WORD = re.compile(r'\w+')
+MAX_SEARCH_TERMS = 10
+# Короче - только по началу названия: по одной-двум буквам вхождения
+# бесполезны, а индекс gin_trgm_ops их не ускоряет.
+CONTAINS_MIN_LENGTH = 3
+SEPARATOR = '\n'
+# Аннотация релевантности в результатах search_recipes.
+SEARCH_RANK = 'search_rank'
+
+
+class IngredientIndex:
+    """
+    Отсортированный массив названий ингредиентов в памяти процесса.
+    Используется для автодополнения там, где нет индексов PostgreSQL;
+    перестраивается при смене версии справочника ингредиентов.
+    Для поиска по вхождению названия склеены в одну строку: str.find
+    просматривает её без цикла на Python и останавливается на limit.
+    """
+
+    def __init__(self):
+        self._keys = None
+        self._text = None
+        self._starts = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        version = ingredient_cache.version()
+        with self._lock:
+            if self._version != version:
+                keys = sorted(
+                    (name.lower(), pk) for pk, name
+                    in Ingredient.objects.values_list(
+                        'id', 'name').iterator())
+                self._keys = keys
+                self._text = SEPARATOR.join(name for name, _ in keys)
+                self._starts = [0, *accumulate(
+                    len(name) + len(SEPARATOR) for name, _ in keys)]
+                self._version = version
+            return self._keys, self._text, self._starts
+
+    def search(self, query, limit):
+        """Сначала совпадения по началу названия, затем по вхождению."""
+        keys, text, starts = self._load()
+        found = []
+        position = bisect_left(keys, (query,))
+        while (position < len(keys) and len(found) < limit
+               and keys[position][0].startswith(query)):
+            found.append(keys[position][1])
+            position += 1
+        if (len(found) == limit or len(query) < CONTAINS_MIN_LENGTH
+                or SEPARATOR in query):
+            return found
+        offset = text.find(query)
+        while offset != -1:
+            position = bisect_right(starts, offset) - 1
+            name, pk = keys[position]
+            if not name.startswith(query):
+                found.append(pk)
+                if len(found) == limit:
+                    break
+            offset = text.find(query, starts[position + 1])
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_postgresql(queryset, query, limit):
+    """
+    Поиск по индексам lower(name) text_pattern_ops и gin_trgm_ops
+    (миграция recipes.0005): сначала limit совпадений по началу
+    названия, вхождения - только на оставшиеся места.
+    """
+    queryset = queryset.annotate(lower_name=Lower('name'))
+    prefix = Q(lower_name__startswith=query)
+    found = list(queryset.filter(prefix).order_by('lower_name')[:limit])
+    if len(found) < limit and len(query) >= CONTAINS_MIN_LENGTH:
+        found += queryset.filter(lower_name__contains=query).exclude(
+            prefix).order_by('lower_name')[:limit - len(found)]
+    return found
+
+
+def search_in_memory(queryset, query, limit):
+    ids = ingredient_index.search(query, limit)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(id__in=ids).order_by(Case(
+        *[When(id=pk, then=Value(position))
+          for position, pk in enumerate(ids)],
+        output_field=IntegerField()))
+
+
+def search_ingredients(queryset, query, limit):
+    query = query.lower()
+    if connections[queryset.db].vendor == 'postgresql':
+        return search_postgresql(queryset, query, limit)
+    return search_in_memory(queryset, query, limit)
+
+
+def parse_search(query):
+    """
+    Термы поиска рецептов: [(слова, по префиксу)]. Текст в кавычках -
+    фраза, слово со звёздочкой на конце ищется по началу.
+    """
+    terms = []
+    for phrase, token in SEARCH_TERM.findall(query):
+        words = WORD.findall(phrase or token)
+        if words:
+            terms.append((words, not phrase and token.endswith('*')))
+    return terms[:MAX_SEARCH_TERMS]
+
+
+def tsquery(terms):
+    return ' & '.join(
+        '({})'.format(' <-> '.join(words) + (':*' if prefix else ''))
+        for words, prefix in terms)
+
+
+def fts5_query(terms):
+    return ' AND '.join(
+        '"{}"'.format(' '.join(words)) + ('*' if prefix else '')
+        for words, prefix in terms)
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты по релевантности (поле search_rank): tsvector с индексом GIN
+    в PostgreSQL, теневая таблица FTS5 в SQLite, иначе icontains.
+    """
+    terms = parse_search(query)
+    if not terms:
+        return queryset
+    table = queryset.model._meta.db_table
+    if connections[queryset.db].vendor == 'postgresql':
+        params = (SEARCH_CONFIG, tsquery(terms))
+        queryset = queryset.extra(
+            where=[f'{table}.{SEARCH_VECTOR} @@ to_tsquery(%s, %s)'],
+            params=params).annotate(**{SEARCH_RANK: RawSQL(
+                f'ts_rank_cd({table}.{SEARCH_VECTOR}, to_tsquery(%s, %s))',
+                params, output_field=FloatField())})
+    elif fts_available(queryset.db):
+        match = fts5_query(terms)
+        queryset = queryset.extra(
+            where=[f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                   f'WHERE {FTS_TABLE} MATCH %s)'],
+            params=(match,)).annotate(**{SEARCH_RANK: RawSQL(
+                f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+                (match,), output_field=FloatField())})
+    else:
+        return queryset.filter(reduce(and_, [
+            Q(name__icontains=text) | Q(text__icontains=text)
+            for text in (' '.join(words) for words, _ in terms)]))
+    return queryset.order_by(f'-{SEARCH_RANK}', '-pub_date', '-id')
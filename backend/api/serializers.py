@@ -1,11 +1,99 @@
+from django.db import transaction
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
 
+from api.cache import get_ingredients, get_tags
+from recipes.images import VARIANTS, schedule_recipe_image
 from recipes.models import (Favorites, Ingredient, Recipe,
-                            IngredientInRecipe, ShoppingCart, Tag)
-from users.models import Subscription, User
+                            IngredientInRecipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import User
+
+
+class BulkPrimaryKeyRelatedField(serializers.ListField):
+    """
+    Список id связанных объектов, которые находятся одним обращением
+    resolve(id) -> {id: объект}; о повторах и обо всех несуществующих
+    id сообщается сразу.
+    """
+    child = serializers.IntegerField()
+    default_error_messages = {
+        'duplicates': 'Значения должны быть уникальными.',
+        'does_not_exist': 'Объекты не существуют: {pk_values}.',
+    }
+
+    def __init__(self, resolve, **kwargs):
+        self.resolve = resolve
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        objects = self.resolve(ids)
+        errors = []
+        if len(set(ids)) != len(ids):
+            errors.append(self.error_messages['duplicates'])
+        missing = sorted({pk for pk in ids if pk not in objects})
+        if missing:
+            errors.append(self.error_messages['does_not_exist'].format(
+                pk_values=', '.join(map(str, missing))))
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [objects[pk] for pk in ids]
+
+
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    """Ингредиенты рецепта проверяются одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ids = [item['ingredient_id'] for item in items]
+        ingredients = get_ingredients(ids)
+        errors = []
+        if len(set(ids)) != len(ids):
+            errors.append('Все ингредиенты должны быть уникальными.')
+        missing = sorted({pk for pk in ids if pk not in ingredients})
+        if missing:
+            errors.append('Ингредиенты не существуют: {}.'.format(
+                ', '.join(map(str, missing))))
+        if errors:
+            raise serializers.ValidationError(errors)
+        for item in items:
+            item['ingredient'] = ingredients[item.pop('ingredient_id')]
+        return items
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии изображения рецепта;
+    пока копии не готовы, отдаётся оригинал.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return image_variants(recipe, self.context.get('request'))
+
+
+def image_url(file, request):
+    """Ссылка на файл так же, как в serializers.ImageField."""
+    if not file:
+        return None
+    url = file.url
+    return request.build_absolute_uri(url) if request else url
+
+
+def image_variants(recipe, request):
+    if not recipe.image:
+        return None
+    variants = {}
+    for field in VARIANTS:
+        url = (getattr(recipe, field) or recipe.image).url
+        variants[field[len('image_'):]] = (
+            request.build_absolute_uri(url) if request else url)
+    return variants
 
 
 class CustomUserSerializer(UserSerializer):
@@ -18,9 +106,12 @@ class CustomUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed']
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        if request and request.user.is_anonymous:
-            return obj.following.filter(user=request.user).exists()
+        if not request or request.user.is_anonymous:
+            return False
+        return obj.author.filter(user=request.user).exists()
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -32,8 +123,7 @@ class TagSerializer(serializers.ModelSerializer):
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор модели ингредиентов в рецептах."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit')
@@ -41,6 +131,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientInRecipe
         fields = ['id', 'name', 'amount', 'measurement_unit']
+        list_serializer_class = IngredientAmountListSerializer
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -59,30 +150,114 @@ class RecipeSerializer(serializers.ModelSerializer):
         method_name='get_is_favorited')
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name='get_is_in_shopping_cart')
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ['id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time']
+                  'name', 'image', 'images', 'text', 'cooking_time']
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
     def get_ingredients(self, obj):
-        ingredients = IngredientInRecipe.objects.filter(recipe=obj)
+        ingredients = obj.ingredientinrecipe_set.all()
         return RecipeIngredientSerializer(ingredients, many=True).data
 
     def _is_exist(self, arg0, obj):
         request = self.context.get('request', None)
+        if not request or request.user.is_anonymous:
+            return False
         return arg0.objects.filter(
             user=request.user.id,
             recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return self._is_exist(ShoppingCart, obj)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return self._is_exist(Favorites, obj)
 
 
+class FastRecipeSerializer:
+    """
+    Чтение рецептов без полей DRF: тот же JSON, что у RecipeSerializer,
+    собирается в словари из строк values_list() - по одному запросу на
+    теги и ингредиенты страницы. Рецепты ожидаются из
+    select_related('author').with_user_flags().
+    """
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @property
+    def data(self):
+        recipes = list(self.instance) if self.many else [self.instance]
+        rows = self.to_rows(recipes)
+        return rows if self.many else rows[0]
+
+    @staticmethod
+    def related_rows(recipe_ids):
+        """
+        {id рецепта: теги} и {id рецепта: ингредиенты} в том же порядке,
+        что и prefetch_related в RecipeQuerySet.with_related().
+        """
+        tags = {pk: [] for pk in recipe_ids}
+        for recipe_id, *tag in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids).order_by(
+                'tag__name').values_list(
+                'recipe_id', 'tag_id', 'tag__name', 'tag__color',
+                'tag__slug'):
+            tags[recipe_id].append(dict(zip(
+                ('id', 'name', 'color', 'slug'), tag)))
+        ingredients = {pk: [] for pk in recipe_ids}
+        for recipe_id, *ingredient in IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient_id', 'ingredient__name', 'amount',
+                'ingredient__measurement_unit'):
+            ingredients[recipe_id].append(dict(zip(
+                ('id', 'name', 'amount', 'measurement_unit'), ingredient)))
+        return tags, ingredients
+
+    def to_rows(self, recipes):
+        request = self.context.get('request')
+        tags, ingredients = self.related_rows(
+            [recipe.id for recipe in recipes])
+        rows = []
+        for recipe in recipes:
+            author = recipe.author
+            rows.append({
+                'id': recipe.id,
+                'tags': tags[recipe.id],
+                'author': {
+                    'id': author.id,
+                    'email': author.email,
+                    'username': author.username,
+                    'first_name': author.first_name,
+                    'last_name': author.last_name,
+                    'is_subscribed': recipe.author_is_subscribed,
+                },
+                'ingredients': ingredients[recipe.id],
+                'is_favorited': recipe.is_favorited,
+                'is_in_shopping_cart': recipe.is_in_shopping_cart,
+                'name': recipe.name,
+                'image': image_url(recipe.image, request),
+                'images': image_variants(recipe, request),
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            })
+        return rows
+
+
 class CreateRecipeSerializer(serializers.ModelSerializer):
     """
     Создание рецепта.
@@ -90,8 +265,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     """
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    tags = BulkPrimaryKeyRelatedField(resolve=lambda ids: get_tags())
     image = Base64ImageField()
     cooking_time = serializers.IntegerField()
 
@@ -104,7 +278,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     def set_recipe_ingredient(ingredients, recipe):
         ingredient_list = [
             IngredientInRecipe(
-                ingredient=ingredient.get('id'),
+                ingredient=ingredient['ingredient'],
                 recipe=recipe,
                 amount=ingredient.get('amount'))
             for ingredient in ingredients
@@ -113,30 +287,13 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         IngredientInRecipe.objects.bulk_create(ingredient_list)
 
     def validate(self, data):
-        ingredients = data.get('ingredients')
-        if not ingredients:
+        if ((not self.partial or 'ingredients' in data)
+                and not data.get('ingredients')):
             raise serializers.ValidationError({
                 'Необходимо выбрать хотя бы 1 ингредиент.'})
-        ingredient_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient.get('id')
-            if not ingredient_id:
-                raise serializers.ValidationError({
-                    'Необходимо выбрать хотя бы 1 ингредиент.'})
-            if ingredient_id in ingredient_list:
-                raise serializers.ValidationError({
-                    'Все ингредиенты должны быть уникальными.'})
-            ingredient_list.append(ingredient_id)
-        tags = data.get('tags')
-        if not tags:
+        if (not self.partial or 'tags' in data) and not data.get('tags'):
             raise serializers.ValidationError({
                 'Необходимо выбрать хотя бы 1 тег.'})
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError({
-                    'Теги должны быть уникальными.'})
-            tags_list.append(tag)
         return data
 
     def validate_cooking_time(self, cooking_time):
@@ -145,6 +302,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 'Время готовки должно быть не меньше одной минуты')
         return cooking_time
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -152,56 +310,84 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=request.user, **validated_data)
         recipe.tags.set(tags)
         self.set_recipe_ingredient(ingredients, recipe)
+        schedule_recipe_image(recipe)
         return recipe
 
+    def update_recipe_ingredient(self, ingredients, recipe):
+        """
+        Меняет только добавленные, изменённые и удалённые строки; разница
+        в количествах переносится в списки покупок одним вызовом.
+        """
+        current = {
+            item.ingredient_id: item for item
+            in IngredientInRecipe.objects.filter(recipe=recipe)}
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()}
+        submitted = {
+            ingredient['ingredient'].id: ingredient
+            for ingredient in ingredients}
+        to_update = []
+        for ingredient_id, item in current.items():
+            amount = submitted.get(ingredient_id, {}).get('amount')
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                to_update.append(item)
+        to_delete = [
+            item.id for ingredient_id, item in current.items()
+            if ingredient_id not in submitted]
+        self.set_recipe_ingredient([
+            ingredient for ingredient_id, ingredient in submitted.items()
+            if ingredient_id not in current], recipe)
+        IngredientInRecipe.objects.bulk_update(to_update, ['amount'])
+        IngredientInRecipe.objects.filter(id__in=to_delete).delete()
+        ShoppingListItem.objects.change_recipe(recipe, old_amounts, {
+            ingredient_id: ingredient['amount']
+            for ingredient_id, ingredient in submitted.items()})
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.set(tags)
-        self.set_recipe_ingredient(ingredients, instance)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_recipe_ingredient(ingredients, instance)
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_recipe_image(instance)
+        return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user).get(pk=instance.pk)
         return RecipeSerializer(instance, context={
-            'request': self.context.get('request')}).data
+            'request': request}).data
 
 
 class ShowFavoriteSerializer(serializers.ModelSerializer):
     """ Сериализатор для отображения избранного. """
-    class Meta:
-        model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
-
+    images = ImageVariantsField()
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """ Сериализатор для списка покупок. """
     class Meta:
-        model = ShoppingCart
-        fields = ['user', 'recipe']
-
-    def validate(self, data):
-        user = data['user']
-        if user.shopping_cart.filter(recipe=data['recipe']).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже в списке покупок')
-        return data
-
-    def to_representation(self, instance):
-        return ShowFavoriteSerializer(instance.recipe, context={
-            'request': self.context.get('request')}).data
+        model = Recipe
+        fields = ['id', 'name', 'image', 'images', 'cooking_time']
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """ Сериализатор модели Избранное. """
-    class Meta:
-        model = Favorites
-        fields = ['user', 'recipe']
-
-    def to_representation(self, instance):
-        return ShowFavoriteSerializer(instance.recipe, context={
-            'request': self.context.get('request')}).data
+def get_recipes_limit(request):
+    """Значение recipes_limit из запроса или None, если не задано."""
+    limit = request.query_params.get('recipes_limit')
+    if limit in (None, ''):
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise serializers.ValidationError({
+            'recipes_limit': 'Ожидается неотрицательное целое число.'})
+    return limit
 
 
 class ShowSubscriptionsSerializer(serializers.ModelSerializer):
@@ -218,35 +404,34 @@ class ShowSubscriptionsSerializer(serializers.ModelSerializer):
                   'recipes_count']
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        if request and request.user.is_anonymous:
-            return obj.following.filter(user=request.user).exists()
+        if not request or request.user.is_anonymous:
+            return False
+        return obj.author.filter(user=request.user).exists()
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes = Recipe.objects.filter(author=obj)
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes = Recipe.objects.latest_by_author(
+                [obj.id], get_recipes_limit(request))[obj.id]
         return ShowFavoriteSerializer(
             recipes, many=True, context={'request': request}).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
-    """Сериализатор подписок."""
-    class Meta:
-        model = Subscription
-        fields = ['user', 'author']
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Subscription.objects.all(),
-                fields=['user', 'author'])]
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетных операций; повторы отбрасываются."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=100)
 
-    def to_representation(self, instance):
-        return ShowSubscriptionsSerializer(instance.author, context={
-            'request': self.context.get('request')}).data
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
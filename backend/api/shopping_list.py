@@ -0,0 +1,120 @@
+import csv
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, F, Max, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+TITLE = 'Купить в магазине:'
+PDF_FONT = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+
+
+def get_ingredients(user):
+    """Суммарный список ингредиентов из корзины пользователя."""
+    return ShoppingListItem.objects.filter(user=user).order_by(
+        'ingredient__name').values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        amount=F('total_amount'))
+
+
+def get_etag(user, file_type):
+    """
+    Отпечаток содержимого корзины одним агрегирующим запросом.
+    Меняется при добавлении/удалении рецепта и при правке его состава.
+    """
+    state = ShoppingListItem.objects.filter(user=user).aggregate(
+        count=Count('id'), total=Sum('total_amount'), last=Max('id'))
+    recipes = user.shopping_cart.order_by('recipe_id').values_list(
+        'recipe_id', flat=True)
+    fingerprint = '{}:{count}:{total}:{last}:{recipes}'.format(
+        file_type, recipes=','.join(map(str, recipes)), **state)
+    return '"{}"'.format(hashlib.md5(fingerprint.encode()).hexdigest())
+
+
+def iterate(ingredients):
+    return ingredients.iterator(chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+
+
+def format_line(ingredient):
+    return (f"{ingredient['ingredient__name']} "
+            f"({ingredient['ingredient__measurement_unit']}) - "
+            f"{ingredient['amount']}")
+
+
+def render_txt(ingredients):
+    yield TITLE
+    for ingredient in iterate(ingredients):
+        yield '\n' + format_line(ingredient)
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['Ингредиент', 'Единица измерения', 'Количество'])
+    for ingredient in iterate(ingredients):
+        yield writer.writerow([
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount']])
+
+
+def get_pdf_font():
+    """Шрифт с кириллицей: встроенные шрифты PDF её не отображают."""
+    if PDF_FONT in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT
+    if not os.path.exists(settings.PDF_FONT_PATH):
+        raise ImproperlyConfigured(
+            f'Нет шрифта для PDF: {settings.PDF_FONT_PATH}. Установите '
+            'fonts-dejavu-core или задайте PDF_FONT_PATH.')
+    pdfmetrics.registerFont(TTFont(PDF_FONT, settings.PDF_FONT_PATH))
+    return PDF_FONT
+
+
+def render_pdf(ingredients):
+    """
+    Ингредиенты читаются частями, но reportlab держит документ в памяти
+    до сохранения: таблица ссылок PDF пишется в конце файла. Поэтому
+    PDF отдаётся целиком, а не потоком.
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    width, height = A4
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    pdf.drawString(PDF_MARGIN, y, TITLE)
+    for ingredient in iterate(ingredients):
+        y -= PDF_FONT_SIZE * 1.5
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, y, format_line(ingredient))
+    pdf.save()
+    return buffer.getvalue()
+
+
+# Формат: (функция, Content-Type, класс ответа).
+FILE_TYPES = {
+    'txt': (render_txt, 'text/plain; charset=utf-8', StreamingHttpResponse),
+    'csv': (render_csv, 'text/csv; charset=utf-8', StreamingHttpResponse),
+    'pdf': (render_pdf, 'application/pdf', HttpResponse),
+}
@@ -0,0 +1,275 @@
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.models.signals import (m2m_changed, post_delete,
+                                      post_migrate, post_save, pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_user_cache
+from api.cache import ingredient_cache, recipe_cache, tag_cache
+from api.relations import RELATIONS
+from api.response_cache import recipe_response_cache, recipe_scope_tags
+from api.similarity import similarity_cache
+from recipes import feed
+from recipes.counters import COUNTERS, change_counter
+from recipes.images import images_processed
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingListItem, Tag)
+from recipes.search import fts_tables, index_recipe, unindex_recipe
+from users.models import User
+
+# Рецептов в одном UPDATE updated_at после удаления ингредиентов.
+TOUCH_BATCH_SIZE = 500
+
+
+def invalidate_responses(tags):
+    """Сброс кэша ответов и версии рецептов после фиксации транзакции."""
+    tags = list(tags)
+
+    def invalidate():
+        recipe_response_cache.invalidate(tags)
+        recipe_cache.bump()
+    transaction.on_commit(invalidate)
+
+
+def counter_receiver(target, link, field):
+    """Счётчик меняется в той же транзакции, что и запись."""
+    def update_counter(instance, signal, created=True, **kwargs):
+        if created:
+            change_counter(
+                target, getattr(instance, link), field,
+                -1 if signal is post_delete else 1)
+    return update_counter
+
+
+def deleting(model, using):
+    """
+    id объектов model, которые сейчас удаляет Collector на соединении
+    using: их зависимые записи удаляются каскадом после pre_delete.
+    """
+    connection = connections[using]
+    if not hasattr(connection, 'deleting'):
+        connection.deleting = {}
+    return connection.deleting.setdefault(model, set())
+
+
+def relation_receiver(relation):
+    """
+    Сохранение и удаление одной связи идут через тот же changed(), что
+    и bulk-операции api.relations.
+    """
+    def relation_changed(instance, signal, using, created=True, **kwargs):
+        if not created:
+            return
+        target_id = relation.link_id(instance)
+        if signal is post_delete:
+            # Данные удаляемого объекта (рецепта, автора) уходят вместе
+            # с ним; список покупок вычел remove_deleted_recipe.
+            if target_id in deleting(relation.target, using):
+                return
+            relation.changed(instance.user_id, [target_id], -1)
+        else:
+            relation.changed(instance.user_id, [target_id], 1)
+    return relation_changed
+
+
+for relation in RELATIONS:
+    receiver_function = relation_receiver(relation)
+    post_save.connect(
+        receiver_function, sender=relation.model, weak=False,
+        dispatch_uid=f'relation:{relation.model._meta.label}')
+    post_delete.connect(
+        receiver_function, sender=relation.model, weak=False,
+        dispatch_uid=f'relation:{relation.model._meta.label}')
+
+for source, target, link, field in COUNTERS:
+    if any(relation.model is source for relation in RELATIONS):
+        continue
+    receiver_function = counter_receiver(target, link, field)
+    post_save.connect(
+        receiver_function, sender=source, weak=False,
+        dispatch_uid=f'counter:{field}')
+    post_delete.connect(
+        receiver_function, sender=source, weak=False,
+        dispatch_uid=f'counter:{field}')
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe(instance, using, **kwargs):
+    """
+    Состав рецепта вычитается из всех корзин с ним сразу: каскадное
+    удаление строк и корзин идёт без пересчёта по каждой строке.
+    """
+    deleting(Recipe, using).add(instance.pk)
+    ShoppingListItem.objects.change_recipe(
+        instance, ShoppingListItem.objects.recipes_amounts([instance.pk]),
+        {})
+
+
+@receiver(pre_delete, sender=User)
+def remember_deleted_user(instance, using, **kwargs):
+    deleting(User, using).add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def forget_deleted(sender, instance, using, **kwargs):
+    deleting(sender, using).discard(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    ingredient_cache.bump()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(instance, **kwargs):
+    tag_cache.bump()
+    invalidate_responses([f'tag:{instance.pk}', f'tag-recipes:{instance.pk}'])
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe(instance, created, **kwargs):
+    # Изменённый рецепт может попасть в результаты любого поиска.
+    tags = [f'recipe:{instance.pk}', 'recipe-search']
+    if created:
+        tags += recipe_scope_tags(instance.author_id, [])
+    invalidate_responses(tags)
+
+
+@receiver(images_processed, sender=Recipe)
+def invalidate_recipe_images(recipe_id, **kwargs):
+    invalidate_responses([f'recipe:{recipe_id}'])
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_similarity_index(**kwargs):
+    # Индекс перечитывает рецепты по updated_at, поэтому версию
+    # увеличиваем только после фиксации изменений.
+    transaction.on_commit(similarity_cache.bump)
+
+
+def ingredient_deletion(using):
+    """
+    Удаляемые в текущей транзакции ингредиенты и рецепты их строк
+    (хранятся на соединении). Сброс регистрируется в on_commit при
+    каждом вызове и выполняется первым из них. После отката состояние
+    доживает до следующей фиксации: лишний раз обновится updated_at у
+    рецептов, что безопасно.
+    """
+    connection = connections[using]
+    state = getattr(connection, 'ingredient_deletion', None)
+    if state is None:
+        state = connection.ingredient_deletion = {
+            'ingredients': set(), 'recipes': set()}
+    transaction.on_commit(partial(touch_recipes, using), using=using)
+    return state
+
+
+def touch_recipes(using):
+    """
+    Каскадное удаление строк рецепта не меняет сам рецепт: updated_at
+    (по нему индекс похожих перечитывает рецепты) обновляется одним
+    UPDATE на пачку, версия индекса - один раз за транзакцию.
+    """
+    connection = connections[using]
+    state = getattr(connection, 'ingredient_deletion', None)
+    if state is None:
+        return
+    connection.ingredient_deletion = None
+    recipe_ids = sorted(state['recipes'])
+    now = timezone.now()
+    for start in range(0, len(recipe_ids), TOUCH_BATCH_SIZE):
+        Recipe.objects.using(using).filter(
+            pk__in=recipe_ids[start:start + TOUCH_BATCH_SIZE]).update(
+            updated_at=now)
+    similarity_cache.bump()
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_deleted_ingredient(instance, using, **kwargs):
+    ingredient_deletion(using)['ingredients'].add(instance.pk)
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def remember_touched_recipe(instance, using, **kwargs):
+    # Строки удаляются раньше ингредиента, но после всех pre_delete.
+    state = getattr(connections[using], 'ingredient_deletion', None)
+    if state is not None and instance.ingredient_id in state['ingredients']:
+        state['recipes'].add(instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        feed.schedule_fan_out(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_index(instance, **kwargs):
+    index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_search_index(instance, **kwargs):
+    unindex_recipe(instance.pk, instance._state.db)
+
+
+@receiver(post_migrate)
+def reset_search_backend(using, **kwargs):
+    """Миграции могли создать или удалить теневую таблицу поиска."""
+    fts_tables.pop(using, None)
+
+
+@receiver(pre_delete, sender=Recipe)
+def invalidate_deleted_recipe(instance, **kwargs):
+    invalidate_responses([f'recipe:{instance.pk}', *recipe_scope_tags(
+        instance.author_id,
+        instance.tags.through.objects.filter(recipe=instance).values_list(
+            'tag_id', flat=True))])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if action == 'pre_clear':
+        links = Recipe.tags.through.objects.filter(
+            **{'tag' if reverse else 'recipe': instance})
+        pk_set = set(links.values_list(
+            'recipe_id' if reverse else 'tag_id', flat=True))
+    recipe_ids, tag_ids = (pk_set, [instance.pk]) if reverse else (
+        [instance.pk], pk_set)
+    invalidate_responses(
+        [f'recipe:{pk}' for pk in recipe_ids]
+        + [f'tag-recipes:{pk}' for pk in tag_ids])
+
+
+@receiver([post_save, post_delete], sender=IngredientInRecipe)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    invalidate_responses([f'recipe:{instance.recipe_id}'])
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(instance, update_fields, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidate_responses([f'user:{instance.pk}'])
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: token_user_cache.invalidate([key]))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, update_fields, **kwargs):
+    """Смена пароля, блокировка или правка профиля."""
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    transaction.on_commit(lambda: token_user_cache.invalidate(keys))
@@ -0,0 +1,353 @@
+import datetime
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from api.cache import ReferenceCache
+from recipes.models import IngredientInRecipe, Recipe
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('jaccard', 'cosine')
+
+similarity_cache = ReferenceCache('similarity')
+
+
+def index_available():
+    return numpy is not None
+
+
+class Segment:
+    """
+    Неизменяемая часть индекса: разреженные матрицы рецепт x ингредиент
+    и рецепт x тег (CSR, столбец - id) для рецептов с id из ids
+    (отсортированы). Удалённые и изменённые позже строки помечаются
+    в alive, сама матрица не меняется.
+    """
+
+    def __init__(self, ids, ingredients, tags, alive=None):
+        self.ids = ids
+        self.ingredients = ingredients
+        self.tags = tags
+        self.sizes = numpy.diff(ingredients.indptr).astype(numpy.float32)
+        self.alive = (
+            numpy.ones(len(ids), dtype=bool) if alive is None else alive)
+
+    @classmethod
+    def build(cls, ids, ingredient_pairs, tag_pairs):
+        """Сегмент из id рецептов и пар (id рецепта, id ингредиента/тега)."""
+        ids = numpy.unique(numpy.asarray(ids, dtype=numpy.int64))
+        return cls(
+            ids, cls.matrix(ids, ingredient_pairs), cls.matrix(ids, tag_pairs))
+
+    @staticmethod
+    def matrix(ids, pairs):
+        pairs = numpy.asarray(pairs, dtype=numpy.int64).reshape(-1, 2)
+        pairs = pairs[numpy.isin(pairs[:, 0], ids)]
+        columns = int(pairs[:, 1].max()) + 1 if len(pairs) else 1
+        matrix = sparse.csr_matrix(
+            (numpy.ones(len(pairs), dtype=numpy.float32),
+             (numpy.searchsorted(ids, pairs[:, 0]), pairs[:, 1])),
+            shape=(len(ids), columns))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+
+    def rows(self, recipe_ids):
+        """Номера живых строк рецептов из recipe_ids."""
+        rows = numpy.searchsorted(self.ids, recipe_ids)
+        inside = rows < len(self.ids)
+        rows = rows[inside]
+        rows = rows[self.ids[rows] == recipe_ids[inside]]
+        return rows[self.alive[rows]]
+
+    def without(self, recipe_ids):
+        """Копия сегмента, в которой рецепты recipe_ids помечены удалёнными."""
+        rows = self.rows(recipe_ids)
+        if not len(rows):
+            return self
+        alive = self.alive.copy()
+        alive[rows] = False
+        return Segment(self.ids, self.ingredients, self.tags, alive)
+
+    @staticmethod
+    def vector(ids, columns):
+        vector = numpy.zeros(columns, dtype=numpy.float32)
+        vector[ids[ids < columns]] = 1
+        return vector
+
+    def scores(self, ingredient_ids, metric):
+        """Сходство всех рецептов сегмента с набором ингредиентов."""
+        overlap = self.ingredients @ self.vector(
+            ingredient_ids, self.ingredients.shape[1])
+        size = len(ingredient_ids)
+        if metric == 'cosine':
+            denominator = numpy.sqrt(self.sizes * size)
+        else:
+            denominator = self.sizes + size - overlap
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return overlap, numpy.where(
+                overlap > 0, overlap / denominator, 0)
+
+    def tagged(self, tag_ids):
+        """Маска рецептов хотя бы с одним из тегов tag_ids."""
+        return self.tags @ self.vector(tag_ids, self.tags.shape[1]) > 0
+
+
+class SimilarityIndex:
+    """
+    Индекс похожих рецептов в памяти процесса. Изменения дописываются
+    новыми сегментами с рецептами, изменёнными после watermark, старые
+    строки этих рецептов помечаются удалёнными; когда сегментов
+    становится больше MAX_SEGMENTS, они сливаются в один.
+    Проверка изменений - по версии в кэше Django, которую увеличивают
+    сохранение и удаление рецепта и удаление ингредиентов (api/signals).
+    Состав и теги через API и админку меняются вместе с сохранением
+    рецепта; id тегов при переименовании не меняются.
+    """
+
+    def __init__(self):
+        self._segments = None
+        self._watermark = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read_rows(since=None):
+        """Пары (рецепт, ингредиент) и (рецепт, тег)."""
+        links = IngredientInRecipe.objects.all()
+        tags = Recipe.tags.through.objects.all()
+        if since is not None:
+            links = links.filter(recipe__updated_at__gte=since)
+            tags = tags.filter(recipe__updated_at__gte=since)
+        return (
+            list(links.values_list('recipe_id', 'ingredient_id').iterator()),
+            list(tags.values_list('recipe_id', 'tag_id').iterator()))
+
+    @staticmethod
+    def current_watermark():
+        """
+        Время, начиная с которого рецепты перечитываются при следующем
+        обновлении. С запасом WATERMARK_LAG секунд на транзакции,
+        зафиксированные позже, чем было проставлено updated_at.
+        """
+        latest = Recipe.objects.aggregate(latest=Max('updated_at'))['latest']
+        if latest is None:
+            return None
+        return latest - datetime.timedelta(
+            seconds=settings.SIMILARITY['WATERMARK_LAG'])
+
+    def build(self):
+        """Полная сборка индекса из базы."""
+        watermark = self.current_watermark()
+        ids = list(Recipe.objects.values_list('id', flat=True).iterator())
+        ingredient_pairs, tag_pairs = self.read_rows()
+        self._segments = [Segment.build(ids, ingredient_pairs, tag_pairs)]
+        self._watermark = watermark
+
+    def update(self):
+        """Перечитывает рецепты, изменённые после watermark."""
+        watermark = self.current_watermark()
+        changed = Recipe.objects.all()
+        if self._watermark is not None:
+            changed = changed.filter(updated_at__gte=self._watermark)
+        changed = numpy.asarray(
+            list(changed.values_list('id', flat=True).iterator()),
+            dtype=numpy.int64)
+        segments = [segment.without(changed) for segment in self._segments]
+        if len(changed):
+            segments.append(Segment.build(
+                changed, *self.read_rows(self._watermark)))
+        alive = sum(int(segment.alive.sum()) for segment in segments)
+        if alive != Recipe.objects.count():
+            existing = numpy.asarray(list(Recipe.objects.values_list(
+                'id', flat=True).iterator()), dtype=numpy.int64)
+            segments = [segment.without(segment.ids[~numpy.isin(
+                segment.ids, existing)]) for segment in segments]
+        self._segments = [
+            segment for segment in segments if segment.alive.any()]
+        if len(self._segments) > settings.SIMILARITY['MAX_SEGMENTS']:
+            self._segments = [self.merged(self._segments)]
+        self._watermark = watermark
+
+    @staticmethod
+    def merged(segments):
+        """Один сегмент из живых строк всех сегментов."""
+        if not segments:
+            return Segment.build([], [], [])
+        ingredients = [
+            segment.ingredients[segment.alive] for segment in segments]
+        tags = [segment.tags[segment.alive] for segment in segments]
+        for matrices in (ingredients, tags):
+            columns = max(matrix.shape[1] for matrix in matrices)
+            for matrix in matrices:
+                matrix.resize((matrix.shape[0], columns))
+        ids = numpy.concatenate(
+            [segment.ids[segment.alive] for segment in segments])
+        order = numpy.argsort(ids)
+        return Segment(
+            ids[order],
+            sparse.vstack(ingredients, format='csr')[order],
+            sparse.vstack(tags, format='csr')[order])
+
+    @property
+    def segments(self):
+        version = similarity_cache.version()
+        with self._lock:
+            if self._segments is None and not self.load():
+                self.build()
+            elif self._version != version:
+                self.update()
+            self._version = version
+            return self._segments
+
+    def ingredients_of(self, segments, recipe_id):
+        recipe_ids = numpy.asarray([recipe_id], dtype=numpy.int64)
+        for segment in segments:
+            rows = segment.rows(recipe_ids)
+            if len(rows):
+                return segment.ingredients[rows[0]].indices
+        return None
+
+    def similar(self, recipe_id, limit, metric='jaccard', tag_ids=()):
+        """
+        [(id рецепта, сходство)] limit самых похожих рецептов по
+        ингредиентам, при tag_ids - только с одним из этих тегов.
+        None, если рецепта нет в индексе.
+        """
+        segments = self.segments
+        ingredient_ids = self.ingredients_of(segments, recipe_id)
+        if ingredient_ids is None:
+            return None
+        if not len(ingredient_ids):
+            return []
+        tag_ids = numpy.asarray(list(tag_ids), dtype=numpy.int64)
+        found_ids, found_scores = [], []
+        for segment in segments:
+            overlap, scores = segment.scores(ingredient_ids, metric)
+            mask = segment.alive & (overlap > 0) & (segment.ids != recipe_id)
+            if len(tag_ids):
+                mask &= segment.tagged(tag_ids)
+            rows = numpy.flatnonzero(mask)
+            if len(rows) > limit:
+                # Равные limit-му значению тоже остаются: порядок среди
+                # них решается при слиянии сегментов.
+                kth = len(rows) - limit
+                rows = rows[
+                    scores[rows] >= numpy.partition(scores[rows], kth)[kth]]
+            found_ids.append(segment.ids[rows])
+            found_scores.append(scores[rows])
+        ids = numpy.concatenate(found_ids)
+        scores = numpy.concatenate(found_scores)
+        # При равном сходстве выше более новые рецепты.
+        order = numpy.lexsort((-ids, -scores))[:limit]
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def save(self, path):
+        """
+        Снимок собранного индекса на диск; при загрузке досчитываются
+        изменения после его watermark. Файл заменяется целиком, чтобы
+        стартующие процессы не прочитали его наполовину записанным.
+        """
+        with self._lock:
+            segment = self.merged(self._segments)
+            watermark = self._watermark
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as file:
+            numpy.savez(
+                file, ids=segment.ids,
+                ingredients_indptr=segment.ingredients.indptr,
+                ingredients_indices=segment.ingredients.indices,
+                ingredients_shape=segment.ingredients.shape,
+                tags_indptr=segment.tags.indptr,
+                tags_indices=segment.tags.indices,
+                tags_shape=segment.tags.shape,
+                watermark=watermark.isoformat() if watermark else '')
+        os.replace(temporary, path)
+        return len(segment.ids)
+
+    def load(self):
+        """Загружает снимок SNAPSHOT_PATH, если он есть."""
+        path = settings.SIMILARITY['SNAPSHOT_PATH']
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with numpy.load(path) as snapshot:
+                matrices = {
+                    name: sparse.csr_matrix(
+                        (numpy.ones(len(snapshot[f'{name}_indices']),
+                                    dtype=numpy.float32),
+                         snapshot[f'{name}_indices'],
+                         snapshot[f'{name}_indptr']),
+                        shape=tuple(snapshot[f'{name}_shape']))
+                    for name in ('ingredients', 'tags')}
+                segment = Segment(snapshot['ids'], **matrices)
+                watermark = str(snapshot['watermark'])
+        except (OSError, KeyError, ValueError):
+            logger.exception('Не удалось загрузить снимок индекса %s', path)
+            return False
+        self._segments = [segment]
+        self._watermark = (
+            datetime.datetime.fromisoformat(watermark) if watermark else None)
+        self.update()
+        return True
+
+
+similarity_index = SimilarityIndex() if index_available() else None
+
+
+def similar_by_sql(recipe_id, limit, metric='jaccard', tag_ids=()):
+    """
+    Запасной вариант без NumPy/SciPy: кандидаты с наибольшим числом
+    общих ингредиентов (не больше SQL_CANDIDATES), среди них - limit
+    самых похожих. Для рецептов с очень частыми ингредиентами результат
+    приблизительный.
+    """
+    ingredient_ids = list(IngredientInRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', flat=True))
+    if not ingredient_ids:
+        return [] if Recipe.objects.filter(pk=recipe_id).exists() else None
+    candidates = IngredientInRecipe.objects.filter(
+        ingredient_id__in=ingredient_ids).exclude(recipe_id=recipe_id)
+    if tag_ids:
+        candidates = candidates.filter(
+            recipe_id__in=Recipe.tags.through.objects.filter(
+                tag_id__in=tag_ids).values('recipe_id'))
+    overlaps = dict(candidates.values('recipe_id').annotate(
+        overlap=Count('id')).order_by('-overlap', '-recipe_id').values_list(
+        'recipe_id', 'overlap')[:settings.SIMILARITY['SQL_CANDIDATES']])
+    sizes = dict(IngredientInRecipe.objects.filter(
+        recipe_id__in=overlaps).values('recipe_id').annotate(
+        size=Count('id')).order_by().values_list('recipe_id', 'size'))
+    size = len(ingredient_ids)
+    scores = []
+    for pk, overlap in overlaps.items():
+        if metric == 'cosine':
+            score = overlap / (sizes[pk] * size) ** 0.5
+        else:
+            score = overlap / (sizes[pk] + size - overlap)
+        scores.append((pk, score))
+    scores.sort(key=lambda item: (-item[1], -item[0]))
+    return scores[:limit]
+
+
+def similar_recipes(recipe_id, limit, metric='jaccard', tag_ids=()):
+    """
+    [(id рецепта, сходство)] по убыванию сходства или None, если
+    рецепта нет. Рецепт, ещё не попавший в индекс, считается через SQL.
+    """
+    found = None
+    if similarity_index is not None:
+        found = similarity_index.similar(recipe_id, limit, metric, tag_ids)
+    if found is None:
+        found = similar_by_sql(recipe_id, limit, metric, tag_ids)
+    return found
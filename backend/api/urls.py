@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (IngredientViewSet, RecipeViewSet,
+from api.views import (BulkSubscribeView, IngredientViewSet, RecipeViewSet,
                        ShowSubscriptionsView, SubscribeView,
                        TagViewSet)
 
@@ -22,6 +22,10 @@ urlpatterns = [
         'users/subscriptions/',
         ShowSubscriptionsView.as_view(),
         name='subscriptions'),
+    path(
+        'users/subscriptions/bulk/',
+        BulkSubscribeView.as_view(),
+        name='subscriptions-bulk'),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls')),
     path('', include(router.urls)),
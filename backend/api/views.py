@@ -1,156 +1,354 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api import shopping_list
+from api.cache import (get_tags, ingredient_cache, recipe_cache, render_json,
+                       tag_cache)
+from api.conditional import ConditionalGetMixin
 from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import LimitPageNumberPagination
+from api.pagination import (FeedPagination, RecipePagination,
+                            SubscriptionsPagination)
 from api.permissions import IsAuthorOrAdminOrReadOnly
-from api.serializers import (CreateRecipeSerializer, FavoriteSerializer,
-                             IngredientSerializer, RecipeSerializer,
-                             ShoppingCartSerializer,
-                             ShowSubscriptionsSerializer,
-                             SubscriptionSerializer, TagSerializer)
+from api.relations import favorites, shopping_cart, subscriptions
+from api.renderers import FastJSONRenderer
+from api.response_cache import CachedRecipeResponseMixin
+from api.serializers import (BulkIdsSerializer, CreateRecipeSerializer,
+                             FastRecipeSerializer, IngredientSerializer,
+                             ShowFavoriteSerializer,
+                             ShowSubscriptionsSerializer, TagSerializer,
+                             get_recipes_limit)
+from api.similarity import METRICS, similar_recipes
 
-from recipes.models import (Favorites, Ingredient, Recipe, IngredientInRecipe,
-                            ShoppingCart, Tag)
-from users.models import Subscription, User
+from recipes.feed import feed_sources
+from recipes.models import Ingredient, Recipe, Tag
+from telemetry.middleware import serializer_data
+from telemetry.mixins import SerializationTimingMixin
+from users.models import User
 
 
-class SubscribeView(APIView):
+class RelationActionsMixin:
+    """
+    Идемпотентные добавление и удаление связей пользователя: повторное
+    добавление возвращает 200 вместо 201, удаление отсутствующей связи
+    возвращает 204. Пакетный вариант принимает {"ids": [...]}.
+    """
+
+    def get_relation_object(self, relation, pk):
+        try:
+            objects = relation.fetch(self.request.user, [int(pk)])
+        except ValueError:
+            raise Http404
+        if not objects:
+            raise Http404
+        return next(iter(objects.values()))
+
+    @staticmethod
+    def check_self(request, relation, ids):
+        if relation is subscriptions and request.user.pk in ids:
+            raise ValidationError(
+                {'errors': 'Нельзя подписаться на самого себя.'})
+
+    @transaction.atomic
+    def add_relation(self, request, relation, pk, serializer_class):
+        obj = self.get_relation_object(relation, pk)
+        self.check_self(request, relation, [obj.pk])
+        created = relation.add(request.user, [obj])
+        if relation is subscriptions:
+            obj.is_subscribed = True
+        serializer = serializer_class(obj, context={'request': request})
+        return Response(
+            serializer_data(serializer),
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @transaction.atomic
+    def remove_relation(self, request, relation, pk):
+        relation.remove(
+            request.user, [self.get_relation_object(relation, pk)])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @transaction.atomic
+    def bulk_relation(self, request, relation):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        found = relation.fetch(request.user, ids)
+        objects = [found[pk] for pk in ids if pk in found]
+        if request.method == 'DELETE':
+            return Response(
+                {'deleted': relation.remove(request.user, objects)})
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise ValidationError({'ids': 'Объекты не существуют: {}.'.format(
+                ', '.join(map(str, sorted(missing))))})
+        self.check_self(request, relation, ids)
+        created = relation.add(request.user, objects)
+        return Response({
+            'created': created,
+            'existing': [pk for pk in ids if pk not in created]})
+
+
+class SubscribeView(RelationActionsMixin, APIView):
     """ Операция подписки/отписки. """
     permission_classes = [IsAuthenticated]
 
     def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'author': id}
-        serializer = SubscriptionSerializer(
-            data=data,
-            context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_relation(
+            request, subscriptions, id, ShowSubscriptionsSerializer)
 
     def delete(self, request, id):
-        author = get_object_or_404(User, id=id)
-        if Subscription.objects.filter(
-           user=request.user, author=author).exists():
-            subscription = get_object_or_404(
-                Subscription, user=request.user, author=author)
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        return self.remove_relation(request, subscriptions, id)
+
+
+class BulkSubscribeView(RelationActionsMixin, APIView):
+    """Пакетная подписка/отписка: {"ids": [id авторов]}."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return self.bulk_relation(request, subscriptions)
+
+    def delete(self, request):
+        return self.bulk_relation(request, subscriptions)
 
 
 class ShowSubscriptionsView(ListAPIView):
     """Отображение подписок."""
     permission_classes = [IsAuthenticated]
-    pagination_class = LimitPageNumberPagination
+    pagination_class = SubscriptionsPagination
 
     def get(self, request):
-        user = request.user
-        queryset = User.objects.filter(author__user=user)
+        limit = get_recipes_limit(request)
+        queryset = User.objects.filter(author__user=request.user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()))
         page = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.latest_by_author(
+            [author.id for author in page], limit)
+        for author in page:
+            author.latest_recipes = recipes[author.id]
         serializer = ShowSubscriptionsSerializer(
             page, many=True, context={'request': request})
-        return self.get_paginated_response(serializer.data)
+        return self.get_paginated_response(serializer_data(serializer))
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(SerializationTimingMixin, ConditionalGetMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Отображение тегов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: HttpResponse(
+                tag_cache.get('list', lambda: render_json(
+                    self.get_serializer(
+                        self.get_queryset(), many=True).data)),
+                content_type='application/json'),
+            tag_cache.version())
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: super(TagViewSet, self).retrieve(
+                request, *args, **kwargs),
+            tag_cache.version())
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(SerializationTimingMixin, ConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Отображение ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    search_fields = ['^name']
     pagination_class = None
     filter_backends = [IngredientFilter]
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(
+            IngredientFilter.search_param, '').strip().lower()
+        return self.conditional_response(
+            lambda: HttpResponse(
+                ingredient_cache.get(f'list:{name}', lambda: render_json(
+                    self.get_serializer(
+                        self.filter_queryset(self.get_queryset()),
+                        many=True).data)),
+                content_type='application/json'),
+            ingredient_cache.version(), name)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: super(IngredientViewSet, self).retrieve(
+                request, *args, **kwargs),
+            ingredient_cache.version())
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(SerializationTimingMixin, CachedRecipeResponseMixin,
+                    ConditionalGetMixin, RelationActionsMixin,
+                    viewsets.ModelViewSet):
     """
     Все действия с рецептами.
     все децствия с корзиной и избранными.
     """
-    queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrAdminOrReadOnly]
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    viewer_dependent = True
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(lambda: self.conditional_list(
+            request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(lambda: self.conditional_retrieve(
+            request, *args, **kwargs))
+
+    def conditional_list(self, request, *args, **kwargs):
+        # Только ETag по версиям из кэша: без запроса к таблице рецептов
+        # и с учётом удалений, которые Last-Modified не видит.
+        return self.conditional_response(
+            lambda: super(RecipeViewSet, self).list(
+                request, *args, **kwargs),
+            recipe_cache.version(), tag_cache.version(),
+            ingredient_cache.version())
+
+    def conditional_retrieve(self, request, *args, **kwargs):
+        last = get_object_or_404(
+            Recipe.objects.values_list('updated_at', flat=True),
+            pk=kwargs['pk'])
+        return self.conditional_response(
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs),
+            last, tag_cache.version(), ingredient_cache.version(),
+            last_modified=last)
+
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            # Теги и ингредиенты FastRecipeSerializer загружает сам.
+            queryset = Recipe.objects.select_related('author')
+        else:
+            queryset = Recipe.objects.with_related()
+        return queryset.with_user_flags(self.request.user)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
-            return RecipeSerializer
+            return FastRecipeSerializer
         return CreateRecipeSerializer
 
-    def post_method_actions(self, request, pk, serializers):
-        data = {'user': request.user.id, 'recipe': pk}
-        serializer = serializers(data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def delete_method_actions(self, request, pk, model):
-        get_object_or_404(model,
-                          user=request.user,
-                          recipe=get_object_or_404(Recipe, id=pk)).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
-
     @action(detail=True, methods=["POST"],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk):
-        return self.post_method_actions(
-            request=request, pk=pk, serializers=FavoriteSerializer)
+        return self.add_relation(
+            request, favorites, pk, ShowFavoriteSerializer)
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk):
-        return self.delete_method_actions(
-            request=request, pk=pk, model=Favorites)
+        return self.remove_relation(request, favorites, pk)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite/bulk',
+            permission_classes=[IsAuthenticated])
+    def bulk_favorite(self, request):
+        return self.bulk_relation(request, favorites)
 
     @action(detail=True, methods=["POST"],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk):
-        return self.post_method_actions(
-            request=request, pk=pk, serializers=ShoppingCartSerializer)
+        return self.add_relation(
+            request, shopping_cart, pk, ShowFavoriteSerializer)
 
     @shopping_cart.mapping.delete
     def delete_shoping_cart(self, request, pk):
-        return self.delete_method_actions(
-            request=request, pk=pk, model=ShoppingCart)
+        return self.remove_relation(request, shopping_cart, pk)
 
-    @staticmethod
-    def send_message(ingredients):
-        shopping_list = 'Купить в магазине:'
-        for ingredient in ingredients:
-            shopping_list += (
-                f"\n{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['amount']}")
-        file = 'shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="{file}.txt"'
-        return response
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart/bulk',
+            permission_classes=[IsAuthenticated])
+    def bulk_shopping_cart(self, request):
+        return self.bulk_relation(request, shopping_cart)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            feed_sources(request.user, self.get_queryset()), request, self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """
+        Рецепты с похожим набором ингредиентов. Параметры: limit,
+        metric (jaccard или cosine) и tags - только рецепты с этими тегами.
+        """
+        limit = request.query_params.get(
+            'limit', settings.SIMILARITY['LIMIT'])
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= settings.SIMILARITY['MAX_LIMIT']:
+            raise ValidationError({'limit': (
+                'Ожидается целое число от 1 до '
+                f'{settings.SIMILARITY["MAX_LIMIT"]}.')})
+        metric = request.query_params.get('metric', METRICS[0])
+        if metric not in METRICS:
+            raise ValidationError(
+                {'metric': 'Доступные метрики: ' + ', '.join(METRICS)})
+        slugs = request.query_params.getlist('tags')
+        tag_ids = [
+            tag_id for tag_id, tag in get_tags().items() if tag.slug in slugs]
+        if slugs and not tag_ids:
+            return Response([])
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        found = similar_recipes(pk, limit, metric, tag_ids)
+        if found is None:
+            raise Http404
+        recipes = Recipe.objects.in_bulk([recipe_id for recipe_id, _ in found])
+        serializer = ShowFavoriteSerializer(
+            [recipes[recipe_id] for recipe_id, _ in found
+             if recipe_id in recipes],
+            many=True, context={'request': request})
+        return Response(serializer_data(serializer))
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user).order_by(
-            'ingredient__name').values(
-            'ingredient__name',
-            'ingredient__measurement_unit').annotate(amount=Sum('amount'))
-        return self.send_message(ingredients)
+        file_type = request.query_params.get('type', 'txt')
+        if file_type not in shopping_list.FILE_TYPES:
+            return Response(
+                {'type': 'Доступные форматы: '
+                 + ', '.join(shopping_list.FILE_TYPES)},
+                status=status.HTTP_400_BAD_REQUEST)
+        etag = shopping_list.get_etag(request.user, file_type)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        render, content_type, response_class = (
+            shopping_list.FILE_TYPES[file_type])
+        response = response_class(
+            render(shopping_list.get_ingredients(request.user)),
+            content_type=content_type)
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_type}"')
+        return response
@@ -0,0 +1,114 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import (DatabaseError, InterfaceError, OperationalError,
+                       connections)
+
+DEFAULT_DB = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+_local = threading.local()
+_health = {}
+_health_lock = threading.Lock()
+
+
+def mark_down(alias):
+    """Реплика исключается из чтения на RETRY_AFTER секунд."""
+    with _health_lock:
+        _health[alias] = {
+            'down_until': time.monotonic() + settings.REPLICAS['RETRY_AFTER'],
+            'checked': 0,
+        }
+    connections[alias].close()
+
+
+def replica_usable(alias):
+    """
+    Проверка соединения не чаще раза в CHECK_INTERVAL секунд; постоянное
+    соединение (CONN_MAX_AGE) переиспользуется, сломанное закрывается.
+    """
+    now = time.monotonic()
+    with _health_lock:
+        state = _health.setdefault(alias, {'down_until': 0, 'checked': 0})
+        if now < state['down_until']:
+            return False
+        if now - state['checked'] < settings.REPLICAS['CHECK_INTERVAL']:
+            return True
+    connection = connections[alias]
+    try:
+        connection.ensure_connection()
+        usable = connection.is_usable()
+    except DatabaseError:
+        usable = False
+    if not usable:
+        mark_down(alias)
+        return False
+    with _health_lock:
+        state['checked'] = now
+    return True
+
+
+def choose_replica():
+    """Случайная работоспособная реплика или None."""
+    aliases = list(settings.REPLICAS['ALIASES'])
+    random.shuffle(aliases)
+    for alias in aliases:
+        if replica_usable(alias):
+            return alias
+    return None
+
+
+class ReplicaRouter:
+    """
+    Чтение в безопасных запросах - с реплики, выбранной
+    ReplicaMiddleware; всё остальное (запись, команды, фоновые задачи,
+    миграции) - с основной базы.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_local, 'alias', None) or DEFAULT_DB
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB
+
+
+class ReplicaMiddleware:
+    """
+    Выбирает реплику для GET/HEAD/OPTIONS. После успешного изменяющего
+    запроса клиент получает cookie, и его чтения PIN_SECONDS секунд идут
+    в основную базу (read-your-writes при отставании реплик).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.REPLICAS
+        alias = None
+        if (config['ALIASES'] and request.method in SAFE_METHODS
+                and config['COOKIE'] not in request.COOKIES):
+            alias = choose_replica()
+        _local.alias = alias
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.alias = None
+        if (config['ALIASES'] and request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            response.set_cookie(
+                config['COOKIE'], '1', max_age=config['PIN_SECONDS'],
+                httponly=True, samesite='Lax')
+        return response
+
+    def process_exception(self, request, exception):
+        alias = getattr(_local, 'alias', None)
+        if alias and isinstance(
+                exception, (InterfaceError, OperationalError)):
+            mark_down(alias)
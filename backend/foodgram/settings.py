@@ -39,6 +39,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'telemetry.middleware.TelemetryMiddleware',
+    'foodgram.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,8 +80,19 @@ if os.getenv('DB_ENGINE', None):
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
             'HOST': os.getenv('DB_HOST', default='db'),
             'PORT': os.getenv('DB_PORT', default='5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
         },
     }
+    # Реплики для чтения: DB_REPLICA_HOSTS=host1:5432,host2
+    for number, address in enumerate(filter(None, os.getenv(
+            'DB_REPLICA_HOSTS', default='').split(',')), start=1):
+        host, _, port = address.strip().partition(':')
+        DATABASES[f'replica_{number}'] = {
+            **DATABASES['default'],
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'TEST': {'MIRROR': 'default'},
+        }
 else:
     DATABASES = {
         'default': {
@@ -88,6 +101,58 @@ else:
     }
 
 
+DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+
+# PIN_SECONDS: сколько читать из основной базы после записи клиента.
+REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'PIN_SECONDS': int(os.getenv('DB_REPLICA_PIN_SECONDS', default=10)),
+    'CHECK_INTERVAL': 5,
+    'RETRY_AFTER': 30,
+    'COOKIE': 'read_primary',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    },
+}
+
+REFERENCE_CACHE = {
+    'ALIAS': 'default',
+    'LOCAL_SIZE': 1024,
+    'TIMEOUT': 60 * 60,
+}
+
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 5 * 60,
+}
+
+# ALIAS: общий кэш токенов (None - только кэш процесса). Используется,
+# только если бэкенд общий для воркеров (Redis, Memcached, база);
+# LocMemCache пропускается. Отозванный токен принимается другими
+# воркерами ещё до LOCAL_TIMEOUT секунд.
+AUTH_TOKEN_CACHE = {
+    'ALIAS': 'default',
+    'LOCAL_SIZE': 10000,
+    'LOCAL_TIMEOUT': 30,
+    'TIMEOUT': 5 * 60,
+}
+
+TELEMETRY = {
+    'SLOW_QUERY_MS': int(os.getenv('SLOW_QUERY_MS', default=200)),
+    # /metrics/ доступен с этих адресов или с заголовком
+    # Authorization: Bearer <METRICS_TOKEN>.
+    'METRICS_ALLOWED_IPS': os.getenv(
+        'METRICS_ALLOWED_IPS', default='127.0.0.1').split(','),
+    'METRICS_TOKEN': os.getenv('METRICS_TOKEN', default=''),
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME':
@@ -130,7 +195,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']}
 
@@ -154,3 +219,31 @@ EMAIL_FIELD_LENGTH = 254
 STRING_FIELD_LENGTH = 150
 NAME_SLUG_LENGTH = 200
 COLOR_FIELD_LENGTH = 7
+
+SHOPPING_LIST_CHUNK_SIZE = 2000
+INGREDIENT_SEARCH_LIMIT = 30
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_QUALITY = 80
+# Лента подписок: FANOUT_LIMIT - число подписчиков, после которого
+# рецепты автора не раздаются по лентам, а читаются при запросе.
+FEED = {
+    'MAX_LENGTH': 500,
+    'BATCH_SIZE': 1000,
+    'FANOUT_LIMIT': int(os.getenv('FEED_FANOUT_LIMIT', default=10000)),
+    'WORKERS': int(os.getenv('FEED_WORKERS', default=1)),
+}
+# Похожие рецепты: индекс в памяти процесса, при старте читается
+# из снимка SNAPSHOT_PATH (manage.py snapshot_similarity_index).
+SIMILARITY = {
+    'SNAPSHOT_PATH': os.getenv(
+        'SIMILARITY_SNAPSHOT_PATH',
+        default=os.path.join(BASE_DIR, 'similarity_index.npz')),
+    'MAX_SEGMENTS': 8,
+    'WATERMARK_LAG': 60,
+    'LIMIT': 6,
+    'MAX_LIMIT': 50,
+    'SQL_CANDIDATES': 500,
+}
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
@@ -1,15 +1,45 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
+from django.db.models import Prefetch
+from django.db.models.functions import Lower
 
+from api.pagination import EstimatedCountPaginator
+from api.search import search_recipes
+from recipes.images import schedule_recipe_image
 from recipes.models import (Favorites, Ingredient,
                             IngredientInRecipe,
                             Recipe, ShoppingCart,
-                            Tag)
+                            ShoppingListItem, Tag)
 
 
-class IngredientInRecipe(admin.TabularInline):
+class IngredientInRecipeInline(admin.TabularInline):
     model = IngredientInRecipe
     min_num = 1
+    autocomplete_fields = ('ingredient',)
+
+
+class PopularityFilter(admin.SimpleListFilter):
+    """Диапазоны счётчика избранного вместо перечня значений."""
+    title = 'Популярность'
+    parameter_name = 'popularity'
+    ranges = {
+        '0': (0, 0),
+        '1-9': (1, 9),
+        '10-99': (10, 99),
+        '100+': (100, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, key) for key in self.ranges]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        queryset = queryset.filter(favorites_count__gte=low)
+        if high is not None:
+            queryset = queryset.filter(favorites_count__lte=high)
+        return queryset
 
 
 @admin.register(Tag)
@@ -23,47 +53,88 @@ class TagAdmin(admin.ModelAdmin):
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'measurement_unit']
     search_fields = ['name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """lower(name) LIKE: работает триграммный индекс recipes.0005."""
+        search_term = search_term.strip().lower()
+        if not search_term:
+            return queryset, False
+        return queryset.annotate(lower_name=Lower('name')).filter(
+            lower_name__contains=search_term), False
+
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'favorites',
-                    'get_tags', 'get_ingredients')
-    list_filter = ['author', 'name', 'tags']
-    search_fields = ['name', 'author__username']
-    inlines = (IngredientInRecipe,)
+    list_display = ('id', 'name', 'author', 'favorites_count',
+                    'cart_count', 'get_tags', 'get_ingredients')
+    list_filter = ['tags', PopularityFilter]
+    search_fields = ['name', 'text']
+    autocomplete_fields = ('author',)
+    inlines = (IngredientInRecipeInline,)
+    exclude = ('image_thumbnail', 'image_card', 'image_full')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author').prefetch_related(
+            'tags',
+            Prefetch('ingredients', queryset=Ingredient.objects.only(
+                'name')))
+
+    def get_search_results(self, request, queryset, search_term):
+        """Полнотекстовый поиск по названию и описанию."""
+        if not search_term.strip():
+            return queryset, False
+        return search_recipes(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_recipe_image(obj)
+
+    def save_related(self, request, form, formsets, change):
+        """Изменение состава переносится в списки покупок целиком."""
+        amounts = ShoppingListItem.objects.recipes_amounts
+        recipe = form.instance
+        old_amounts = amounts([recipe.pk]) if change else {}
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.change_recipe(
+            recipe, old_amounts, amounts([recipe.pk]))
+
     def get_tags(self, obj):
-        list_ = [_.name for _ in obj.tags.all()]
-        return ', '.join(list_)
+        return ', '.join(tag.name for tag in obj.tags.all())
     get_tags.short_description = 'Теги'
 
-    def favorites(self, obj):
-        return obj.favorites.count()
-    favorites.short_description = 'Избранное'
-
     def get_ingredients(self, obj):
-      return ', '.join([
-          ingredients.name for ingredients
-          in obj.ingredients.all()])
+        return ', '.join(
+            ingredient.name for ingredient in obj.ingredients.all())
     get_ingredients.short_description = 'Ингридиенты'
 
 
-
-@admin.register(Favorites)
-class FavoritesAdmin(admin.ModelAdmin):
+class UserRecipeAdmin(admin.ModelAdmin):
+    """Избранное и корзина: поиск по точному email или имени."""
     list_display = ['id', 'user', 'recipe']
-    search_fields = ['user__username', 'user__email']
+    list_select_related = ('user', 'recipe')
+    search_fields = ['user__email__exact', 'user__username__exact']
+    autocomplete_fields = ('user', 'recipe')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
 
+@admin.register(Favorites)
+class FavoritesAdmin(UserRecipeAdmin):
+    pass
+
+
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'recipe']
-    search_fields = ['user__username', 'user__email']
-    empty_value_display = '-пусто-'
+class ShoppingCartAdmin(UserRecipeAdmin):
+    pass
 
 
 admin.site.unregister(Group)
@@ -0,0 +1,44 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorites, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+# (модель записей, модель со счётчиком, поле связи, поле счётчика)
+COUNTERS = (
+    (Favorites, Recipe, 'recipe_id', 'favorites_count'),
+    (ShoppingCart, Recipe, 'recipe_id', 'cart_count'),
+    (Recipe, User, 'author_id', 'recipes_count'),
+    (Subscription, User, 'author_id', 'followers_count'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарное изменение счётчика через F(); ниже нуля не опускается."""
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """Одинаковое изменение счётчика у нескольких объектов одним UPDATE."""
+    if not pks:
+        return
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def find_counter(source):
+    """(модель со счётчиком, поле связи, поле счётчика) для записей source."""
+    for counter_source, target, link, field in COUNTERS:
+        if counter_source is source:
+            return target, link, field
+    return None
+
+
+def actual_count(source, link):
+    """Подзапрос с фактическим числом записей для OuterRef('pk')."""
+    return Coalesce(Subquery(
+        source.objects.filter(**{link: OuterRef('pk')}).order_by().values(
+            link).annotate(total=Count('*')).values('total'),
+        output_field=IntegerField()), 0)
@@ -0,0 +1,152 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscription
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.FEED['WORKERS'],
+            thread_name_prefix='feed-fan-out')
+    return _executor
+
+
+def is_popular(followers_count):
+    """Рецепты таких авторов не раздаются, а читаются при запросе ленты."""
+    return followers_count > settings.FEED['FANOUT_LIMIT']
+
+
+def prune(user_ids):
+    """
+    Оставляет в лентах пользователей MAX_LENGTH последних записей.
+    Нумеруются записи только лент длиннее MAX_LENGTH.
+    """
+    limit = settings.FEED['MAX_LENGTH']
+    overflowing = FeedEntry.objects.filter(user_id__in=user_ids).values(
+        'user_id').annotate(entries=Count('id')).filter(
+        entries__gt=limit).values('user_id')
+    sql, params = FeedEntry.objects.filter(
+        user_id__in=overflowing).annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('pub_date').desc(), F('recipe_id').desc()],
+        )).values('id', 'row_number').order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FeedEntry._meta.db_table} WHERE id IN '
+            f'(SELECT id FROM ({sql}) AS ranked WHERE row_number > %s)',
+            (*params, limit))
+
+
+def fan_out(recipe_id):
+    """
+    Раздаёт рецепт подписчикам автора пачками по BATCH_SIZE; каждая
+    пачка - отдельная транзакция.
+    """
+    recipe = Recipe.objects.select_related('author').filter(
+        pk=recipe_id).first()
+    if recipe is None or is_popular(recipe.author.followers_count):
+        return
+    last = 0
+    while True:
+        followers = list(Subscription.objects.filter(
+            author_id=recipe.author_id, id__gt=last).order_by(
+            'id').values_list('id', 'user_id')[:settings.FEED['BATCH_SIZE']])
+        if not followers:
+            return
+        last = followers[-1][0]
+        user_ids = [user_id for _, user_id in followers]
+        with transaction.atomic():
+            FeedEntry.objects.bulk_create([
+                FeedEntry(
+                    user_id=user_id, recipe_id=recipe.pk,
+                    author_id=recipe.author_id, pub_date=recipe.pub_date)
+                for user_id in user_ids], ignore_conflicts=True)
+            prune(user_ids)
+
+
+def fan_out_in_worker(recipe_id):
+    try:
+        fan_out(recipe_id)
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s в ленты', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_fan_out(recipe):
+    """Раздача в фоне после фиксации транзакции с новым рецептом."""
+    if settings.FEED['WORKERS']:
+        transaction.on_commit(
+            lambda: get_executor().submit(fan_out_in_worker, recipe.pk))
+    else:
+        transaction.on_commit(lambda: fan_out(recipe.pk))
+
+
+def follow(user_id, author_ids):
+    """Добавляет в ленту последние рецепты новых авторов подписки."""
+    recipes = Recipe.objects.filter(
+        author_id__in=author_ids,
+        author__followers_count__lte=settings.FEED['FANOUT_LIMIT'],
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'author_id', 'pub_date')[:settings.FEED['MAX_LENGTH']]
+    entries = [
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                  pub_date=pub_date)
+        for recipe_id, author_id, pub_date in recipes]
+    if entries:
+        FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+        prune([user_id])
+
+
+def unfollow(user_id, author_ids):
+    FeedEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids).delete()
+
+
+class FeedEntries:
+    """
+    Источник ленты из записей FeedEntry: порядок и условие курсора
+    берутся по индексу (user, -pub_date, -recipe), рецепты queryset
+    загружаются по найденным id. fields - поля записи для полей рецепта.
+    """
+    fields = {'pub_date': 'pub_date', 'id': 'recipe_id'}
+
+    def __init__(self, user, queryset):
+        self.entries = FeedEntry.objects.filter(user=user).values_list(
+            'recipe_id', flat=True)
+        self.queryset = queryset
+        self.model = queryset.model
+
+    def recipes(self, recipe_ids):
+        """Рецепты в порядке recipe_ids."""
+        recipes = self.queryset.in_bulk(recipe_ids)
+        return [recipes[pk] for pk in recipe_ids if pk in recipes]
+
+
+def feed_sources(user, queryset):
+    """
+    Рецепты ленты пользователя: записи его ленты (FeedEntries) и,
+    отдельным источником, рецепты популярных авторов, на которых он
+    подписан. Источники упорядочены одинаково и сливаются при пагинации.
+    """
+    sources = [FeedEntries(user, queryset)]
+    popular = list(Subscription.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED['FANOUT_LIMIT'],
+    ).values_list('author_id', flat=True))
+    if popular:
+        sources.append(queryset.filter(author_id__in=popular))
+    return sources
@@ -0,0 +1,127 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'image_thumbnail': 320,
+    'image_card': 640,
+    'image_full': 1280,
+}
+
+# Копии изображения сохранены: рецепт обновлён без вызова save().
+images_processed = Signal()
+
+_executor = None
+
+
+def get_executor():
+    """
+    Пул потоков процесса. Очередь живёт только в памяти: задачи, не
+    выполненные до перезапуска, теряются, их подбирает команда
+    process_recipe_images.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images')
+    return _executor
+
+
+def render_variant(image, size):
+    """WebP без метаданных, вписанный в квадрат size x size."""
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    buffer = BytesIO()
+    variant.save(buffer, 'WEBP', quality=settings.RECIPE_IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def delete_files(storage, names):
+    for name in names:
+        if name:
+            storage.delete(name)
+
+
+def process_recipe_image(recipe_id):
+    """
+    Создаёт уменьшенные копии изображения рецепта. Если изображение
+    тем временем заменили, копии не сохраняются (или удаляются, если
+    замена пришлась на их запись); прежние копии удаляются.
+    """
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None or not recipe.image:
+            return False
+        with recipe.image.open('rb') as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info else 'RGB')
+        variants = {
+            field: render_variant(image, size)
+            for field, size in VARIANTS.items()}
+        current = Recipe.objects.filter(pk=recipe.pk, image=recipe.image.name)
+        if not current.exists():
+            return True
+        storage = recipe.image.storage
+        stale = [getattr(recipe, field).name for field in VARIANTS]
+        name = os.path.splitext(os.path.basename(recipe.image.name))[0]
+        for field, size in VARIANTS.items():
+            getattr(recipe, field).save(
+                f'{name}_{size}.webp', variants[field], save=False)
+        saved = [getattr(recipe, field).name for field in VARIANTS]
+        updated = current.update(
+            updated_at=timezone.now(), **dict(zip(VARIANTS, saved)))
+        if not updated:
+            delete_files(storage, saved)
+            return True
+        delete_files(storage, set(stale) - set(saved))
+        images_processed.send(sender=Recipe, recipe_id=recipe.pk)
+        return True
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+        return False
+
+
+def process_in_worker(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_recipe_image(recipe):
+    """
+    Сбрасывает устаревшие копии (файлы удаляются после фиксации) и
+    ставит изображение в обработку после фиксации транзакции.
+    Необработанные рецепты (пустая миниатюра) подбирает команда
+    process_recipe_images. Имена копий берутся из recipe, загруженного
+    из базы до изменения.
+    """
+    stale = [getattr(recipe, field).name for field in VARIANTS]
+    Recipe.objects.filter(pk=recipe.pk).update(
+        updated_at=timezone.now(), **{field: '' for field in VARIANTS})
+    for field in VARIANTS:
+        setattr(recipe, field, '')
+    storage = recipe.image.storage
+    transaction.on_commit(lambda: delete_files(storage, stale))
+    if settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(process_in_worker, recipe.pk))
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe.pk))
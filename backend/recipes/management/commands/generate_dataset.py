@@ -0,0 +1,187 @@
+import random
+from itertools import accumulate
+from time import monotonic
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+
+from api.cache import ingredient_cache, tag_cache
+from api.response_cache import recipe_response_cache
+from recipes.models import (Favorites, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.search import rebuild_index
+from users.models import Subscription, User
+
+PASSWORD = 'benchmark-password'
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F0C808', '#3D9BE9')
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса для выбора по закону Ципфа."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Generate a reproducible synthetic dataset: users, subscriptions, '
+            'recipes, favorites and shopping carts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--subscriptions', type=int, default=20,
+            help='Среднее число подписок пользователя.')
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Среднее число избранных рецептов пользователя.')
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в корзине пользователя.')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--tags-per-recipe', type=int, default=2)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель Ципфа: популярность авторов, рецептов '
+                 'и ингредиентов.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--prefix', default='bench',
+            help='Префикс имён и почт создаваемых пользователей.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        if User.objects.filter(
+                email__startswith=f'{options["prefix"]}-').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть, '
+                'укажите другой --prefix.')
+        start = monotonic()
+        with transaction.atomic():
+            tags = self.reference(Tag, self.make_tags)
+            ingredients = self.reference(Ingredient, self.make_ingredients)
+            users = self.create_users()
+            recipes = self.create_recipes(users, tags, ingredients)
+            self.create_links(
+                Subscription, users, users, options['subscriptions'],
+                'user_id', 'author_id', exclude_self=True)
+            self.create_links(
+                Favorites, users, recipes, options['favorites'],
+                'user_id', 'recipe_id')
+            self.create_links(
+                ShoppingCart, users, recipes, options['cart'],
+                'user_id', 'recipe_id')
+            call_command('rebuild_shopping_lists', stdout=self.stdout)
+            call_command('reconcile_counters', stdout=self.stdout)
+            call_command('rebuild_feeds', stdout=self.stdout)
+            rebuild_index()
+        ingredient_cache.bump()
+        tag_cache.bump()
+        recipe_response_cache.invalidate(
+            ['recipes', *[f'tag-recipes:{pk}' for pk in tags]])
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {monotonic() - start:.1f} с. '
+            f'Пароль пользователей: {PASSWORD}.'))
+
+    def bulk_create(self, model, objects):
+        # Django 2.2 не ограничивает batch_size пределами СУБД (SQLite).
+        batch_size = min(
+            self.options['batch_size'], connection.ops.bulk_batch_size(
+                model._meta.concrete_fields, objects) or len(objects) or 1)
+        model.objects.bulk_create(
+            objects, batch_size=batch_size, ignore_conflicts=True)
+
+    def reference(self, model, make):
+        """Справочник из базы; пустой заполняется синтетическими данными."""
+        if not model.objects.exists():
+            self.bulk_create(model, make())
+        return list(model.objects.order_by('id').values_list('id', flat=True))
+
+    @staticmethod
+    def make_tags():
+        return [
+            Tag(name=f'Тег {number}', slug=f'tag-{number}',
+                color=TAG_COLORS[number % len(TAG_COLORS)])
+            for number in range(1, 11)]
+
+    @staticmethod
+    def make_ingredients():
+        return [
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(1, 2001)]
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password(PASSWORD)
+        self.bulk_create(User, [
+            User(email=f'{prefix}-{number}@example.com',
+                 username=f'{prefix}_{number}', first_name='Имя',
+                 last_name='Фамилия', password=password)
+            for number in range(self.options['users'])])
+        users = list(User.objects.filter(
+            email__startswith=f'{prefix}-').order_by('id').values_list(
+            'id', flat=True))
+        self.report('Пользователи', len(users))
+        return users
+
+    def create_recipes(self, users, tags, ingredients):
+        options = self.options
+        author_weights = zipf_weights(len(users), options['skew'])
+        ingredient_weights = zipf_weights(len(ingredients), options['skew'])
+        authors = self.random.choices(
+            users, cum_weights=author_weights, k=options['recipes'])
+        self.bulk_create(Recipe, [
+            Recipe(author_id=author, name=f'Рецепт {number}',
+                   image='recipes/images/benchmark.png',
+                   text='Синтетический рецепт для нагрузочных тестов.',
+                   cooking_time=self.random.randint(5, 180))
+            for number, author in enumerate(authors)])
+        recipes = list(Recipe.objects.filter(
+            author_id__in=users).order_by('id').values_list('id', flat=True))
+        recipe_tags, recipe_ingredients = [], []
+        for recipe in recipes:
+            count = min(len(tags), max(1, round(self.random.gauss(
+                options['tags_per_recipe'], 1))))
+            recipe_tags += [
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for tag in self.random.sample(tags, count)]
+            count = min(len(ingredients), max(1, round(self.random.gauss(
+                options['ingredients_per_recipe'], 3))))
+            chosen = set(self.random.choices(
+                ingredients, cum_weights=ingredient_weights, k=count))
+            recipe_ingredients += [
+                IngredientInRecipe(
+                    recipe_id=recipe, ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500))
+                for ingredient in chosen]
+        self.bulk_create(Recipe.tags.through, recipe_tags)
+        self.bulk_create(IngredientInRecipe, recipe_ingredients)
+        self.report('Рецепты', len(recipes))
+        return recipes
+
+    def create_links(self, model, users, targets, mean, user_field,
+                     target_field, exclude_self=False):
+        """Связи пользователей с популярными чаще объектами."""
+        weights = zipf_weights(len(targets), self.options['skew'])
+        # Популярность не должна совпадать с порядком создания.
+        targets = self.random.sample(targets, len(targets))
+        links = []
+        for user in users:
+            count = min(len(targets), int(self.random.expovariate(1 / mean))
+                        if mean else 0)
+            chosen = set(self.random.choices(
+                targets, cum_weights=weights, k=count))
+            chosen.discard(user if exclude_self else None)
+            links += [
+                model(**{user_field: user, target_field: target})
+                for target in chosen]
+        self.bulk_create(model, links)
+        self.report(model._meta.verbose_name_plural, len(links))
+
+    def report(self, title, count):
+        self.stdout.write(f'{title}: {count}')
@@ -1,28 +1,107 @@
+import os
 from csv import reader
+from itertools import islice
+from time import monotonic
 
+from django.conf import settings
 from django.core.management import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
 
-from recipes.models import Ingredient, Tag
+from api.cache import ingredient_cache, tag_cache
+from api.similarity import similarity_cache
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            RecipeTag, ShoppingListItem, Tag)
+
+DATA_DIR = os.path.join(settings.BASE_DIR, 'recipes', 'data')
+
+
+def read_chunks(path, batch_size):
+    with open(path, 'r', encoding='UTF-8') as file:
+        rows = (row for row in reader(file, skipinitialspace=True) if row)
+        chunk = list(islice(rows, batch_size))
+        while chunk:
+            yield chunk
+            chunk = list(islice(rows, batch_size))
 
 
 class Command(BaseCommand):
-    help = 'Load ingredients data from csv-file to DB.'
-
-    def handle(self, *args, **kwargs):
-        with open(
-                'recipes/data/ingredients.csv', 'r',
-                encoding='UTF-8') as ingredients:
-            for row in reader(name, measurement_unit):
-                Ingredient.objects.get_or_create(
-                    name=name[0], measurement_unit=measurement_unit[1],
-                )
-        self.stdout.write(self.style.SUCCESS('Ингредиенты загружены.'))
-
-        with open(
-                'recipes/data/tags.csv', 'r',
-                encoding='UTF-8') as tags:
-            for row in reader(name, color, slug):
-                Tag.objects.get_or_create(
-                    name=name[0], color=color[1], slug=slug[2],
-                )
-        self.stdout.write(self.style.SUCCESS('Теги загружены.'))
+    help = 'Load ingredients and tags data from csv-files to DB.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(DATA_DIR, 'ingredients.csv'))
+        parser.add_argument(
+            '--tags',
+            default=os.path.join(DATA_DIR, 'tags.csv'))
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Прочитать файлы без записи в базу.')
+        parser.add_argument(
+            '--truncate', action='store_true',
+            help='Удалить ингредиенты и теги перед загрузкой '
+                 '(вместе с их связями с рецептами).')
+
+    def handle(self, *args, **options):
+        self.options = options
+        with transaction.atomic():
+            if options['truncate'] and not options['dry_run']:
+                self.truncate()
+            self.load(
+                'Ингредиенты', options['ingredients'], Ingredient,
+                self.ingredients)
+            self.load('Теги', options['tags'], Tag, self.tags)
+        if not options['dry_run']:
+            ingredient_cache.bump()
+            tag_cache.bump()
+
+    @staticmethod
+    def truncate():
+        """
+        Один DELETE на таблицу вместо каскада через ORM, который отправил
+        бы сигналы по каждой строке рецептов. Списки покупок пустеют
+        вместе с ингредиентами; updated_at рецептов обновляется одним
+        UPDATE, версия индекса похожих - после фиксации.
+        """
+        connection = connections[router.db_for_write(Ingredient)]
+        quote = connection.ops.quote_name
+        # Сначала таблицы со ссылками на ингредиенты и теги.
+        models = (IngredientInRecipe, ShoppingListItem, Recipe.tags.through,
+                  RecipeTag, Ingredient, Tag)
+        with connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(f'DELETE FROM {quote(model._meta.db_table)}')
+        Recipe.objects.update(updated_at=timezone.now())
+        transaction.on_commit(similarity_cache.bump)
+
+    @staticmethod
+    def ingredients(rows):
+        return [
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in rows]
+
+    @staticmethod
+    def tags(rows):
+        existing = set(Tag.objects.filter(
+            slug__in=[slug for _, _, slug in rows]).values_list(
+            'slug', flat=True))
+        return list({
+            slug: Tag(name=name, color=color, slug=slug)
+            for name, color, slug in rows if slug not in existing}.values())
+
+    def load(self, title, path, model, build):
+        start = monotonic()
+        before = model.objects.count()
+        total = 0
+        for rows in read_chunks(path, self.options['batch_size']):
+            total += len(rows)
+            if not self.options['dry_run']:
+                model.objects.bulk_create(
+                    build(rows), ignore_conflicts=True)
+        elapsed = monotonic() - start
+        created = model.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'{title}: прочитано {total}, добавлено {created} '
+            f'({total / elapsed if elapsed else total:.0f} строк/с).'))
@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Пул потоков recipes.images держит очередь в памяти процесса:
+    изображения, не обработанные до перезапуска или падения сервера,
+    остаются без копий. Команду стоит запускать после деплоя и по
+    расписанию.
+    """
+    help = ('Create image variants for recipes that have none, e.g. '
+            'those queued in memory before a server restart.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии для всех рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_thumbnail='')
+        processed = failed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            if process_recipe_image(recipe_id):
+                processed += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибками: {failed}.'))
@@ -0,0 +1,57 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify aggregated shopping lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сравнить списки с корзинами, ничего не меняя.')
+        parser.add_argument(
+            '--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['verify']:
+            self.verify(batch_size)
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            batch = []
+            for row in ShoppingListItem.objects.expected().iterator(
+                    chunk_size=batch_size):
+                batch.append(ShoppingListItem(
+                    user_id=row['recipe__shopping_cart__user'],
+                    ingredient_id=row['ingredient'],
+                    total_amount=row['total']))
+                if len(batch) >= batch_size:
+                    ShoppingListItem.objects.bulk_create(batch)
+                    batch = []
+            ShoppingListItem.objects.bulk_create(batch)
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок пересобраны: '
+            f'{ShoppingListItem.objects.count()} позиций.'))
+
+    def verify(self, batch_size):
+        actual = {
+            (user, ingredient): total
+            for user, ingredient, total
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount').iterator(
+                chunk_size=batch_size)}
+        mismatches = 0
+        for row in ShoppingListItem.objects.expected().iterator(
+                chunk_size=batch_size):
+            key = (row['recipe__shopping_cart__user'], row['ingredient'])
+            if actual.pop(key, None) != row['total']:
+                mismatches += 1
+        mismatches += len(actual)
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в списках покупок: {mismatches}.')
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок совпадают с корзинами.'))
@@ -0,0 +1,55 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max
+
+from recipes.counters import COUNTERS, actual_count
+
+
+class Command(BaseCommand):
+    help = ('Compare denormalized counters with the actual number of rows '
+            'and repair drift in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        drift = 0
+        for source, target, link, field in COUNTERS:
+            fixed = self.reconcile(
+                source, target, link, field, options['batch_size'],
+                options['dry_run'])
+            drift += fixed
+            self.stdout.write(
+                f'{target._meta.verbose_name_plural}.{field}: '
+                f'расхождений {fixed}')
+        style = self.style.WARNING if drift else self.style.SUCCESS
+        action = 'найдено' if options['dry_run'] else 'исправлено'
+        self.stdout.write(style(f'Всего {action} расхождений: {drift}.'))
+
+    @staticmethod
+    def reconcile(source, target, link, field, batch_size, dry_run):
+        """
+        Проходит объекты диапазонами id; каждая пачка исправляется в
+        своей транзакции, строки со счётчиком блокируются на её время.
+        """
+        last = target.objects.aggregate(last=Max('pk'))['last'] or 0
+        fixed = 0
+        for start in range(0, last + 1, batch_size):
+            with transaction.atomic():
+                batch = target.objects.filter(
+                    pk__gte=start, pk__lt=start + batch_size)
+                if not dry_run:
+                    batch = batch.select_for_update()
+                drifted = list(batch.annotate(
+                    actual=actual_count(source, link)).exclude(
+                    **{field: F('actual')}).only('pk', field))
+                fixed += len(drifted)
+                if dry_run or not drifted:
+                    continue
+                for obj in drifted:
+                    setattr(obj, field, obj.actual)
+                target.objects.bulk_update(drifted, [field])
+        return fixed
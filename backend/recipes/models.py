@@ -1,9 +1,11 @@
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import models, transaction
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Sum, UniqueConstraint, Value, Window)
+from django.db.models.functions import RowNumber
 
-from users.models import User
+from users.models import CountersMixin, Subscription, User
 
 
 class Tag(models.Model):
@@ -14,6 +16,7 @@ class Tag(models.Model):
     color = models.CharField(
         verbose_name='Цветовой HEX-код.',
         max_length=settings.COLOR_FIELD_LENGTH)
+    # SlugField создаёт индекс сам (db_index=True), отдельный не нужен.
     slug = models.SlugField(
         'Slug',
         max_length=settings.NAME_SLUG_LENGTH)
@@ -50,7 +53,60 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для отображения."""
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient')),
+            'tags')
+
+    def with_user_flags(self, user):
+        """
+        Отметки избранного, списка покупок и подписки на автора
+        одним запросом вместе с рецептами.
+        """
+        if not user.is_authenticated:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false)
+        return self.annotate(
+            is_favorited=Exists(Favorites.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'))))
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Последние limit рецептов каждого автора одним запросом
+        (ROW_NUMBER() OVER (PARTITION BY author)): {id автора: [рецепты]}.
+        """
+        recipes = {author_id: [] for author_id in author_ids}
+        queryset = self.filter(author_id__in=recipes)
+        if limit is None:
+            rows = queryset.order_by('author_id', '-pub_date', '-id')
+        else:
+            sql, params = queryset.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )).order_by().query.sql_with_params()
+            rows = self.model.objects.raw(
+                f'SELECT * FROM ({sql}) AS latest WHERE row_number <= %s '
+                'ORDER BY author_id, row_number', (*params, limit))
+        for recipe in rows:
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+
+class Recipe(CountersMixin, models.Model):
     """Модель рецептов."""
     author = models.ForeignKey(
         User,
@@ -63,6 +119,18 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение.',
         upload_to='recipes/images/')
+    image_thumbnail = models.ImageField(
+        verbose_name='Миниатюра.',
+        upload_to='recipes/images/variants/',
+        blank=True)
+    image_card = models.ImageField(
+        verbose_name='Изображение для карточки.',
+        upload_to='recipes/images/variants/',
+        blank=True)
+    image_full = models.ImageField(
+        verbose_name='Изображение для страницы рецепта.',
+        upload_to='recipes/images/variants/',
+        blank=True)
     text = models.TextField(
         verbose_name='Описание рецепта.')
     ingredients = models.ManyToManyField(
@@ -81,11 +149,33 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         'Время публикации.',
         auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Время изменения.',
+        auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False)
+    cart_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False)
+
+    counter_fields = ('favorites_count', 'cart_count')
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -111,6 +201,11 @@ class IngredientInRecipe(models.Model):
                 fields=['recipe', 'ingredient'],
                 name='unique_recipe_ingredient'),
         ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe', 'amount'],
+                name='ingredient_recipe_amount_idx'),
+        ]
 
 
 class FavoriteShoppingCartModel(models.Model):
@@ -170,3 +265,153 @@ class RecipeTag(models.Model):
                 fields=['recipe', 'tags'],
                 name='recipe_tag_unique'),
         ]
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """
+    Поддержка суммарного списка покупок в актуальном состоянии.
+    Корзины и удаление рецептов учитываются сигналами (api/signals.py).
+    Строки рецептов сигналами не отслеживаются: правка состава
+    (сериализатор, админка) вызывает change_recipe один раз на рецепт.
+    """
+
+    def apply(self, user_ids, amounts):
+        """
+        Изменяет количество ингредиентов у пользователей на amounts
+        ({id ингредиента: приращение}); пустые позиции удаляются.
+        """
+        amounts = {
+            ingredient: delta for ingredient, delta in amounts.items()
+            if delta}
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in=user_ids, ingredient_id__in=amounts)}
+            to_create, to_update, to_delete = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, delta in amounts.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is None:
+                        if delta > 0:
+                            to_create.append(self.model(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                total_amount=delta))
+                        continue
+                    item.total_amount += delta
+                    if item.total_amount > 0:
+                        to_update.append(item)
+                    else:
+                        to_delete.append(item.id)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ['total_amount'])
+            self.filter(id__in=to_delete).delete()
+
+    @staticmethod
+    def recipes_amounts(recipe_ids):
+        """Суммарное количество ингредиентов нескольких рецептов."""
+        return dict(IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values('ingredient_id').annotate(
+            total=Sum('amount')).order_by().values_list(
+            'ingredient_id', 'total'))
+
+    def add_recipes(self, user_id, recipe_ids):
+        self.apply([user_id], self.recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user_id, recipe_ids):
+        self.apply([user_id], {
+            ingredient: -amount for ingredient, amount
+            in self.recipes_amounts(recipe_ids).items()})
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в корзины с ним."""
+        self.apply(
+            ShoppingCart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True),
+            {ingredient: new_amounts.get(ingredient, 0)
+             - old_amounts.get(ingredient, 0)
+             for ingredient in {*old_amounts, *new_amounts}})
+
+    @staticmethod
+    def expected():
+        """Эталонный расчёт списков покупок по корзинам."""
+        return IngredientInRecipe.objects.filter(
+            recipe__shopping_cart__isnull=False).values(
+            'recipe__shopping_cart__user', 'ingredient').annotate(
+            total=Sum('amount')).order_by()
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент')
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Количество.')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total_amount}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт автора в ленте подписчика (раздача при публикации)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор')
+    pub_date = models.DateTimeField('Время публикации.')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
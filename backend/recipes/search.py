@@ -0,0 +1,57 @@
+from django.db import connections, router
+
+from recipes.models import Recipe
+
+# Конфигурация полнотекстового поиска PostgreSQL (миграция recipes.0009).
+SEARCH_CONFIG = 'russian'
+SEARCH_VECTOR = 'search_vector'
+# Теневая таблица FTS5 для SQLite: rowid совпадает с id рецепта.
+FTS_TABLE = 'recipes_recipe_fts'
+# Есть ли теневая таблица, по псевдонимам БД; сбрасывается после migrate.
+fts_tables = {}
+
+
+def fts_available(alias):
+    """Есть ли в SQLite теневая таблица поиска (нужен модуль FTS5)."""
+    if alias not in fts_tables:
+        connection = connections[alias]
+        fts_tables[alias] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names())
+    return fts_tables[alias]
+
+
+def index_recipe(recipe):
+    """
+    Обновляет запись рецепта в теневой таблице SQLite. В PostgreSQL
+    search_vector поддерживает триггер.
+    """
+    alias = recipe._state.db
+    if not fts_available(alias):
+        return
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [recipe.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            'VALUES (%s, %s, %s)', [recipe.pk, recipe.name, recipe.text])
+
+
+def unindex_recipe(recipe_id, alias):
+    if not fts_available(alias):
+        return
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [recipe_id])
+
+
+def rebuild_index():
+    """Перестраивает теневую таблицу после массовой загрузки рецептов."""
+    alias = router.db_for_write(Recipe)
+    if not fts_available(alias):
+        return
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            'SELECT id, name, text FROM recipes_recipe')
@@ -0,0 +1,45 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+LABELS = ('view', 'action')
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+requests_total = Counter(
+    'foodgram_requests_total', 'Запросы по обработчику и статусу.',
+    (*LABELS, 'status'))
+request_duration = Histogram(
+    'foodgram_request_duration_seconds', 'Время обработки запроса.',
+    LABELS, buckets=LATENCY_BUCKETS)
+db_queries = Histogram(
+    'foodgram_db_queries', 'Число SQL-запросов на запрос.',
+    LABELS, buckets=QUERY_BUCKETS)
+db_duration = Histogram(
+    'foodgram_db_duration_seconds', 'Время SQL-запросов на запрос.',
+    LABELS, buckets=LATENCY_BUCKETS)
+serializer_duration = Histogram(
+    'foodgram_serializer_duration_seconds', 'Время сериализации ответа.',
+    LABELS, buckets=LATENCY_BUCKETS)
+response_size = Histogram(
+    'foodgram_response_size_bytes', 'Размер тела ответа.',
+    LABELS, buckets=SIZE_BUCKETS)
+slow_queries_total = Counter(
+    'foodgram_slow_queries_total', 'SQL-запросы дольше порога.', LABELS)
+
+
+def render():
+    """
+    Метрики в текстовом формате Prometheus. Под gunicorn с
+    PROMETHEUS_MULTIPROC_DIR значения воркеров собираются из файлов.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
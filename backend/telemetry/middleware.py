@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import traceback
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+from telemetry import metrics
+
+logger = logging.getLogger('telemetry')
+_local = threading.local()
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_DIR = os.path.join('django', 'db', '')
+
+
+def call_site():
+    """
+    Ближайший к запросу кадр стека из кода проекта, а если запрос
+    выполнен библиотекой - ближайший кадр вне django.db.
+    """
+    fallback = None
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(PACKAGE_DIR) or DB_DIR in filename:
+            continue
+        if fallback is None:
+            fallback = frame
+        if (filename.startswith(settings.BASE_DIR)
+                and 'site-packages' not in filename):
+            return f'{frame.filename}:{frame.lineno} in {frame.name}'
+    if fallback is None:
+        return 'unknown'
+    return f'{fallback.filename}:{fallback.lineno} in {fallback.name}'
+
+
+class RequestRecorder:
+    """
+    Счётчики одного запроса: SQL через execute_wrapper и сериализация,
+    которую замеряют обработчики (telemetry.mixins).
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_duration = 0
+        self.slow_queries = 0
+        self.serializer_duration = 0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - start
+            self.queries += 1
+            self.db_duration += elapsed
+            if elapsed * 1000 >= settings.TELEMETRY['SLOW_QUERY_MS']:
+                self.slow_queries += 1
+                logger.warning(
+                    'Медленный SQL-запрос %.1f мс, %s: %s',
+                    elapsed * 1000, call_site(), sql)
+
+
+@contextmanager
+def serializing():
+    """
+    Замер сериализации текущего запроса: вложенные замеры внутри
+    внешнего не учитываются повторно.
+    """
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None or recorder.serializing:
+        yield
+        return
+    recorder.serializing = True
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        recorder.serializer_duration += perf_counter() - start
+        recorder.serializing = False
+
+
+def serializer_data(serializer):
+    """Свойство data сериализатора с замером времени."""
+    with serializing():
+        return serializer.data
+
+
+class TelemetryMiddleware:
+    """Метрики Prometheus по обработчику и действию запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = _local.recorder = RequestRecorder()
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _local.recorder = None
+        labels = self.labels(request)
+        metrics.request_duration.labels(*labels).observe(
+            perf_counter() - start)
+        metrics.requests_total.labels(*labels, response.status_code).inc()
+        metrics.db_queries.labels(*labels).observe(recorder.queries)
+        metrics.db_duration.labels(*labels).observe(recorder.db_duration)
+        if recorder.serializer_duration:
+            metrics.serializer_duration.labels(*labels).observe(
+                recorder.serializer_duration)
+        if recorder.slow_queries:
+            metrics.slow_queries_total.labels(*labels).inc(
+                recorder.slow_queries)
+        if not response.streaming:
+            metrics.response_size.labels(*labels).observe(
+                len(response.content))
+        return response
+
+    @staticmethod
+    def labels(request):
+        """
+        Имя маршрута и действие viewset (list, retrieve, favorite...)
+        или HTTP-метод; неразрешённые адреса сведены в одну метку.
+        """
+        method = request.method.lower()
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved', method
+        actions = getattr(match.func, 'actions', None) or {}
+        return match.view_name, actions.get(method, method)
@@ -0,0 +1,25 @@
+from telemetry.middleware import serializer_data
+
+
+class TimedSerializer:
+    """Обёртка сериализатора: data с замером, остальное без изменений."""
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    @property
+    def data(self):
+        return serializer_data(self.serializer)
+
+
+class SerializationTimingMixin:
+    """
+    Время сериализации ответа в метрике serializer_duration: замеряется
+    data сериализаторов из get_serializer.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return TimedSerializer(super().get_serializer(*args, **kwargs))
@@ -0,0 +1,23 @@
+from hmac import compare_digest
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from telemetry.metrics import render
+
+
+def metrics_allowed(request):
+    """Адрес из METRICS_ALLOWED_IPS или верный токен METRICS_TOKEN."""
+    if request.META.get('REMOTE_ADDR') in settings.TELEMETRY[
+            'METRICS_ALLOWED_IPS']:
+        return True
+    token = settings.TELEMETRY['METRICS_TOKEN']
+    return bool(token) and compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+def metrics(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    content, content_type = render()
+    return HttpResponse(content, content_type=content_type)
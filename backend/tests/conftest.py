@@ -0,0 +1,98 @@
+import pytest
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import token_user_cache
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def isolated(settings, tmp_path):
+    """Пустые кэши, медиа во временном каталоге, фоновые задачи inline."""
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.RECIPE_IMAGE_WORKERS = 0
+    settings.FEED = {**settings.FEED, 'WORKERS': 0}
+    settings.SIMILARITY = {**settings.SIMILARITY, 'SNAPSHOT_PATH': ''}
+    for cache in caches.all():
+        cache.clear()
+    token_user_cache._local.clear()
+    yield
+    for cache in caches.all():
+        cache.clear()
+    token_user_cache._local.clear()
+
+
+@pytest.fixture
+def make_user(db):
+    def make(username, **kwargs):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='password', first_name='Имя', last_name='Фамилия',
+            **kwargs)
+    return make
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user('user')
+
+
+@pytest.fixture
+def author(make_user):
+    return make_user('author')
+
+
+@pytest.fixture
+def tags(db):
+    return [
+        Tag.objects.create(
+            name=f'Тег {number}', color='#000000', slug=f'tag{number}')
+        for number in range(3)]
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г')
+        for number in range(10)]
+
+
+@pytest.fixture
+def make_recipe(author, tags, ingredients):
+    def make(name='Рецепт', author=author, tags=tags[:1],
+             ingredients=ingredients[:2], amount=10):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text='Текст', cooking_time=10,
+            image='recipes/images/recipe.png')
+        recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=recipe, ingredient=ingredient, amount=amount)
+            for ingredient in ingredients])
+        return recipe
+    return make
+
+
+def token_client(user):
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+@pytest.fixture
+def anon_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    return token_client(user)
+
+
+@pytest.fixture
+def author_client(author):
+    return token_client(author)
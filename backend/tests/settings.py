@@ -0,0 +1,10 @@
+from foodgram.settings import *  # noqa: F401, F403
+from foodgram.settings import DATABASES, REPLICAS
+
+# Реплика-зеркало основной базы для тестов маршрутизации; чтение на неё
+# включают сами тесты через REPLICAS['ALIASES'].
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'TEST': {'MIRROR': 'default'},
+}
+REPLICAS = {**REPLICAS, 'ALIASES': []}
@@ -0,0 +1,91 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Favorites, ShoppingCart
+from users.models import Subscription
+
+CHANGELISTS = (
+    'recipes/recipe', 'recipes/ingredient', 'recipes/tag',
+    'recipes/favorites', 'recipes/shoppingcart', 'users/user',
+    'users/subscription')
+
+
+@pytest.fixture
+def admin_client(client, make_user):
+    client.force_login(make_user('admin', is_staff=True, is_superuser=True))
+    return client
+
+
+def populate(make_user, make_recipe, start, count):
+    for number in range(start, start + count):
+        user = make_user(f'user{number}')
+        recipe = make_recipe(f'Рецепт {number}', author=user)
+        Favorites.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        if number:
+            Subscription.objects.create(
+                user=user, author_id=user.id - 1)
+
+
+def changelist_queries(admin_client, path):
+    with CaptureQueriesContext(connection) as context:
+        response = admin_client.get(f'/admin/{path}/')
+    assert response.status_code == 200
+    return len(context.captured_queries)
+
+
+@pytest.mark.parametrize('path', CHANGELISTS)
+def test_changelist_queries_do_not_grow(admin_client, make_user,
+                                        make_recipe, ingredients, path):
+    populate(make_user, make_recipe, 0, 2)
+    before = changelist_queries(admin_client, path)
+    populate(make_user, make_recipe, 2, 8)
+    assert changelist_queries(admin_client, path) == before
+
+
+def test_changelists_skip_full_count(admin_client, make_recipe):
+    make_recipe()
+    for path in CHANGELISTS:
+        if path == 'recipes/tag':
+            continue
+        response = admin_client.get(f'/admin/{path}/?q=zzz')
+        assert response.context['cl'].show_full_result_count is False
+
+
+def test_recipe_search_and_popularity_filter(admin_client, user,
+                                             make_recipe):
+    popular = make_recipe('Борщ украинский')
+    make_recipe('Щи')
+    Favorites.objects.create(user=user, recipe=popular)
+    response = admin_client.get('/admin/recipes/recipe/?q=борщ')
+    assert list(response.context['cl'].result_list) == [popular]
+    response = admin_client.get('/admin/recipes/recipe/?popularity=1-9')
+    assert list(response.context['cl'].result_list) == [popular]
+    response = admin_client.get('/admin/recipes/recipe/?popularity=0')
+    assert popular not in response.context['cl'].result_list
+
+
+def test_ingredient_search_by_substring(admin_client, ingredients):
+    # LOWER() в SQLite не меняет регистр кириллицы.
+    response = admin_client.get('/admin/recipes/ingredient/?q=НГРЕДИЕНТ 3')
+    assert list(response.context['cl'].result_list) == [ingredients[3]]
+
+
+def test_user_search_by_email_or_username_prefix(admin_client, user, author):
+    response = admin_client.get('/admin/users/user/?q=auth')
+    assert list(response.context['cl'].result_list) == [author]
+    response = admin_client.get('/admin/users/user/?q=user@example.com')
+    assert list(response.context['cl'].result_list) == [user]
+    response = admin_client.get('/admin/users/user/?q=example.com')
+    assert not response.context['cl'].result_list
+
+
+def test_recipe_form_uses_autocomplete(admin_client, make_user, make_recipe):
+    recipe = make_recipe()
+    make_user('somebody')
+    response = admin_client.get(f'/admin/recipes/recipe/{recipe.id}/change/')
+    assert response.status_code == 200
+    content = response.content.decode()
+    assert 'admin-autocomplete' in content
+    assert 'somebody' not in content
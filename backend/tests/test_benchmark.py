@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from recipes.models import Favorites, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+@pytest.fixture
+def dataset(make_recipe, make_user, user, author):
+    other = make_user('other')
+    make_recipe('Свой рецепт', author=user)
+    for number in range(3):
+        make_recipe(f'Рецепт {number}')
+        make_recipe(f'Чужой рецепт {number}', author=other)
+    Subscription.objects.create(user=user, author=author)
+    recipes = Recipe.objects.filter(author=author)
+    ShoppingCart.objects.create(user=user, recipe=recipes[0])
+    Favorites.objects.create(user=user, recipe=recipes[1])
+
+
+def run(tmp_path, *args):
+    output = tmp_path / 'benchmark.json'
+    call_command(
+        'benchmark', '--iterations', '2', '--warmup', '0',
+        '--output', str(output), *args)
+    return json.loads(output.read_text(encoding='UTF-8'))['results']
+
+
+def test_write_scenarios_are_permitted(dataset, make_user, tmp_path):
+    make_user('admin', is_staff=True)
+    results = run(
+        tmp_path, '--only', 'recipes_update', 'recipes_delete',
+        'recipes_create', 'favorite')
+    assert results['recipes_update']['status'] == 200
+    assert results['recipes_delete']['status'] == 204
+    assert results['recipes_create']['status'] == 201
+    assert results['favorite']['status'] == 201
+    # Изменения сценариев откатываются.
+    assert Recipe.objects.filter(name='Свой рецепт').exists()
+
+
+def test_all_scenarios_succeed(dataset, make_user, tmp_path):
+    make_user('admin', is_staff=True)
+    users = User.objects.count()
+    results = run(tmp_path)
+    assert all(200 <= result['status'] < 300 for result in results.values())
+    assert {
+        'unsubscribe', 'favorite_delete', 'shopping_cart_delete',
+        'users_create', 'token_login', 'token_logout', 'set_password',
+    } <= set(results)
+    # Временный пользователь сценариев входа удалён.
+    assert User.objects.count() == users
+
+
+def test_created_images_are_not_kept(dataset, settings, tmp_path):
+    media = tmp_path / 'media'
+    media.mkdir()
+    settings.MEDIA_ROOT = str(media)
+    run(tmp_path, '--only', 'recipes_create')
+    assert not any(media.iterdir())
+
+
+@pytest.mark.django_db
+def test_empty_database_is_reported(tmp_path, make_user):
+    user = make_user('lonely')
+    with pytest.raises(CommandError, match='generate_dataset'):
+        run(tmp_path)
+    with pytest.raises(CommandError, match='свой рецепт'):
+        run(tmp_path, '--user', user.email)
+
+
+def test_unknown_user_is_reported(dataset, tmp_path):
+    with pytest.raises(CommandError, match='nobody@example.com'):
+        run(tmp_path, '--user', 'nobody@example.com')
+
+
+def test_missing_admin_is_reported(dataset, tmp_path):
+    with pytest.raises(CommandError, match='createsuperuser'):
+        run(tmp_path, '--only', 'recipes_update')
+
+
+def test_error_status_is_not_recorded(dataset, user, tmp_path):
+    with pytest.raises(CommandError, match='403'):
+        run(tmp_path, '--only', 'recipes_update', '--admin', user.email)
@@ -0,0 +1,164 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.relations import RELATIONS
+from recipes.models import (FeedEntry, Favorites, Recipe, ShoppingCart,
+                            ShoppingListItem)
+from users.models import Subscription, User
+
+
+def recipe_counters(recipes):
+    return list(Recipe.objects.filter(
+        pk__in=[recipe.pk for recipe in recipes]).order_by('pk').values_list(
+        'favorites_count', 'cart_count'))
+
+
+def test_bulk_favorite_is_idempotent(user_client, user, make_recipe):
+    recipes = [make_recipe(f'Рецепт {number}') for number in range(3)]
+    ids = [recipe.id for recipe in recipes]
+    response = user_client.post(
+        '/api/recipes/favorite/bulk/', {'ids': ids[:2]}, format='json')
+    assert response.data == {'created': ids[:2], 'existing': []}
+    response = user_client.post(
+        '/api/recipes/favorite/bulk/', {'ids': ids}, format='json')
+    assert response.data == {'created': ids[2:], 'existing': ids[:2]}
+    assert recipe_counters(recipes) == [(1, 0)] * 3
+    response = user_client.delete(
+        '/api/recipes/favorite/bulk/', {'ids': ids[1:]}, format='json')
+    assert response.data == {'deleted': ids[1:]}
+    response = user_client.delete(
+        '/api/recipes/favorite/bulk/', {'ids': ids[1:]}, format='json')
+    assert response.data == {'deleted': []}
+    assert recipe_counters(recipes) == [(1, 0), (0, 0), (0, 0)]
+    assert list(Favorites.objects.values_list(
+        'recipe_id', flat=True)) == ids[:1]
+
+
+def test_bulk_writes_use_constant_queries(user_client, make_recipe):
+    small = [make_recipe(f'Рецепт {number}').id for number in range(2)]
+    large = [make_recipe(f'Суп {number}').id for number in range(10)]
+    # Первый запрос кэширует пользователя токена.
+    user_client.get('/api/users/me/')
+    counts = []
+    for ids in (small, large):
+        for method in ('post', 'delete'):
+            with CaptureQueriesContext(connection) as context:
+                getattr(user_client, method)(
+                    '/api/recipes/shopping_cart/bulk/', {'ids': ids},
+                    format='json')
+            counts.append(len(context.captured_queries))
+    assert counts[:2] == counts[2:]
+
+
+def test_bulk_cart_maintains_shopping_list(user_client, user, ingredients,
+                                           make_recipe):
+    first = make_recipe('Борщ', ingredients=ingredients[:2], amount=10)
+    second = make_recipe('Щи', ingredients=ingredients[1:3], amount=5)
+    user_client.post(
+        '/api/recipes/shopping_cart/bulk/',
+        {'ids': [first.id, second.id]}, format='json')
+    assert recipe_counters([first, second]) == [(0, 1), (0, 1)]
+    assert dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'total_amount')) == {
+        ingredients[0].id: 10, ingredients[1].id: 15, ingredients[2].id: 5}
+    user_client.delete(
+        '/api/recipes/shopping_cart/bulk/', {'ids': [first.id]},
+        format='json')
+    assert dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'total_amount')) == {
+        ingredients[1].id: 5, ingredients[2].id: 5}
+    assert list(ShoppingCart.objects.values_list(
+        'recipe_id', flat=True)) == [second.id]
+    assert recipe_counters([first, second]) == [(0, 0), (0, 1)]
+
+
+def test_bulk_subscriptions_update_feed_and_counters(
+        user_client, user, author, make_user, make_recipe):
+    other = make_user('other')
+    recipe = make_recipe('Борщ', author=author)
+    make_recipe('Щи', author=other)
+    ids = [author.id, other.id]
+    response = user_client.post(
+        '/api/users/subscriptions/bulk/', {'ids': ids}, format='json')
+    assert response.data['created'] == ids
+    assert set(User.objects.filter(pk__in=ids).values_list(
+        'followers_count', flat=True)) == {1}
+    assert FeedEntry.objects.filter(user=user).count() == 2
+    user_client.delete(
+        '/api/users/subscriptions/bulk/', {'ids': [other.id]},
+        format='json')
+    assert list(FeedEntry.objects.filter(user=user).values_list(
+        'recipe_id', flat=True)) == [recipe.id]
+    assert list(Subscription.objects.values_list(
+        'author_id', flat=True)) == [author.id]
+    other.refresh_from_db()
+    assert other.followers_count == 0
+
+
+def test_bulk_validation(user_client, user, make_recipe):
+    recipe = make_recipe()
+    response = user_client.post(
+        '/api/recipes/favorite/bulk/', {'ids': [recipe.id, 999]},
+        format='json')
+    assert response.status_code == 400
+    assert not Favorites.objects.exists()
+    response = user_client.post(
+        '/api/users/subscriptions/bulk/', {'ids': [user.id]}, format='json')
+    assert response.status_code == 400
+
+
+def test_bulk_delete_quotes_identifiers(user_client, user, make_recipe):
+    recipe = make_recipe()
+    user_client.post(
+        '/api/recipes/favorite/bulk/', {'ids': [recipe.id]}, format='json')
+    with CaptureQueriesContext(connection) as context:
+        user_client.delete(
+            '/api/recipes/favorite/bulk/', {'ids': [recipe.id]},
+            format='json')
+    deletes = [query['sql'] for query in context.captured_queries
+               if query['sql'].startswith('DELETE')]
+    assert deletes == [
+        'DELETE FROM "recipes_favorites" WHERE "user_id" = '
+        f'{user.id} AND "recipe_id" IN ({recipe.id})']
+
+
+def test_orm_and_bulk_paths_share_changed_hook(user, author, make_recipe,
+                                               monkeypatch):
+    recipe = make_recipe(author=author)
+    calls = []
+    for relation in RELATIONS:
+        monkeypatch.setattr(
+            relation, 'changed',
+            lambda user_id, ids, delta, model=relation.model: calls.append(
+                (model, user_id, ids, delta)))
+    Favorites.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+    Subscription.objects.create(user=user, author=author)
+    Subscription.objects.filter(user=user).delete()
+    assert calls == [
+        (Favorites, user.id, [recipe.id], 1),
+        (ShoppingCart, user.id, [recipe.id], 1),
+        (Subscription, user.id, [author.id], 1),
+        (Subscription, user.id, [author.id], -1)]
+
+
+def test_deleted_targets_skip_relation_updates(user, author, make_user,
+                                               make_recipe):
+    follower = make_user('follower')
+    recipe = make_recipe(author=author)
+    Favorites.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+    Subscription.objects.create(user=user, author=author)
+    Subscription.objects.create(user=follower, author=user)
+    with CaptureQueriesContext(connection) as context:
+        recipe.delete()
+    assert not any(
+        query['sql'].startswith('UPDATE "recipes_recipe"')
+        for query in context.captured_queries)
+    follower.delete()
+    user.refresh_from_db()
+    assert user.followers_count == 0
+    author.delete()
+    user.refresh_from_db()
+    assert not Subscription.objects.exists()
+    assert not ShoppingListItem.objects.exists()
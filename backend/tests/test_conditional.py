@@ -0,0 +1,71 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Favorites
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture
+def recipes(make_recipe):
+    return [make_recipe(f'Рецепт {number}') for number in range(4)]
+
+
+def revalidate(client, etag, url=URL, **params):
+    return client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+
+def test_list_answers_not_modified(recipes, anon_client):
+    response = anon_client.get(URL)
+    assert response.status_code == 200
+    assert 'Last-Modified' not in response
+    assert revalidate(anon_client, response['ETag']).status_code == 304
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deleting_older_recipe_changes_list_etag(recipes, anon_client):
+    etag = anon_client.get(URL)['ETag']
+    recipes[0].delete()
+    response = revalidate(anon_client, etag)
+    assert response.status_code == 200
+    assert len(response.json()['results']) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_author_change_changes_list_etag(recipes, author, anon_client):
+    etag = anon_client.get(URL)['ETag']
+    author.first_name = 'Другое'
+    author.save()
+    response = revalidate(anon_client, etag)
+    assert response.status_code == 200
+    assert response.json()['results'][0]['author']['first_name'] == 'Другое'
+
+
+def test_viewer_state_changes_list_etag(recipes, user, user_client):
+    etag = user_client.get(URL)['ETag']
+    assert revalidate(user_client, etag).status_code == 304
+    Favorites.objects.create(user=user, recipe=recipes[0])
+    assert revalidate(user_client, etag).status_code == 200
+
+
+@pytest.mark.parametrize('params', [{}, {'cursor': ''}])
+def test_list_does_not_aggregate_recipes(recipes, anon_client, params):
+    with CaptureQueriesContext(connection) as context:
+        anon_client.get(URL, params)
+    assert not [
+        query['sql'] for query in context.captured_queries
+        if 'MAX(' in query['sql'].upper()]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_detail_answers_not_modified(recipes, anon_client):
+    url = f'{URL}{recipes[0].id}/'
+    response = anon_client.get(url)
+    assert revalidate(anon_client, response['ETag'], url).status_code == 304
+    assert anon_client.get(
+        url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+    ).status_code == 304
+    recipes[0].name = 'Новое название'
+    recipes[0].save()
+    assert revalidate(anon_client, response['ETag'], url).status_code == 200
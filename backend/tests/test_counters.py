@@ -0,0 +1,107 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Favorites, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def counters(recipe):
+    recipe.refresh_from_db()
+    return recipe.favorites_count, recipe.cart_count
+
+
+def test_counters_follow_relations(user_client, user, author, make_recipe):
+    recipe = make_recipe()
+    user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    user_client.post(f'/api/users/{author.id}/subscribe/')
+    assert counters(recipe) == (1, 1)
+    author.refresh_from_db()
+    assert (author.recipes_count, author.followers_count) == (1, 1)
+    user_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+    user_client.delete(f'/api/users/{author.id}/subscribe/')
+    assert counters(recipe) == (0, 1)
+    author.refresh_from_db()
+    assert author.followers_count == 0
+
+
+def test_save_keeps_concurrent_counter_changes(user, author, make_recipe):
+    recipe = make_recipe()
+    stale_recipe = Recipe.objects.get(pk=recipe.pk)
+    stale_author = User.objects.get(pk=author.pk)
+    Favorites.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+    Subscription.objects.create(user=user, author=author)
+    stale_recipe.name = 'Щи'
+    stale_recipe.save()
+    stale_author.first_name = 'Автор'
+    stale_author.save()
+    assert counters(recipe) == (1, 1)
+    assert recipe.name == 'Щи'
+    author.refresh_from_db()
+    assert (author.first_name, author.followers_count) == ('Автор', 1)
+
+
+def test_recipe_update_does_not_write_counters(author_client, author,
+                                               ingredients, tags, make_recipe):
+    recipe = make_recipe()
+    author.is_staff = True
+    author.save()
+    with CaptureQueriesContext(connection) as context:
+        response = author_client.patch(
+            f'/api/recipes/{recipe.id}/', {
+                'name': 'Щи', 'cooking_time': 5, 'tags': [tags[0].id],
+                'ingredients': [{'id': ingredients[0].id, 'amount': 3}]},
+            format='json')
+    assert response.status_code == 200
+    updates = [
+        query['sql'] for query in context.captured_queries
+        if query['sql'].startswith('UPDATE "recipes_recipe"')]
+    assert updates
+    assert not any('favorites_count' in sql for sql in updates)
+
+
+def test_admin_change_does_not_write_counters(client, make_user,
+                                              make_recipe):
+    admin = make_user('admin', is_staff=True, is_superuser=True)
+    recipe = make_recipe()
+    Favorites.objects.create(user=admin, recipe=recipe)
+    rows = list(recipe.ingredientinrecipe_set.all())
+    prefix = 'ingredientinrecipe_set'
+    data = {
+        'author': recipe.author_id, 'name': 'Щи', 'text': 'Текст',
+        'cooking_time': 5, 'tags': [tag.id for tag in recipe.tags.all()],
+        f'{prefix}-TOTAL_FORMS': len(rows),
+        f'{prefix}-INITIAL_FORMS': len(rows),
+        f'{prefix}-MIN_NUM_FORMS': 1, f'{prefix}-MAX_NUM_FORMS': 1000,
+    }
+    for number, row in enumerate(rows):
+        data.update({
+            f'{prefix}-{number}-id': row.id,
+            f'{prefix}-{number}-recipe': recipe.id,
+            f'{prefix}-{number}-ingredient': row.ingredient_id,
+            f'{prefix}-{number}-amount': row.amount,
+        })
+    client.force_login(admin)
+    with CaptureQueriesContext(connection) as context:
+        response = client.post(
+            f'/admin/recipes/recipe/{recipe.id}/change/', data)
+    assert response.status_code == 302
+    updates = [
+        query['sql'] for query in context.captured_queries
+        if query['sql'].startswith('UPDATE "recipes_recipe"')]
+    assert updates
+    assert not any('favorites_count' in sql for sql in updates)
+    assert counters(recipe) == (1, 0)
+    assert recipe.name == 'Щи'
+
+
+def test_reconcile_counters_repairs_drift(user, make_recipe):
+    recipe = make_recipe()
+    Favorites.objects.create(user=user, recipe=recipe)
+    Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+    call_command('reconcile_counters', stdout=StringIO())
+    assert counters(recipe) == (1, 0)
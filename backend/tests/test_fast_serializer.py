@@ -0,0 +1,72 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import FastJSONRenderer
+from api.serializers import FastRecipeSerializer, RecipeSerializer
+from recipes.models import Favorites, Recipe, ShoppingCart
+from users.models import Subscription
+
+
+@pytest.fixture
+def recipes(make_recipe, make_user, user, author, tags, ingredients):
+    other = make_user('other')
+    recipes = [
+        make_recipe('Борщ', tags=tags, ingredients=ingredients[:4]),
+        make_recipe('Щи', author=other, tags=[], ingredients=ingredients[3:5],
+                    amount=1),
+        make_recipe('Каша "Дружба" \\ ёж', tags=tags[1:]),
+    ]
+    Recipe.objects.filter(pk=recipes[0].pk).update(
+        image_thumbnail='recipes/images/variants/thumbnail.webp')
+    Favorites.objects.create(user=user, recipe=recipes[0])
+    ShoppingCart.objects.create(user=user, recipe=recipes[1])
+    Subscription.objects.create(user=user, author=author)
+    return recipes
+
+
+def render(user, many):
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = user
+    context = {'request': request}
+    drf = Recipe.objects.with_related().with_user_flags(user).order_by(
+        '-pub_date', '-id')
+    fast = Recipe.objects.select_related('author').with_user_flags(
+        user).order_by('-pub_date', '-id')
+    if not many:
+        drf, fast = drf[0], fast[0]
+    return (
+        JSONRenderer().render(
+            RecipeSerializer(drf, many=many, context=context).data),
+        FastJSONRenderer().render(
+            FastRecipeSerializer(fast, many=many, context=context).data))
+
+
+@pytest.mark.parametrize('many', (True, False))
+def test_fast_serializer_matches_drf(recipes, user, many):
+    for viewer in (AnonymousUser(), user):
+        drf, fast = render(viewer, many)
+        assert fast == drf
+
+
+def test_benchmark_serializers_check(recipes, user):
+    stdout = StringIO()
+    call_command(
+        'benchmark_serializers', '--iterations', '1', '--user', user.email,
+        stdout=stdout)
+    assert 'совпадают' in stdout.getvalue()
+
+
+def test_api_uses_fast_path(user_client, recipes):
+    response = user_client.get('/api/recipes/')
+    # get_serializer оборачивает сериализатор для замера времени.
+    assert isinstance(
+        response.renderer_context['view'].get_serializer().serializer,
+        FastRecipeSerializer)
+    assert [recipe['id'] for recipe in response.data['results']] == [
+        recipe.id for recipe in reversed(recipes)]
@@ -0,0 +1,151 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.feed import prune
+from recipes.models import FeedEntry
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def feed_ids(client, **params):
+    response = client.get('/api/recipes/feed/', params)
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.data['results']]
+
+
+def entries(user):
+    return set(FeedEntry.objects.filter(user=user).values_list(
+        'recipe_id', flat=True))
+
+
+@pytest.fixture
+def follower(user, author):
+    Subscription.objects.create(user=user, author=author)
+    return user
+
+
+def test_new_recipe_is_fanned_out(follower, user_client, make_user,
+                                  make_recipe):
+    recipe = make_recipe('Борщ')
+    make_recipe('Чужой', author=make_user('other'))
+    assert entries(follower) == {recipe.id}
+    assert feed_ids(user_client) == [recipe.id]
+
+
+def test_follow_backfills_and_unfollow_clears(user, user_client, author,
+                                              make_recipe):
+    recipes = [make_recipe(f'Рецепт {number}') for number in range(3)]
+    assert feed_ids(user_client) == []
+    user_client.post(f'/api/users/{author.id}/subscribe/')
+    assert feed_ids(user_client) == [
+        recipe.id for recipe in reversed(recipes)]
+    user_client.delete(f'/api/users/{author.id}/subscribe/')
+    assert entries(user) == set()
+    assert feed_ids(user_client) == []
+
+
+def test_feed_is_pruned_to_max_length(settings, follower, make_recipe):
+    settings.FEED = {**settings.FEED, 'MAX_LENGTH': 2}
+    recipes = [make_recipe(f'Рецепт {number}') for number in range(4)]
+    assert entries(follower) == {recipe.id for recipe in recipes[2:]}
+
+
+def test_deleted_recipe_leaves_feed(follower, user_client, make_recipe):
+    recipe = make_recipe()
+    recipe.delete()
+    assert entries(follower) == set()
+    assert feed_ids(user_client) == []
+
+
+def test_popular_author_is_read_at_request(settings, follower, user_client,
+                                           make_user, make_recipe):
+    settings.FEED = {**settings.FEED, 'FANOUT_LIMIT': 1}
+    star = make_user('star')
+    for name in ('fan', None):
+        Subscription.objects.create(
+            user=make_user(name) if name else follower, author=star)
+    first = make_recipe('Первый')
+    popular = make_recipe('Популярный', author=star)
+    last = make_recipe('Последний')
+    # У star больше FANOUT_LIMIT подписчиков: его рецепты не раздаются.
+    assert entries(follower) == {first.id, last.id}
+    assert feed_ids(user_client) == [last.id, popular.id, first.id]
+
+
+def test_cursor_pages_cover_feed(follower, user_client, make_recipe):
+    recipes = [make_recipe(f'Рецепт {number}') for number in range(5)]
+    seen = []
+    url = '/api/recipes/feed/?limit=2'
+    while url:
+        response = user_client.get(url)
+        seen += [recipe['id'] for recipe in response.data['results']]
+        url = response.data['next']
+    assert seen == [recipe.id for recipe in reversed(recipes)]
+    assert response.data['count'] is None
+
+
+def test_rebuild_feeds(follower, make_recipe):
+    recipe = make_recipe()
+    FeedEntry.objects.all().delete()
+    call_command('rebuild_feeds', stdout=StringIO())
+    assert entries(follower) == {recipe.id}
+
+
+def test_feed_requires_authentication(anon_client):
+    assert anon_client.get('/api/recipes/feed/').status_code == 401
+
+
+def test_feed_is_ordered_by_entry_index(follower, user_client, make_recipe):
+    for number in range(3):
+        make_recipe(f'Рецепт {number}')
+    user_client.get('/api/recipes/feed/')
+    with CaptureQueriesContext(connection) as context:
+        user_client.get('/api/recipes/feed/?limit=2')
+    sql = next(
+        query['sql'] for query in context.captured_queries
+        if 'FROM "recipes_feedentry"' in query['sql'])
+    assert 'ORDER BY' in sql and 'LIMIT 3' in sql
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        plan = ' '.join(row[-1] for row in cursor.fetchall())
+    assert 'feed_user_pub_date_idx' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_prune_ranks_only_overflowing_feeds(settings, follower, make_user,
+                                            make_recipe):
+    settings.FEED = {**settings.FEED, 'MAX_LENGTH': 2}
+    recipes = [make_recipe(f'Рецепт {number}') for number in range(3)]
+    short = make_user('short')
+    FeedEntry.objects.create(
+        user=short, recipe=recipes[0], author=recipes[0].author,
+        pub_date=recipes[0].pub_date)
+    FeedEntry.objects.create(
+        user=follower, recipe=recipes[0], author=recipes[0].author,
+        pub_date=recipes[0].pub_date)
+    with CaptureQueriesContext(connection) as context:
+        prune([follower.id, short.id])
+    assert len(context) == 1
+    assert 'HAVING COUNT' in context.captured_queries[0]['sql']
+    assert entries(follower) == {recipe.id for recipe in recipes[1:]}
+    assert entries(short) == {recipes[0].id}
+
+
+def test_failed_rebuild_keeps_old_feeds(follower, make_user, make_recipe,
+                                        monkeypatch):
+    recipe = make_recipe()
+    Subscription.objects.create(user=make_user('second'), author=recipe.author)
+
+    def follow(user_id, author_ids):
+        raise RuntimeError
+
+    monkeypatch.setattr(
+        'recipes.management.commands.rebuild_feeds.follow', follow)
+    with pytest.raises(RuntimeError):
+        call_command('rebuild_feeds', stdout=StringIO())
+    assert entries(follower) == {recipe.id}
@@ -0,0 +1,89 @@
+import os
+from io import BytesIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+
+from recipes import images
+from recipes.models import Recipe
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+@pytest.fixture
+def recipe(make_recipe):
+    recipe = make_recipe()
+    recipe.image.save('recipe.png', png('#E26C2D'))
+    return recipe
+
+
+def media_files(settings):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), settings.MEDIA_ROOT)
+        for root, _, names in os.walk(settings.MEDIA_ROOT)
+        for name in names)
+
+
+def variants(recipe):
+    recipe.refresh_from_db()
+    return [getattr(recipe, field).name for field in images.VARIANTS]
+
+
+def test_variants_are_created(recipe, settings):
+    assert images.process_recipe_image(recipe.id)
+    names = variants(recipe)
+    assert all(name.endswith('.webp') for name in names)
+    assert media_files(settings) == sorted([recipe.image.name, *names])
+
+
+def test_reprocessing_removes_previous_variants(recipe, settings):
+    images.process_recipe_image(recipe.id)
+    images.process_recipe_image(recipe.id)
+    assert media_files(settings) == sorted(
+        [recipe.image.name, *variants(recipe)])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_new_image_removes_stale_variants(recipe, settings):
+    images.process_recipe_image(recipe.id)
+    recipe.refresh_from_db()
+    old_image = recipe.image.name
+    recipe.image.save('new.png', png('#2D9BE2'))
+    images.schedule_recipe_image(recipe)
+    names = variants(recipe)
+    assert all('new' in name for name in names)
+    assert media_files(settings) == sorted(
+        [old_image, recipe.image.name, *names])
+
+
+def test_replaced_image_is_not_processed(recipe, settings, monkeypatch):
+    render = images.render_variant
+
+    def replace_during_render(image, size):
+        Recipe.objects.filter(pk=recipe.pk).update(image='recipes/other.png')
+        return render(image, size)
+    monkeypatch.setattr(images, 'render_variant', replace_during_render)
+    image = recipe.image.name
+    images.process_recipe_image(recipe.id)
+    assert variants(recipe) == ['', '', '']
+    assert media_files(settings) == [image]
+
+
+def test_variants_saved_after_replacement_are_deleted(recipe, settings,
+                                                      monkeypatch):
+    save = FileSystemStorage.save
+
+    def save_and_replace(self, name, content, **kwargs):
+        Recipe.objects.filter(pk=recipe.pk).update(image='recipes/other.png')
+        return save(self, name, content, **kwargs)
+    monkeypatch.setattr(FileSystemStorage, 'save', save_and_replace)
+    image = recipe.image.name
+    images.process_recipe_image(recipe.id)
+    assert variants(recipe) == ['', '', '']
+    assert media_files(settings) == [image]
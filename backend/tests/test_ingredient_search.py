@@ -0,0 +1,59 @@
+import pytest
+
+from api.search import IngredientIndex
+from recipes.models import Ingredient
+
+NAMES = [
+    'Сахар', 'Сахарная пудра', 'Ванильный сахар', 'Тростниковый сахар',
+    'Соль', 'Морская соль', 'Сало', 'Масло сливочное',
+]
+
+
+@pytest.fixture
+def catalog(db):
+    Ingredient.objects.bulk_create([
+        Ingredient(name=name, measurement_unit='г') for name in NAMES])
+    Ingredient.objects.create(name='Фасоль', measurement_unit='г')
+
+
+def names(response):
+    return [item['name'] for item in response.json()]
+
+
+def test_prefix_matches_come_first(catalog, anon_client):
+    response = anon_client.get('/api/ingredients/', {'name': 'сах'})
+    assert names(response) == [
+        'Сахар', 'Сахарная пудра', 'Ванильный сахар', 'Тростниковый сахар']
+
+
+def test_contains_matches_need_three_characters(catalog, anon_client):
+    assert names(anon_client.get('/api/ingredients/', {'name': 'со'})) == [
+        'Соль']
+    assert names(anon_client.get('/api/ingredients/', {'name': 'соль'})) == [
+        'Соль', 'Морская соль', 'Фасоль']
+
+
+def test_new_ingredient_is_searchable(catalog, anon_client):
+    assert names(anon_client.get('/api/ingredients/', {'name': 'пудр'})) == [
+        'Сахарная пудра']
+    Ingredient.objects.create(name='Пудра какао', measurement_unit='г')
+    assert names(anon_client.get('/api/ingredients/', {'name': 'пудр'})) == [
+        'Пудра какао', 'Сахарная пудра']
+
+
+def test_search_respects_limit(catalog, settings, anon_client):
+    settings.INGREDIENT_SEARCH_LIMIT = 2
+    assert names(anon_client.get('/api/ingredients/', {'name': 'сахар'})) == [
+        'Сахар', 'Сахарная пудра']
+
+
+def test_contains_search_stops_at_limit(db):
+    Ingredient.objects.bulk_create([
+        Ingredient(name=f'{prefix} соль', measurement_unit='г')
+        for prefix in ('Морская', 'Нитритная', 'Пищевая', 'Гималайская')])
+    index = IngredientIndex()
+    found = index.search('соль', 2)
+    assert [
+        name for name, pk in index._keys if pk in found] == [
+        'гималайская соль', 'морская соль']
+    assert index.search('соль\nпищевая', 10) == []
@@ -0,0 +1,74 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
+
+
+@pytest.fixture
+def files(tmp_path):
+    ingredients = tmp_path / 'ingredients.csv'
+    ingredients.write_text(
+        'соль,г\nсахар,г\nсоль,г\n\n', encoding='UTF-8')
+    tags = tmp_path / 'tags.csv'
+    tags.write_text(
+        'Обед, #00008B, lunch\nУжин, #FF0000, dinner\n', encoding='UTF-8')
+    return ['--ingredients', str(ingredients), '--tags', str(tags)]
+
+
+def load(*args):
+    out = StringIO()
+    call_command('loading_ingredients', *args, stdout=out)
+    return out.getvalue()
+
+
+def catalog():
+    return (
+        sorted(Ingredient.objects.values_list('name', flat=True)),
+        sorted(Tag.objects.values_list('slug', flat=True)))
+
+
+@pytest.mark.django_db
+def test_dry_run_writes_nothing(files):
+    output = load(*files, '--dry-run')
+    assert 'прочитано 3, добавлено 0' in output
+    assert catalog() == ([], [])
+
+
+@pytest.mark.django_db
+def test_rerun_is_idempotent(files):
+    assert 'прочитано 3, добавлено 2' in load(*files)
+    assert 'прочитано 3, добавлено 0' in load(*files)
+    assert catalog() == (['сахар', 'соль'], ['dinner', 'lunch'])
+
+
+def test_truncate_replaces_catalog(files, make_recipe, ingredients, user):
+    recipes = [
+        make_recipe(f'Рецепт {number}', ingredients=ingredients[:size])
+        for number, size in enumerate((2, 8))]
+    ShoppingCart.objects.create(user=user, recipe=recipes[1])
+    with CaptureQueriesContext(connection) as context:
+        load(*files, '--truncate')
+    assert catalog() == (['сахар', 'соль'], ['dinner', 'lunch'])
+    assert not IngredientInRecipe.objects.exists()
+    assert not Recipe.tags.through.objects.exists()
+    assert not ShoppingListItem.objects.exists()
+    call_command('rebuild_shopping_lists', '--verify')
+    deletes = [query['sql'] for query in context.captured_queries
+               if query['sql'].startswith('DELETE')]
+    assert len(deletes) == 6
+
+
+def test_truncate_covers_every_reference():
+    """Новая ссылка на ингредиенты или теги требует правки truncate."""
+    references = {
+        field.related_model for model in (Ingredient, Tag)
+        for field in model._meta.get_fields(include_hidden=True)
+        if field.one_to_many}
+    assert references == {
+        IngredientInRecipe, ShoppingListItem, Recipe.tags.through,
+        RecipeTag}
@@ -0,0 +1,90 @@
+import json
+from base64 import b64encode
+
+import pytest
+
+from api.pagination import estimate_count
+from recipes.models import Recipe
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture
+def recipes(make_recipe):
+    return [make_recipe(f'Рецепт {number}') for number in range(7)]
+
+
+def page(client, url, params=None):
+    response = client.get(url, params)
+    assert response.status_code == 200
+    data = response.json()
+    return data, [recipe['id'] for recipe in data['results']]
+
+
+def encode(data):
+    return b64encode(json.dumps(data).encode()).decode()
+
+
+def test_cursor_round_trip(recipes, user_client):
+    expected = list(
+        Recipe.objects.order_by('-pub_date', '-id').values_list(
+            'id', flat=True))
+    data, ids = page(user_client, URL, {'cursor': '', 'limit': 3})
+    assert data['previous'] is None
+    seen = [ids]
+    while data['next']:
+        data, ids = page(user_client, data['next'])
+        seen.append(ids)
+    assert [len(ids) for ids in seen] == [3, 3, 1]
+    assert sum(seen, []) == expected
+    while data['previous']:
+        data, ids = page(user_client, data['previous'])
+        assert ids == seen.pop(-2)
+    assert ids == expected[:3]
+
+
+def test_cursor_link_drops_page_number(recipes, user_client):
+    data, _ = page(
+        user_client, URL, {'cursor': '', 'limit': 3, 'page': 2})
+    assert 'cursor=' in data['next']
+    assert 'page=' not in data['next']
+
+
+@pytest.mark.parametrize('mode, expected', [
+    (None, None), ('exact', 7), ('estimate', None)])
+def test_count_modes(recipes, user_client, mode, expected):
+    params = {'cursor': '', 'limit': 3}
+    if mode:
+        params['count'] = mode
+    data, _ = page(user_client, URL, params)
+    # На SQLite оценки по плану запроса нет.
+    assert data['count'] == expected
+
+
+@pytest.mark.django_db
+def test_estimate_count_only_on_postgresql():
+    assert estimate_count(Recipe.objects.all()) is None
+
+
+def test_cursor_without_count_skips_count_query(
+        recipes, user_client, django_assert_num_queries):
+    user_client.get('/api/tags/')
+    page(user_client, URL, {'cursor': '', 'limit': 3})
+    with django_assert_num_queries(4):
+        page(user_client, URL, {'cursor': '', 'limit': 3})
+    with django_assert_num_queries(5):
+        page(user_client, URL, {'cursor': '', 'limit': 3, 'count': 'exact'})
+
+
+@pytest.mark.parametrize('cursor', [
+    'не base64',
+    encode([1, 2]),
+    encode({'r': False}),
+    encode({'p': ['2020-01-01T00:00:00']}),
+    encode({'p': ['вчера', '1']}),
+    encode({'p': ['2020-01-01T00:00:00', 'один']}),
+])
+def test_malformed_cursor_returns_404(recipes, user_client, cursor):
+    response = user_client.get(URL, {'cursor': cursor})
+    assert response.status_code == 404
+    assert response.json()['detail'] == 'Неверный курсор.'
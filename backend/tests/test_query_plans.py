@@ -0,0 +1,65 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+
+from api.management.commands.check_query_plans import Command
+from recipes.models import Favorites, ShoppingCart, Tag
+from users.models import Subscription
+
+# Таблицы рецептов и их связей больше порога, справочники - меньше.
+MIN_ROWS = 20
+
+
+@pytest.fixture
+def dataset(make_recipe, make_user, user, author, tags, ingredients):
+    other = make_user('other')
+    recipes = [
+        make_recipe(f'Рецепт {number}', author=(author, other)[number % 2],
+                    tags=tags[:1 + number % 3],
+                    ingredients=ingredients[number % 5:number % 5 + 3])
+        for number in range(30)]
+    Subscription.objects.create(user=user, author=author)
+    Favorites.objects.create(user=user, recipe=recipes[0])
+    ShoppingCart.objects.create(user=user, recipe=recipes[1])
+    return recipes
+
+
+def test_read_endpoints_use_indexes(dataset, user):
+    call_command(
+        'check_query_plans', '--min-rows', str(MIN_ROWS),
+        '--user', user.email)
+
+
+def test_tag_slug_is_indexed(db):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, Tag._meta.db_table)
+    assert any(
+        constraint['index'] and constraint['columns'] == ['slug']
+        for constraint in constraints.values())
+
+
+def test_full_scan_and_sort_are_reported():
+    command = Command()
+    command.min_rows = MIN_ROWS
+    command.sizes = {'recipes_recipe': MIN_ROWS, 'recipes_tag': 3}
+    assert list(command.check_sqlite([
+        'SCAN recipes_recipe', 'USE TEMP B-TREE FOR ORDER BY',
+    ])) == [
+        'полный просмотр recipes_recipe',
+        'сортировка во временном B-дереве']
+    assert not list(command.check_sqlite([
+        'SCAN recipes_recipe USING INDEX recipes_pub_date_idx',
+        'SEARCH recipes_tag USING INTEGER PRIMARY KEY (rowid=?)',
+    ]))
+    assert not list(command.check_sqlite(
+        ['SCAN recipes_tag', 'USE TEMP B-TREE FOR ORDER BY']))
+
+
+def test_error_status_fails_check(dataset, user, monkeypatch):
+    monkeypatch.setattr(
+        Command, 'get_urls', staticmethod(lambda user: ['/api/missing/']))
+    with pytest.raises(CommandError, match='404'):
+        call_command(
+            'check_query_plans', '--min-rows', str(MIN_ROWS),
+            '--user', user.email)
@@ -0,0 +1,45 @@
+import pytest
+
+from recipes.models import Favorites, ShoppingCart
+from users.models import Subscription
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture
+def recipes(make_recipe, user, author):
+    recipes = [make_recipe(f'Рецепт {number}') for number in range(12)]
+    Favorites.objects.create(user=user, recipe=recipes[-1])
+    ShoppingCart.objects.create(user=user, recipe=recipes[-2])
+    Subscription.objects.create(user=user, author=author)
+    return recipes
+
+
+def list_queries(client, limit, django_assert_num_queries, expected):
+    with django_assert_num_queries(expected):
+        response = client.get(URL, {'limit': limit})
+    assert response.status_code == 200
+    assert len(response.json()['results']) == limit
+    return response
+
+
+@pytest.mark.parametrize('limit', [2, 6, 10])
+def test_anonymous_list_queries_do_not_depend_on_page_size(
+        anon_client, recipes, limit, django_assert_num_queries):
+    list_queries(anon_client, limit, django_assert_num_queries, 4)
+
+
+@pytest.mark.parametrize('limit', [2, 6, 10])
+def test_authenticated_list_queries_do_not_depend_on_page_size(
+        user_client, recipes, limit, django_assert_num_queries):
+    # Первый запрос прогревает кэш токенов.
+    user_client.get('/api/tags/')
+    response = list_queries(
+        user_client, limit, django_assert_num_queries, 5)
+    flags = {
+        recipe['id']: (recipe['is_favorited'], recipe['is_in_shopping_cart'],
+                       recipe['author']['is_subscribed'])
+        for recipe in response.json()['results']}
+    assert flags[recipes[-1].id][:2] == (True, False)
+    assert flags[recipes[-2].id][:2] == (False, True)
+    assert all(subscribed for _, _, subscribed in flags.values())
@@ -0,0 +1,88 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient, IngredientInRecipe
+
+TABLE = '"recipes_ingredientinrecipe"'
+
+
+@pytest.fixture
+def catalog(ingredients):
+    return ingredients + [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г')
+        for number in range(len(ingredients), 12)]
+
+
+def rows(recipe):
+    return {
+        item.ingredient_id: (item.id, item.amount)
+        for item in IngredientInRecipe.objects.filter(recipe=recipe)}
+
+
+def update(client, recipe, size, catalog):
+    """
+    Треть строк без изменений, треть с новым количеством, треть
+    удаляется, столько же добавляется.
+    """
+    third = size // 3
+    submitted = (
+        [{'id': item.id, 'amount': 10} for item in catalog[:third]]
+        + [{'id': item.id, 'amount': 20}
+           for item in catalog[third:2 * third]]
+        + [{'id': item.id, 'amount': 30}
+           for item in catalog[size:size + third]])
+    with CaptureQueriesContext(connection) as context:
+        response = client.patch(
+            f'/api/recipes/{recipe.id}/', {'ingredients': submitted},
+            format='json')
+    assert response.status_code == 200
+    return [query['sql'] for query in context.captured_queries]
+
+
+@pytest.fixture
+def staff_client(author, author_client):
+    author.is_staff = True
+    author.save()
+    return author_client
+
+
+@pytest.mark.parametrize('size', [3, 9])
+def test_update_touches_only_changed_rows(staff_client, make_recipe,
+                                          catalog, size):
+    third = size // 3
+    recipe = make_recipe(ingredients=catalog[:size], amount=10)
+    before = rows(recipe)
+    statements = update(staff_client, recipe, size, catalog)
+    after = rows(recipe)
+    assert set(after) == {
+        item.id for item
+        in catalog[:2 * third] + catalog[size:size + third]}
+    for item in catalog[:2 * third]:
+        assert after[item.id][0] == before[item.id][0]
+    assert [after[item.id][1] for item in catalog[:third]] == [10] * third
+    assert [
+        after[item.id][1] for item in catalog[third:2 * third]
+    ] == [20] * third
+    writes = [
+        sql.split(' ')[0] for sql in statements
+        if TABLE in sql.split(' WHERE ')[0]
+        and not sql.startswith('SELECT')]
+    assert writes == ['INSERT', 'UPDATE', 'DELETE']
+    updated = next(
+        sql for sql in statements if sql.startswith(f'UPDATE {TABLE}'))
+    assert updated.rsplit(' IN ', 1)[1] == '({})'.format(', '.join(
+        str(before[item.id][0]) for item in catalog[third:2 * third]))
+
+
+def test_update_statements_do_not_depend_on_size(staff_client, make_recipe,
+                                                 catalog):
+    # Первый запрос прогревает кэш токенов.
+    staff_client.get('/api/tags/')
+    counts = []
+    for size in (3, 9):
+        recipe = make_recipe(
+            f'Рецепт {size}', ingredients=catalog[:size], amount=10)
+        counts.append(len(update(staff_client, recipe, size, catalog)))
+    assert counts[0] == counts[1]
@@ -0,0 +1,73 @@
+import pytest
+
+from api.cache import ingredient_cache
+from api.management.commands.benchmark import image_data
+from recipes.models import Recipe
+from recipes.search import fts_available
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture
+def staff_client(author, author_client):
+    author.is_staff = True
+    author.save()
+    return author_client
+
+
+def payload(ingredients, tags, **fields):
+    return {
+        'name': 'Борщ', 'text': 'Текст', 'cooking_time': 10,
+        'image': image_data(),
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 5} for ingredient in ingredients],
+        'tags': [tag.id for tag in tags],
+        **fields}
+
+
+@pytest.mark.parametrize('size', [3, 9])
+def test_create_validates_in_constant_queries(
+        staff_client, ingredients, tags, size, django_assert_num_queries):
+    # Прогрев кэша токенов и проверки таблицы поиска; ингредиенты
+    # читаются из базы.
+    staff_client.get('/api/users/me/')
+    fts_available('default')
+    ingredient_cache.bump()
+    with django_assert_num_queries(16):
+        response = staff_client.post(
+            URL, payload(ingredients[:size], tags), format='json')
+    assert response.status_code == 201
+    recipe = Recipe.objects.get(pk=response.json()['id'])
+    assert recipe.ingredients.count() == size
+
+
+@pytest.mark.parametrize('size', [3, 9])
+def test_invalid_ids_are_checked_in_one_query(
+        staff_client, ingredients, tags, size, django_assert_num_queries):
+    staff_client.get('/api/users/me/')
+    ingredient_cache.bump()
+    submitted = ingredients[:size] + ingredients[:1]
+    with django_assert_num_queries(2):
+        response = staff_client.post(
+            URL, payload(submitted, tags), format='json')
+    assert response.status_code == 400
+
+
+def test_missing_and_duplicate_ids_are_reported_together(
+        staff_client, ingredients, tags):
+    data = payload(ingredients[:2], tags[:1])
+    data['ingredients'] += [
+        {'id': ingredients[0].id, 'amount': 1}, {'id': 998, 'amount': 1},
+        {'id': 999, 'amount': 1}]
+    data['tags'] += [tags[0].id, 997]
+    response = staff_client.post(URL, data, format='json')
+    assert response.status_code == 400
+    assert response.json() == {
+        'ingredients': [
+            'Все ингредиенты должны быть уникальными.',
+            'Ингредиенты не существуют: 998, 999.'],
+        'tags': [
+            'Значения должны быть уникальными.',
+            'Объекты не существуют: 997.'],
+    }
+    assert not Recipe.objects.exists()
@@ -0,0 +1,45 @@
+import warnings
+
+from django.core.cache import CacheKeyWarning
+
+from api.cache import get_tags, ingredient_cache, tag_cache
+from recipes.models import Ingredient
+
+
+def test_ingredient_search_key_is_safe_for_memcached(ingredients,
+                                                     anon_client):
+    name = 'сахар  \u0007' + 'x' * 300
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', CacheKeyWarning)
+        assert anon_client.get(
+            '/api/ingredients/', {'name': name}).status_code == 200
+        assert ingredient_cache.get(f'list:{name}', lambda: 1) == b'[]'
+
+
+def test_ingredient_list_is_invalidated_on_change(ingredients, anon_client):
+    before = anon_client.get('/api/ingredients/', {'name': 'ингр'}).json()
+    Ingredient.objects.create(name='Ингредиент новый', measurement_unit='г')
+    after = anon_client.get('/api/ingredients/', {'name': 'ингр'}).json()
+    assert len(after) == len(before) + 1
+
+
+def test_tags_are_invalidated_on_change(tags, anon_client):
+    version = tag_cache.version()
+    assert len(get_tags()) == 3
+    assert len(anon_client.get('/api/tags/').json()) == 3
+    tags[1].delete()
+    assert tag_cache.version() != version
+    assert len(get_tags()) == 2
+    assert len(anon_client.get('/api/tags/').json()) == 2
+
+
+def test_ingredient_detail_etag_changes_with_catalog(ingredients,
+                                                     anon_client):
+    url = f'/api/ingredients/{ingredients[0].id}/'
+    etag = anon_client.get(url)['ETag']
+    assert anon_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    ingredients[0].name = 'Переименованный'
+    ingredients[0].save()
+    response = anon_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json()['name'] == 'Переименованный'
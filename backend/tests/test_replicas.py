@@ -0,0 +1,100 @@
+import pytest
+from django.db import OperationalError, connections
+from django.test.utils import CaptureQueriesContext
+
+from foodgram import routers
+from foodgram.routers import ReplicaMiddleware, ReplicaRouter
+from recipes.models import Recipe
+from tests.conftest import token_client
+
+pytestmark = pytest.mark.django_db(
+    transaction=True, databases=['default', 'replica'])
+
+
+@pytest.fixture(autouse=True)
+def replica(settings):
+    settings.REPLICAS = {**settings.REPLICAS, 'ALIASES': ['replica']}
+    routers._health.clear()
+    yield 'replica'
+    routers._health.clear()
+
+
+def queries(client, method, url, **kwargs):
+    """Ответ и число запросов к основной базе и к реплике."""
+    with CaptureQueriesContext(connections['default']) as default:
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(client, method)(url, **kwargs)
+    return response, len(default), len(replica)
+
+
+def test_safe_methods_read_from_replica(user, make_recipe):
+    recipe = make_recipe()
+    client = token_client(user)
+    response = client.get('/api/recipes/')
+    assert [row['id'] for row in response.data['results']] == [recipe.id]
+    for method in ('get', 'head'):
+        response, default, replica = queries(client, method, '/api/recipes/')
+        assert response.status_code == 200
+        assert default == 0
+        assert replica > 0
+    assert routers._local.alias is None
+
+
+def test_write_pins_reads_to_primary(settings, user, make_recipe):
+    recipe = make_recipe()
+    client = token_client(user)
+    response, default, replica = queries(
+        client, 'post', f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 201
+    assert replica == 0
+    cookie = response.cookies[settings.REPLICAS['COOKIE']]
+    assert cookie['max-age'] == settings.REPLICAS['PIN_SECONDS']
+    assert cookie['httponly']
+    # Клиент прислал cookie: своё избранное читается из основной базы.
+    response, default, replica = queries(
+        client, 'get', '/api/recipes/?is_favorited=1')
+    assert [row['id'] for row in response.data['results']] == [recipe.id]
+    assert default > 0
+    assert replica == 0
+
+
+def test_failed_write_does_not_pin(settings, user):
+    client = token_client(user)
+    response, _, replica = queries(
+        client, 'post', '/api/recipes/999/favorite/')
+    assert response.status_code == 404
+    assert replica == 0
+    assert settings.REPLICAS['COOKIE'] not in response.cookies
+
+
+def test_unavailable_replica_falls_back_to_primary(user, make_recipe):
+    make_recipe()
+    routers.mark_down('replica')
+    response, default, replica = queries(
+        token_client(user), 'get', '/api/recipes/')
+    assert response.status_code == 200
+    assert default > 0
+    assert replica == 0
+
+
+def test_connection_error_marks_replica_down(rf):
+    middleware = ReplicaMiddleware(lambda request: None)
+    routers._local.alias = 'replica'
+    try:
+        middleware.process_exception(rf.get('/'), OperationalError())
+    finally:
+        routers._local.alias = None
+    assert not routers.replica_usable('replica')
+
+
+def test_router_sends_writes_and_migrations_to_primary():
+    router = ReplicaRouter()
+    routers._local.alias = 'replica'
+    try:
+        assert router.db_for_read(Recipe) == 'replica'
+        assert router.db_for_write(Recipe) == 'default'
+    finally:
+        routers._local.alias = None
+    assert router.db_for_read(Recipe) == 'default'
+    assert router.allow_migrate('default', 'recipes')
+    assert not router.allow_migrate('replica', 'recipes')
@@ -0,0 +1,92 @@
+import pytest
+
+from api.response_cache import recipe_response_cache
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def names(response):
+    return [recipe['name'] for recipe in response.json()['results']]
+
+
+def test_anonymous_list_is_cached(anon_client, make_recipe,
+                                  django_assert_num_queries):
+    make_recipe('Борщ')
+    assert names(anon_client.get('/api/recipes/')) == ['Борщ']
+    with django_assert_num_queries(0):
+        assert names(anon_client.get('/api/recipes/')) == ['Борщ']
+
+
+def test_new_recipe_invalidates_list(anon_client, make_recipe):
+    make_recipe('Борщ')
+    anon_client.get('/api/recipes/')
+    make_recipe('Щи')
+    assert names(anon_client.get('/api/recipes/')) == ['Щи', 'Борщ']
+
+
+def test_recipe_update_invalidates_detail_and_list(anon_client, make_recipe):
+    recipe = make_recipe('Борщ')
+    anon_client.get(f'/api/recipes/{recipe.id}/')
+    anon_client.get('/api/recipes/')
+    recipe.name = 'Щи'
+    recipe.save()
+    assert anon_client.get(
+        f'/api/recipes/{recipe.id}/').json()['name'] == 'Щи'
+    assert names(anon_client.get('/api/recipes/')) == ['Щи']
+
+
+def test_recipe_delete_invalidates_list(anon_client, make_recipe):
+    recipe = make_recipe('Борщ')
+    make_recipe('Щи')
+    anon_client.get('/api/recipes/')
+    recipe.delete()
+    assert names(anon_client.get('/api/recipes/')) == ['Щи']
+
+
+def test_author_update_invalidates_recipes(anon_client, author, make_recipe):
+    recipe = make_recipe('Борщ')
+    anon_client.get(f'/api/recipes/{recipe.id}/')
+    author.first_name = 'Автор'
+    author.save()
+    response = anon_client.get(f'/api/recipes/{recipe.id}/')
+    assert response.json()['author']['first_name'] == 'Автор'
+
+
+def test_tag_change_invalidates_tag_filtered_list(anon_client, tags,
+                                                  make_recipe):
+    make_recipe('Борщ', tags=tags[:1])
+    recipe = make_recipe('Щи', tags=tags[1:2])
+    url = f'/api/recipes/?tags={tags[0].slug}'
+    assert names(anon_client.get(url)) == ['Борщ']
+    recipe.tags.add(tags[0])
+    assert names(anon_client.get(url)) == ['Щи', 'Борщ']
+    tags[0].name = 'Суп'
+    tags[0].save()
+    response = anon_client.get(url)
+    assert response.json()['results'][0]['tags'][0]['name'] == 'Суп'
+
+
+def test_authenticated_requests_bypass_cache(anon_client, user_client,
+                                             user, make_recipe):
+    recipe = make_recipe('Борщ')
+    anon_client.get('/api/recipes/')
+    user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    response = user_client.get('/api/recipes/')
+    assert response.data['results'][0]['is_favorited'] is True
+    assert anon_client.get(
+        '/api/recipes/').json()['results'][0]['is_favorited'] is False
+
+
+def test_response_computed_during_invalidation_is_not_stored():
+    snapshot = recipe_response_cache.snapshot()
+    # Изменение зафиксировано, пока ответ вычислялся по старым данным.
+    recipe_response_cache.invalidate(['recipe:1'])
+    assert not recipe_response_cache.set(
+        'key', ['recipe:1'], snapshot, content='старый ответ')
+    assert recipe_response_cache.get('key') is None
+    snapshot = recipe_response_cache.snapshot()
+    assert recipe_response_cache.set(
+        'key', ['recipe:1'], snapshot, content='новый ответ')
+    assert recipe_response_cache.get('key')['content'] == 'новый ответ'
+    recipe_response_cache.invalidate(['recipe:1'])
+    assert recipe_response_cache.get('key') is None
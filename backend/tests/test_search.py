@@ -0,0 +1,105 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.search import fts5_query, parse_search, tsquery
+from recipes.models import Recipe
+from recipes.search import fts_available, fts_tables
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture
+def recipes(author):
+    return {
+        name: Recipe.objects.create(
+            author=author, name=name, text=text, cooking_time=10,
+            image='recipes/images/recipe.png')
+        for name, text in [
+            ('Красный борщ', 'Свёкла и капуста'),
+            ('Борщевик', 'Не едят'),
+            ('Суп', 'Почти красный борщ'),
+            ('Борщ красный', 'Наоборот'),
+            ('Окрошка', 'Квас'),
+        ]}
+
+
+def search(client, query, **params):
+    response = client.get(URL, {'search': query, **params})
+    assert response.status_code == 200
+    return [recipe['name'] for recipe in response.json()['results']]
+
+
+def test_parse_search_terms():
+    assert parse_search('"красный борщ" суп* -квас') == [
+        (['красный', 'борщ'], False), (['суп'], True), (['квас'], False)]
+    assert parse_search('" * - "*') == []
+    assert parse_search('"незакрытая фраза') == [
+        (['незакрытая', 'фраза'], False)]
+
+
+def test_postgresql_and_fts5_queries():
+    terms = [(['красный', 'борщ'], False), (['суп'], True)]
+    assert tsquery(terms) == '(красный <-> борщ) & (суп:*)'
+    assert fts5_query(terms) == '"красный борщ" AND "суп"*'
+
+
+@pytest.mark.django_db
+def test_fts_table_is_checked_once_per_alias():
+    fts_tables.clear()
+    with CaptureQueriesContext(connection) as first:
+        assert fts_available('default')
+    with CaptureQueriesContext(connection) as second:
+        assert fts_available('default')
+    assert len(first) == 1
+    assert len(second) == 0
+
+
+def test_prefix_search(recipes, anon_client):
+    names = search(anon_client, 'борщ')
+    assert set(names[:2]) == {'Красный борщ', 'Борщ красный'}
+    assert names[2:] == ['Суп']
+    assert set(search(anon_client, 'борщ*')) == {
+        'Красный борщ', 'Борщ красный', 'Борщевик', 'Суп'}
+
+
+def test_phrase_search(recipes, anon_client):
+    assert search(anon_client, '"красный борщ"') == [
+        'Красный борщ', 'Суп']
+
+
+def test_operator_characters_are_plain_text(recipes, anon_client):
+    assert search(anon_client, 'борщ -свёкла') == ['Красный борщ']
+    assert search(anon_client, 'борщ AND OR') == []
+    assert len(search(anon_client, '" * -')) == len(recipes)
+
+
+def test_name_matches_rank_above_text_matches(recipes, anon_client):
+    names = search(anon_client, 'красный')
+    assert names[-1] == 'Суп'
+    assert set(names) == {'Красный борщ', 'Борщ красный', 'Суп'}
+
+
+def test_search_without_fts_table(recipes, anon_client, monkeypatch):
+    monkeypatch.setitem(fts_tables, 'default', False)
+    assert set(search(anon_client, 'борщ')) == {'Красный борщ', 'Суп'}
+
+
+def test_cursor_keeps_relevance_order(recipes, anon_client):
+    response = anon_client.get(
+        URL, {'search': 'красный', 'cursor': '', 'limit': 2})
+    data = response.json()
+    assert [recipe['name'] for recipe in data['results']][0] != 'Суп'
+    assert 'page=2' in data['next']
+    response = anon_client.get(data['next'])
+    assert [
+        recipe['name'] for recipe in response.json()['results']] == ['Суп']
+
+
+def test_edited_recipe_is_reindexed(recipes, anon_client):
+    recipe = recipes['Окрошка']
+    recipe.name = 'Холодный борщ'
+    recipe.save()
+    recipes['Борщевик'].delete()
+    assert 'Холодный борщ' in search(anon_client, 'холодный')
+    assert search(anon_client, 'борщевик') == []
@@ -0,0 +1,164 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import IngredientInRecipe, ShoppingCart, ShoppingListItem
+
+
+def shopping_list(user):
+    return dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'total_amount'))
+
+
+def verify():
+    call_command('rebuild_shopping_lists', '--verify')
+
+
+@pytest.fixture
+def carted(make_recipe, ingredients, user, user_client):
+    first = make_recipe('Первый', ingredients=ingredients[:2], amount=10)
+    second = make_recipe('Второй', ingredients=ingredients[1:3], amount=5)
+    for recipe in (first, second):
+        response = user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        assert response.status_code == 201
+    return first, second
+
+
+def test_cart_endpoints_update_shopping_list(
+        carted, ingredients, user, user_client):
+    first, second = carted
+    assert shopping_list(user) == {
+        ingredients[0].id: 10, ingredients[1].id: 15, ingredients[2].id: 5}
+    user_client.delete(f'/api/recipes/{first.id}/shopping_cart/')
+    assert shopping_list(user) == {
+        ingredients[1].id: 5, ingredients[2].id: 5}
+    verify()
+
+
+def test_orm_recipe_delete_updates_shopping_list(
+        carted, ingredients, user):
+    carted[0].delete()
+    assert shopping_list(user) == {
+        ingredients[1].id: 5, ingredients[2].id: 5}
+    verify()
+
+
+def test_orm_cart_delete_updates_shopping_list(carted, ingredients, user):
+    ShoppingCart.objects.filter(user=user, recipe=carted[1]).delete()
+    assert shopping_list(user) == {
+        ingredients[0].id: 10, ingredients[1].id: 10}
+    verify()
+
+
+def test_orm_cart_create_updates_shopping_list(
+        make_recipe, ingredients, user):
+    recipe = make_recipe(ingredients=ingredients[:1], amount=3)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+    assert shopping_list(user) == {ingredients[0].id: 3}
+    verify()
+
+
+def admin_post(client, recipe, rows):
+    """
+    Форма рецепта в админке; rows - [(id строки, ингредиент, количество,
+    удалить)].
+    """
+    prefix = 'ingredientinrecipe_set'
+    data = {
+        'author': recipe.author_id, 'name': recipe.name, 'text': 'Текст',
+        'cooking_time': 5, 'tags': [tag.id for tag in recipe.tags.all()],
+        f'{prefix}-TOTAL_FORMS': len(rows),
+        f'{prefix}-INITIAL_FORMS': sum(1 for row in rows if row[0]),
+        f'{prefix}-MIN_NUM_FORMS': 1, f'{prefix}-MAX_NUM_FORMS': 1000,
+    }
+    for number, (pk, ingredient, amount, delete) in enumerate(rows):
+        data.update({
+            f'{prefix}-{number}-id': pk or '',
+            f'{prefix}-{number}-recipe': recipe.id,
+            f'{prefix}-{number}-ingredient': ingredient.id,
+            f'{prefix}-{number}-amount': amount,
+        })
+        if delete:
+            data[f'{prefix}-{number}-DELETE'] = 'on'
+    return client.post(f'/admin/recipes/recipe/{recipe.id}/change/', data)
+
+
+def test_admin_ingredient_changes_update_shopping_list(
+        carted, ingredients, user, client, make_user):
+    first, _ = carted
+    rows = {
+        item.ingredient_id: item.id
+        for item in IngredientInRecipe.objects.filter(recipe=first)}
+    client.force_login(make_user('admin', is_staff=True, is_superuser=True))
+    response = admin_post(client, first, [
+        (rows[ingredients[0].id], ingredients[0], 4, False),
+        (rows[ingredients[1].id], ingredients[1], 10, True),
+        (None, ingredients[5], 7, False)])
+    assert response.status_code == 302
+    assert shopping_list(user) == {
+        ingredients[0].id: 4, ingredients[1].id: 5, ingredients[2].id: 5,
+        ingredients[5].id: 7}
+    verify()
+
+
+def test_recipe_update_through_api(
+        carted, ingredients, user, author, author_client):
+    author.is_staff = True
+    author.save()
+    first, _ = carted
+    response = author_client.patch(f'/api/recipes/{first.id}/', {
+        'ingredients': [
+            {'id': ingredients[0].id, 'amount': 1},
+            {'id': ingredients[4].id, 'amount': 2}],
+    }, format='json')
+    assert response.status_code == 200
+    assert shopping_list(user) == {
+        ingredients[0].id: 1, ingredients[1].id: 5, ingredients[2].id: 5,
+        ingredients[4].id: 2}
+    verify()
+
+
+def test_recipe_delete_through_api(
+        carted, ingredients, user, author, author_client):
+    author.is_staff = True
+    author.save()
+    response = author_client.delete(f'/api/recipes/{carted[0].id}/')
+    assert response.status_code == 204
+    assert shopping_list(user) == {
+        ingredients[1].id: 5, ingredients[2].id: 5}
+    verify()
+
+
+def test_recipe_delete_queries_do_not_depend_on_rows(
+        make_recipe, make_user, ingredients):
+    buyers = [make_user(f'buyer{number}') for number in range(2)]
+    queries = []
+    for size in (2, 6):
+        recipe = make_recipe(f'Рецепт {size}', ingredients=ingredients[:size])
+        for buyer in buyers:
+            ShoppingCart.objects.create(user=buyer, recipe=recipe)
+        with CaptureQueriesContext(connection) as context:
+            recipe.delete()
+        queries.append(len(context))
+        for buyer in buyers:
+            assert shopping_list(buyer) == {}
+    assert queries[0] == queries[1]
+    verify()
+
+
+def test_verify_fails_on_drift(carted, user):
+    ShoppingListItem.objects.filter(user=user).update(total_amount=1)
+    with pytest.raises(CommandError):
+        verify()
+    call_command('rebuild_shopping_lists')
+    verify()
+
+
+def test_user_and_ingredient_delete_keep_lists_consistent(
+        carted, ingredients, user, author):
+    ingredients[1].delete()
+    verify()
+    user.delete()
+    verify()
+    assert not ShoppingListItem.objects.exists()
@@ -0,0 +1,76 @@
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from reportlab.pdfbase import pdfmetrics
+
+from api import shopping_list
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.fixture
+def carted(make_recipe, ingredients, user_client):
+    recipe = make_recipe(ingredients=ingredients[:2], amount=10)
+    response = user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    assert response.status_code == 201
+    return recipe
+
+
+def download(client, file_type, **headers):
+    return client.get(URL, {'type': file_type}, **headers)
+
+
+def test_txt_export(carted, ingredients, user_client):
+    response = download(user_client, 'txt')
+    assert response.status_code == 200
+    assert response.streaming
+    assert b''.join(response.streaming_content).decode() == (
+        'Купить в магазине:\n'
+        'Ингредиент 0 (г) - 10\n'
+        'Ингредиент 1 (г) - 10')
+
+
+def test_csv_export(carted, user_client):
+    response = download(user_client, 'csv')
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    assert b''.join(response.streaming_content).decode().splitlines() == [
+        'Ингредиент,Единица измерения,Количество',
+        'Ингредиент 0,г,10',
+        'Ингредиент 1,г,10']
+
+
+def test_pdf_export_embeds_cyrillic_font(carted, user_client):
+    response = download(user_client, 'pdf')
+    assert response.status_code == 200
+    assert not response.streaming
+    assert response['Content-Type'] == 'application/pdf'
+    assert response.content.startswith(b'%PDF')
+    assert b'DejaVuSans' in response.content
+
+
+def test_pdf_without_font_fails_loudly(settings, tmp_path, monkeypatch):
+    monkeypatch.setattr(pdfmetrics, 'getRegisteredFontNames', lambda: [])
+    settings.PDF_FONT_PATH = str(tmp_path / 'missing.ttf')
+    with pytest.raises(ImproperlyConfigured):
+        shopping_list.get_pdf_font()
+
+
+def test_unknown_type_is_rejected(carted, user_client):
+    assert download(user_client, 'docx').status_code == 400
+
+
+@pytest.mark.parametrize('file_type', ['txt', 'csv', 'pdf'])
+def test_unchanged_list_is_not_modified(carted, make_recipe, ingredients,
+                                        user_client, file_type):
+    etag = download(user_client, file_type)['ETag']
+    response = download(user_client, file_type, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    other = make_recipe('Другой', ingredients=ingredients[2:3])
+    user_client.post(f'/api/recipes/{other.id}/shopping_cart/')
+    response = download(user_client, file_type, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+def test_etag_depends_on_format(carted, user_client):
+    assert download(user_client, 'txt')['ETag'] != (
+        download(user_client, 'csv')['ETag'])
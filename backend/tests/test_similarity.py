@@ -0,0 +1,140 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api import similarity
+from recipes.models import Ingredient
+
+pytestmark = [
+    pytest.mark.django_db(transaction=True),
+    pytest.mark.skipif(
+        not similarity.index_available(), reason='нет NumPy/SciPy'),
+]
+
+
+@pytest.fixture(autouse=True)
+def index(monkeypatch):
+    index = similarity.SimilarityIndex()
+    monkeypatch.setattr(similarity, 'similarity_index', index)
+    return index
+
+
+@pytest.fixture
+def recipes(make_recipe, ingredients):
+    return {
+        'борщ': make_recipe('Борщ', ingredients=ingredients[:3]),
+        'щи': make_recipe('Щи', ingredients=ingredients[:3]),
+        'суп': make_recipe('Суп', ingredients=ingredients[:2]),
+        'каша': make_recipe('Каша', ingredients=ingredients[5:7]),
+    }
+
+
+def similar(index, recipe):
+    return [
+        (pk, round(score, 3)) for pk, score in index.similar(recipe.id, 10)]
+
+
+@pytest.fixture
+def bumps(monkeypatch):
+    calls = []
+    original = similarity.similarity_cache.bump
+    monkeypatch.setattr(
+        similarity.similarity_cache, 'bump',
+        lambda: calls.append(1) or original())
+    return calls
+
+
+def test_similar_endpoint(anon_client, recipes):
+    recipe = recipes['борщ']
+    response = anon_client.get(f'/api/recipes/{recipe.id}/similar/')
+    assert [row['id'] for row in response.json()] == [
+        recipes['щи'].id, recipes['суп'].id]
+    assert anon_client.get(
+        f'/api/recipes/{recipe.id}/similar/?limit=0').status_code == 400
+    assert anon_client.get(
+        f'/api/recipes/{recipe.id}/similar/?metric=x').status_code == 400
+    assert anon_client.get('/api/recipes/999/similar/').status_code == 404
+
+
+def test_index_matches_sql_fallback(index, recipes):
+    for recipe in recipes.values():
+        for metric in similarity.METRICS:
+            found = index.similar(recipe.id, 10, metric)
+            expected = similarity.similar_by_sql(recipe.id, 10, metric)
+            assert [pk for pk, _ in found] == [pk for pk, _ in expected]
+            assert [score for _, score in found] == pytest.approx(
+                [score for _, score in expected])
+
+
+def test_index_refreshes_after_recipe_changes(index, recipes, make_recipe,
+                                              ingredients):
+    recipe = recipes['борщ']
+    assert similar(index, recipe) == [
+        (recipes['щи'].id, 1.0), (recipes['суп'].id, 0.667)]
+    new = make_recipe('Новый', ingredients=ingredients[:3])
+    recipes['щи'].delete()
+    assert similar(index, recipe) == [
+        (new.id, 1.0), (recipes['суп'].id, 0.667)]
+
+
+def test_ingredient_deletion_touches_recipes_once(index, recipes, bumps,
+                                                  ingredients):
+    recipe = recipes['борщ']
+    similar(index, recipe)
+    with CaptureQueriesContext(connection) as context:
+        Ingredient.objects.filter(
+            pk__in=[ingredients[2].id, ingredients[6].id]).delete()
+    updates = [
+        query['sql'] for query in context.captured_queries
+        if query['sql'].startswith('UPDATE "recipes_recipe"')]
+    assert len(updates) == 1
+    assert len(bumps) == 1
+    # У борща и щей остались те же ингредиенты, что у супа.
+    assert similar(index, recipe) == [
+        (recipes['суп'].id, 1.0), (recipes['щи'].id, 1.0)]
+
+
+def test_deletions_in_one_transaction_touch_once(index, recipes, bumps,
+                                                 ingredients):
+    with CaptureQueriesContext(connection) as context:
+        with transaction.atomic():
+            ingredients[2].delete()
+            ingredients[6].delete()
+    assert sum(
+        query['sql'].startswith('UPDATE "recipes_recipe"')
+        for query in context.captured_queries) == 1
+    assert len(bumps) == 1
+    assert connection.ingredient_deletion is None
+
+
+def test_deletion_after_rollback_is_flushed(index, recipes, ingredients):
+    recipe = recipes['борщ']
+    similar(index, recipe)
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            ingredients[0].delete()
+            raise RuntimeError
+    ingredients[2].delete()
+    assert similar(index, recipe) == [
+        (recipes['суп'].id, 1.0), (recipes['щи'].id, 1.0)]
+
+
+def test_loading_ingredients_truncate(tmp_path, recipes, bumps):
+    ingredients = tmp_path / 'ingredients.csv'
+    ingredients.write_text('соль,г\nсахар,г\n', encoding='UTF-8')
+    tags = tmp_path / 'tags.csv'
+    tags.write_text('Обед, #00008B, lunch\n', encoding='UTF-8')
+    with CaptureQueriesContext(connection) as context:
+        call_command(
+            'loading_ingredients', '--truncate',
+            '--ingredients', str(ingredients), '--tags', str(tags),
+            stdout=StringIO())
+    assert sorted(Ingredient.objects.values_list('name', flat=True)) == [
+        'сахар', 'соль']
+    assert len(bumps) == 1
+    assert sum(
+        query['sql'].startswith('UPDATE "recipes_recipe"')
+        for query in context.captured_queries) == 1
@@ -0,0 +1,67 @@
+import pytest
+
+from users.models import Subscription
+
+URL = '/api/users/subscriptions/'
+
+
+@pytest.fixture
+def authors(make_user, make_recipe, user):
+    authors = [make_user(f'author{number}') for number in range(5)]
+    for number, author in enumerate(authors):
+        for index in range(number + 1):
+            make_recipe(f'Рецепт {number}.{index}', author=author)
+        Subscription.objects.create(user=user, author=author)
+    return authors
+
+
+@pytest.mark.parametrize('limit', [1, 3, 5])
+def test_subscriptions_queries_do_not_depend_on_page_size(
+        user_client, authors, limit, django_assert_num_queries):
+    # Первый запрос прогревает кэш токенов.
+    user_client.get('/api/tags/')
+    with django_assert_num_queries(3):
+        response = user_client.get(URL, {'limit': limit, 'recipes_limit': 2})
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert len(results) == limit
+    for author in results:
+        assert author['is_subscribed']
+        assert len(author['recipes']) == min(author['recipes_count'], 2)
+
+
+def test_recipes_limit_returns_latest_recipes(user_client, authors):
+    response = user_client.get(URL, {'recipes_limit': 2})
+    results = {author['username']: author for author in response.json()[
+        'results']}
+    latest = results['author4']
+    assert latest['recipes_count'] == 5
+    assert [recipe['name'] for recipe in latest['recipes']] == [
+        'Рецепт 4.4', 'Рецепт 4.3']
+
+
+def test_without_recipes_limit_returns_all_recipes(user_client, authors):
+    response = user_client.get(URL)
+    for author in response.json()['results']:
+        assert len(author['recipes']) == author['recipes_count']
+
+
+@pytest.mark.parametrize('limit', ['abc', '-1', '1.5'])
+def test_invalid_recipes_limit(user_client, authors, limit):
+    response = user_client.get(URL, {'recipes_limit': limit})
+    assert response.status_code == 400
+    assert 'recipes_limit' in response.json()
+
+
+def test_subscribe_respects_recipes_limit(user_client, make_user, make_recipe):
+    author = make_user('new_author')
+    for index in range(3):
+        make_recipe(f'Новый {index}', author=author)
+    response = user_client.post(
+        f'/api/users/{author.id}/subscribe/?recipes_limit=1')
+    assert response.status_code == 201
+    assert [recipe['name'] for recipe in response.json()['recipes']] == [
+        'Новый 2']
+    response = user_client.post(
+        f'/api/users/{author.id}/subscribe/?recipes_limit=x')
+    assert response.status_code == 400
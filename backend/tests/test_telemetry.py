@@ -0,0 +1,65 @@
+import pytest
+from prometheus_client import REGISTRY
+from rest_framework.serializers import BaseSerializer
+
+from api.serializers import FastRecipeSerializer
+
+
+def sample(name, view, action):
+    return REGISTRY.get_sample_value(
+        name, {'view': view, 'action': action}) or 0
+
+
+@pytest.mark.parametrize('url, labels', [
+    ('/api/recipes/', ('api:recipes-list', 'list')),
+    ('/api/users/subscriptions/', ('api:subscriptions', 'get')),
+])
+def test_serialization_is_timed(user_client, make_recipe, url, labels):
+    make_recipe()
+    before = sample('foodgram_serializer_duration_seconds_count', *labels)
+    user_client.get(url)
+    assert sample(
+        'foodgram_serializer_duration_seconds_count', *labels) == before + 1
+
+
+def test_serializer_classes_are_not_patched():
+    assert not hasattr(FastRecipeSerializer.data.fget, 'instrumented')
+    assert not hasattr(BaseSerializer.data.fget, 'instrumented')
+
+
+def test_request_metrics(user_client, make_recipe):
+    recipe = make_recipe()
+    labels = ('api:recipes-detail', 'retrieve')
+    requests = sample('foodgram_request_duration_seconds_count', *labels)
+    queries = sample('foodgram_db_queries_sum', *labels)
+    user_client.get(f'/api/recipes/{recipe.id}/')
+    assert sample(
+        'foodgram_request_duration_seconds_count', *labels) == requests + 1
+    assert sample('foodgram_db_queries_sum', *labels) > queries
+    assert REGISTRY.get_sample_value('foodgram_requests_total', {
+        'view': labels[0], 'action': labels[1], 'status': '200'}) >= 1
+
+
+def test_metrics_endpoint(client):
+    response = client.get('/metrics/')
+    assert response.status_code == 200
+    assert b'foodgram_requests_total' in response.content
+
+
+def test_metrics_are_hidden_from_other_addresses(client, settings):
+    settings.TELEMETRY = {**settings.TELEMETRY, 'METRICS_TOKEN': 'secret'}
+    remote = {'REMOTE_ADDR': '203.0.113.5'}
+    assert client.get('/metrics/', **remote).status_code == 403
+    assert client.get(
+        '/metrics/', HTTP_AUTHORIZATION='Bearer wrong',
+        **remote).status_code == 403
+    assert client.get(
+        '/metrics/', HTTP_AUTHORIZATION='Bearer secret',
+        **remote).status_code == 200
+
+
+def test_empty_token_does_not_open_metrics(client, settings):
+    settings.TELEMETRY = {**settings.TELEMETRY, 'METRICS_TOKEN': ''}
+    assert client.get(
+        '/metrics/', HTTP_AUTHORIZATION='Bearer ',
+        REMOTE_ADDR='203.0.113.5').status_code == 403
@@ -0,0 +1,85 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_user_cache
+from tests.conftest import token_client
+
+
+def auth_queries(client):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get('/api/users/me/')
+    assert response.status_code == 200
+    return sum(
+        'authtoken_token' in query['sql']
+        for query in context.captured_queries)
+
+
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    """Общий для процессов кэш: файлы во временном каталоге."""
+    settings.CACHES = {**settings.CACHES, 'tokens': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(tmp_path / 'tokens'),
+    }}
+    settings.AUTH_TOKEN_CACHE = {**settings.AUTH_TOKEN_CACHE,
+                                 'ALIAS': 'tokens'}
+    yield token_user_cache.backend
+    token_user_cache.backend.clear()
+
+
+def test_warm_cache_skips_token_query(user_client):
+    assert auth_queries(user_client) == 1
+    assert auth_queries(user_client) == 0
+
+
+def test_local_timeout_expires_entries(settings, user_client):
+    settings.AUTH_TOKEN_CACHE = {**settings.AUTH_TOKEN_CACHE,
+                                 'LOCAL_TIMEOUT': 0}
+    assert auth_queries(user_client) == 1
+    assert auth_queries(user_client) == 1
+
+
+def test_process_cache_is_not_shared_tier(settings):
+    assert settings.AUTH_TOKEN_CACHE['ALIAS'] == 'default'
+    assert token_user_cache.backend is None
+
+
+def test_shared_tier_serves_other_processes(shared_cache, user_client):
+    assert shared_cache is not None
+    auth_queries(user_client)
+    # Другой воркер: своего LRU нет, пользователь берётся из общего кэша.
+    token_user_cache._local.clear()
+    assert auth_queries(user_client) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_logout_revokes_shared_entry(shared_cache, user):
+    client = token_client(user)
+    auth_queries(client)
+    assert client.post('/api/auth/token/logout/').status_code == 204
+    assert client.get('/api/users/me/').status_code == 401
+    token_user_cache._local.clear()
+    assert client.get('/api/users/me/').status_code == 401
+
+
+@pytest.mark.django_db(transaction=True)
+def test_user_changes_revoke_cached_user(user):
+    client = token_client(user)
+    auth_queries(client)
+    user.is_active = False
+    user.save()
+    assert client.get('/api/users/me/').status_code == 401
+
+
+@pytest.mark.django_db(transaction=True)
+def test_password_change_refreshes_cached_user(user):
+    client = token_client(user)
+    auth_queries(client)
+    response = client.post('/api/users/set_password/', {
+        'current_password': 'password', 'new_password': 'Nov0e-parol'})
+    assert response.status_code == 204
+    key = Token.objects.get(user=user).key
+    assert token_user_cache.get(key) is None
+    assert auth_queries(client) == 1
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from api.pagination import EstimatedCountPaginator
 from users.models import Subscription, User
 
 
@@ -9,22 +10,29 @@ class UserAdmin(UserAdmin):
     list_display = ('username', 'email',
                     'first_name', 'last_name',
                     'get_recipes_count', 'get_followers_count')
-    list_filter = ('email', 'username')
-    search_fields = ('email', 'username')
+    list_filter = ('is_staff', 'is_active')
+    # Точный email и префикс имени: запросы идут по уникальным индексам.
+    search_fields = ('email__exact', 'username__startswith')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
     def get_recipes_count(self, obj):
-        return obj.Recipe.count()
+        return obj.recipes_count
     get_recipes_count.short_description = 'Рецепты'
 
     def get_followers_count(self, obj):
-        return obj.follower.count()
+        return obj.followers_count
     get_followers_count.short_description = 'Подписчики'
 
 
 @admin.register(Subscription)
 class SubscriptionsAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'author')
-    search_fields = ['author__username, author__email',
-                     'user__username', 'user__email']
+    list_select_related = ('user', 'author')
+    search_fields = ['author__username__exact', 'author__email__exact',
+                     'user__username__exact', 'user__email__exact']
+    autocomplete_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:54
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(model, link):
+    return Coalesce(Subquery(
+        model.objects.filter(**{link: OuterRef('pk')}).order_by().values(
+            link).annotate(total=Count('*')).values('total'),
+        output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    apps.get_model('users', 'User').objects.update(
+        recipes_count=count(apps.get_model('recipes', 'Recipe'), 'author'),
+        followers_count=count(apps.get_model('users', 'Subscription'),
+                              'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_hot_path_indexes'),
+        ('recipes', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчики'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецепты'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,31 @@ from django.db import models
 from django.db.models import F, Q, UniqueConstraint
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """
+    Поля counter_fields меняются только атомарным UPDATE (recipes.counters):
+    сохранение существующего объекта их не записывает, иначе save() с
+    прочитанными ранее значениями затёр бы изменения других запросов.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                # Как Django: отложенные поля не сохраняются.
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.attname for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred]
+            kwargs['update_fields'] = [
+                name for name in update_fields
+                if name not in self.counter_fields]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Модель пользователя."""
     first_name = models.CharField(
         'Имя',
@@ -24,6 +48,15 @@ class User(AbstractUser):
         'Почта',
         max_length=settings.EMAIL_FIELD_LENGTH,
         unique=True)
+    recipes_count = models.PositiveIntegerField(
+        'Рецепты',
+        default=0,
+        editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Подписчики',
+        default=0,
+        editable=False)
+    counter_fields = ('recipes_count', 'followers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'username']
 
@@ -61,6 +94,11 @@ class Subscription(models.Model):
             models.CheckConstraint(
                 check=~Q(user=F('author')),
                 name='no_self_follow')]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscription_author_user_idx'),
+        ]
         ordering = ('author_id',)
 
     def __str__(self):